@@ -0,0 +1,218 @@
+"""
+Battle engine benchmarks.
+
+Times Battle on fleets built from config/Ships_Config.json at several fleet
+sizes and weapon mixes, with a breakdown of the time spent attacking,
+repairing and pruning, and writes the results to JSON:
+
+    python benchmarks/bench_battle.py --output before.json
+    python benchmarks/bench_battle.py --output after.json --compare before.json
+
+The config only has plain autocannon ships so logistics, ECM, area of
+effect and slow firing variants are added to the library here.
+"""
+
+import argparse
+import copy
+import json
+from os.path import dirname, join
+import platform
+import sys
+import time
+
+sys.path.insert(0, join(dirname(__file__), ".."))
+
+from idleiss import battle
+from idleiss.battle import Battle
+from idleiss.battle_profile import BattleProfiler
+from idleiss.ship import ShipLibrary
+
+SHIPS_CONFIG = join(dirname(__file__), "..", "config", "Ships_Config.json")
+
+SIZES = (10, 100, 1000, 10000)
+
+# fraction of the attacking fleet per ship type, the defender is the
+# DEFENDERS mix of the same size
+MIXES = {
+    "brawler": {
+        "Standard Fighter": 0.4,
+        "Standard Frigate": 0.3,
+        "Standard Destroyer": 0.2,
+        "Standard Cruiser": 0.1,
+    },
+    "logi": {
+        "Logistics Frigate": 0.5,
+        "Standard Frigate": 0.3,
+        "Standard Cruiser": 0.2,
+    },
+    "ecm": {
+        "ECM Cruiser": 0.4,
+        "Standard Frigate": 0.4,
+        "Standard Destroyer": 0.2,
+    },
+    "aoe": {
+        "Flak Destroyer": 0.3,
+        "Standard Fighter": 0.4,
+        "Standard Frigate": 0.3,
+    },
+    "cycle": {
+        "Artillery Cruiser": 0.4,
+        "Standard Frigate": 0.4,
+        "Standard Fighter": 0.2,
+    },
+    "siege": {
+        "Siege Battery": 0.8,
+        "Standard Battleship": 0.2,
+    },
+    # one ship type a side, the only mix the lanchester engine solves
+    # instead of falling back
+    "duel": {
+        "Standard Cruiser": 1.0,
+    },
+}
+
+# defending mix of each attacking mix, "brawler" when not listed
+DEFENDERS = {
+    "duel": "duel",
+}
+
+# phases timed by the BattleProfiler of every case, the per shot
+# ship_attack and grab_debuffs timers of the python engine would cost more
+# than they tell here
+PHASES = ("fleet_attack", "repair_fleet", "prune_fleet", "apply_attack")
+
+
+def _variant(raw_ships, base, hullclass, **changes):
+    ship = copy.deepcopy(raw_ships[base])
+    ship["hullclass"] = hullclass
+    ship.update(changes)
+    return ship
+
+
+def build_library(filename=SHIPS_CONFIG):
+    """
+    The ship library from filename with the benchmark variants added.
+    """
+
+    with open(filename) as fd:
+        raw_data = json.load(fd)
+    ships = raw_data["ships"]
+    autocannon = ships["Standard Frigate"]["weapons"][0]
+    ships["Logistics Frigate"] = _variant(ships, "Standard Frigate", "logistic frigate",
+        buffs={"remote_shield_repair": 20, "remote_armor_repair": 20})
+    ecm = dict(autocannon, weapon_name="ECM Burst", firepower=0,
+        debuffs={"ECM": 20})
+    ships["ECM Cruiser"] = _variant(ships, "Standard Cruiser", "ecm cruiser",
+        weapons=ships["Standard Cruiser"]["weapons"] + [ecm])
+    flak = dict(autocannon, weapon_name="Flak Cannon", firepower=40,
+        area_of_effect=5)
+    ships["Flak Destroyer"] = _variant(ships, "Standard Destroyer", "midrange destroyer",
+        weapons=[flak])
+    artillery = [
+        dict(autocannon, weapon_name="280mm Artillery", firepower=400, cycle_time=2),
+        dict(autocannon, weapon_name="720mm Artillery", firepower=900, cycle_time=3),
+    ]
+    ships["Artillery Cruiser"] = _variant(ships, "Standard Cruiser", "sniper cruiser",
+        weapons=artillery)
+    siege_gun = dict(autocannon, weapon_name="Siege Cannon", weapon_size="siege engine",
+        firepower=6000, cycle_time=10)
+    ships["Siege Battery"] = _variant(ships, "Standard Siege Engine", "siege engine",
+        weapons=[siege_gun])
+    library = ShipLibrary()
+    library._load(raw_data)
+    return library
+
+
+def build_fleet(mix, size):
+    """
+    size ships split over the ship types of mix, rounding goes to the
+    first type.
+    """
+
+    fleet = {name: int(size * fraction) for name, fraction in MIXES[mix].items()}
+    first = next(iter(fleet))
+    fleet[first] += size - sum(fleet.values())
+    return fleet
+
+
+def run_case(library, mix, size, engine="python", rounds=6, seed=0):
+    attacker = build_fleet(mix, size)
+    defender = build_fleet(DEFENDERS.get(mix, "brawler"), size)
+    profiler = BattleProfiler(phases=PHASES)
+    start = time.perf_counter()
+    battle_instance = Battle(attacker, defender, rounds, library,
+        engine=engine, seed=seed, keep_rounds=False, instrument=profiler)
+    seconds = time.perf_counter() - start
+    return {
+        "mix": mix,
+        "size": size,
+        "engine": engine,
+        # the engine that fought, lanchester falls back on most mixes
+        "fought_with": battle_instance.engine,
+        "rounds": battle_instance.rounds_fought,
+        "seconds": seconds,
+        "phases": profiler.times,
+    }
+
+
+def compare(results, baseline):
+    """
+    Lines with the run time of every case relative to baseline.
+    """
+
+    def key(result):
+        return (result["mix"], result["size"], result["engine"])
+
+    before = {key(result): result for result in baseline["results"]}
+    lines = []
+    for result in results["results"]:
+        old = before.get(key(result))
+        if old is None or old["seconds"] == 0:
+            continue
+        lines.append("{:8} {:>6} {:9} {:6.2f}x".format(
+            result["mix"], result["size"], result["engine"],
+            result["seconds"] / old["seconds"]))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the battle engines")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES),
+        help="ships per side")
+    parser.add_argument("--mixes", nargs="+", default=list(MIXES),
+        choices=list(MIXES), help="attacking fleet compositions")
+    parser.add_argument("--engines", nargs="+", default=["python"],
+        choices=battle.ENGINES, help="battle engines to time")
+    parser.add_argument("--rounds", type=int, default=6, help="max rounds per battle")
+    parser.add_argument("--seed", type=int, default=0, help="battle seed")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    library = build_library()
+    results = {
+        "python_version": platform.python_version(),
+        "library_fingerprint": library.fingerprint,
+        "results": [],
+    }
+    for engine in args.engines:
+        for mix in args.mixes:
+            for size in args.sizes:
+                result = run_case(library, mix, size, engine, args.rounds, args.seed)
+                results["results"].append(result)
+                phases = " ".join(f"{phase}={seconds:.4f}"
+                    for phase, seconds in result["phases"].items())
+                print(f"{engine:9} {mix:8} {size:>6} {result['seconds']:9.4f}s {phases}")
+
+    if args.output:
+        with open(args.output, "w") as fd:
+            json.dump(results, fd, indent=2)
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+        print("\nrun time relative to " + args.compare)
+        print("\n".join(compare(results, baseline)))
+
+
+if __name__ == "__main__":
+    main()
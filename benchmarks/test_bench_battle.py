@@ -0,0 +1,19 @@
+# pytest-benchmark entry point for bench_battle, not part of the tests run
+# by default:
+#     pytest benchmarks --benchmark-json=benchmark.json
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import bench_battle
+
+library = bench_battle.build_library()
+
+@pytest.mark.parametrize("size", bench_battle.SIZES)
+@pytest.mark.parametrize("mix", list(bench_battle.MIXES))
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+def test_battle(benchmark, engine, mix, size):
+    result = benchmark.pedantic(bench_battle.run_case,
+        args=(library, mix, size, engine), rounds=3)
+    benchmark.extra_info.update(rounds_fought=result["rounds"], phases=result["phases"])
@@ -1,5 +1,6 @@
 import random
 import math
+import bisect
 from collections import namedtuple
 
 from idleiss.ship import Ship
@@ -7,12 +8,24 @@ from idleiss.ship import ShipDebuffs
 from idleiss.ship import ShipAttributes
 
 AttackResult = namedtuple("AttackResult",
-    ["attacker_fleet", "damaged_fleet", "hits_taken", "damage_taken"])
+    ["attacker_fleet", "damaged_fleet", "hits_taken", "damage_taken", "stats"],
+    defaults=(None,))
+# shots fired, damage dealt and ships destroyed by one attacking ship type
+AttackStats = namedtuple("AttackStats",
+    ["shots", "damage", "kills"])
 Fleet = namedtuple("Fleet",
     ["ships", "ship_count"])
 RoundResult = namedtuple("RoundResult",
     ["ship_count", "hits_taken", "damage_taken"])
 
+# "python": identical undamaged ships kept as stacks, shots resolved one at a time
+# "numpy": struct-of-arrays fleets, see idleiss.battle_numpy
+# "expected": deterministic expected values per ship type, see idleiss.battle_expected
+# "lanchester": closed form random fire for one ship type per side without
+#     ewar or repairs, see lanchester_applicable.  Other fights fall back to
+#     a simulating engine, Battle.engine tells which one was used.
+ENGINES = ("python", "numpy", "expected", "lanchester")
+
 def size_damage_factor(weapon_size, target_size):
     """
     Calculates damage factor based on size.  If weapon size is greater than
@@ -64,94 +77,293 @@ def is_ship_alive(ship):
     # be applied to make this check more hilarious.
     return ship.attributes.hull > 0  # though it can't be < 0
 
-def grab_debuffs(attacker_weapon, victim_ship):
+_no_debuffs = ShipDebuffs(0, 0, 0, 0)
+
+def grab_debuffs(attacker_weapon, victim_ship, rng=random):
     """
     Debuff calculator.
 
-    Returns a new ShipDebuffs tuple with the calculated values.
+    attacker_weapon is a CompiledWeapon from the schema weapon_table.
+    Returns a ShipDebuffs tuple with the calculated values, the victim's
+    own tuple when nothing changed.  rng is used for the ECM roll.
     """
 
     if victim_ship.schema.ecm_immune:
-        return ShipDebuffs(0, 0, 0, 0)
+        return _no_debuffs
 
-    new_debuffs = attacker_weapon.get("debuffs",{})
+    new_debuffs = attacker_weapon.debuffs
     current_debuffs = victim_ship.debuffs
 
     target_painter = max(
-        new_debuffs.get("target_painter",0), current_debuffs.target_painter)
+        new_debuffs.target_painter, current_debuffs.target_painter)
 
     tracking_disruption = max(
-        new_debuffs.get("tracking_disruption",0), current_debuffs.tracking_disruption)
+        new_debuffs.tracking_disruption, current_debuffs.tracking_disruption)
 
     # XXX break this out into its function as it's more complicated.
     ecm = 0
-    if new_debuffs.get("ECM",0) != 0 and not current_debuffs.ECM:
+    if new_debuffs.ECM != 0 and not current_debuffs.ECM:
         if (victim_ship.schema.sensor_strength == 0 or
-                random.random() < (float(
-                    new_debuffs["ECM"]) / victim_ship.schema.sensor_strength)):
-            ecm = new_debuffs["ECM"]
+                rng.random() < (float(
+                    new_debuffs.ECM) / victim_ship.schema.sensor_strength)):
+            ecm = new_debuffs.ECM
 
-    web = max(new_debuffs.get("web",0), current_debuffs.web)
+    web = max(new_debuffs.web, current_debuffs.web)
 
+    if (target_painter == current_debuffs.target_painter
+            and tracking_disruption == current_debuffs.tracking_disruption
+            and ecm == current_debuffs.ECM and web == current_debuffs.web):
+        return current_debuffs
     return ShipDebuffs(target_painter, tracking_disruption, ecm, web)
 
-def ship_attack(attacker_weapon, attacker_debuffs, victim_ship):
+# debuffs of a ship nothing has touched yet, same as the Ship() default
+_fresh_debuffs = ShipDebuffs(*([False] * len(ShipDebuffs._fields)))
+
+class CombatShip(object):
     """
-    Do a ship attack.
+    Mutable ship record used by the python engine during a battle.
 
-    Apply the attacker's schema onto the victim_ship as an attack
-    and return a new Ship object as the result.
+    Shots, repairs and pruning update the record in place instead of
+    building a new Ship for every change, debuffs is only replaced when a
+    debuff actually changes.  to_ship/from_ship convert from and to the
+    public Ship namedtuple.
     """
 
-    if not is_ship_alive(victim_ship):
-        # save us some time, it could be the same dead ship.
-        return victim_ship
+    __slots__ = ("schema", "shield", "armor", "hull", "debuffs")
+
+    # positions covered in a CombatFleet, see ShipStack
+    count = 1
+
+    def __init__(self, schema, shield, armor, hull, debuffs):
+        self.schema = schema
+        self.shield = shield
+        self.armor = armor
+        self.hull = hull
+        self.debuffs = debuffs
+
+    @classmethod
+    def from_ship(cls, ship):
+        return cls(ship.schema, ship.attributes.shield, ship.attributes.armor,
+            ship.attributes.hull, ship.debuffs)
+
+    def to_ship(self):
+        return Ship(self.schema,
+            ShipAttributes(self.shield, self.armor, self.hull), self.debuffs)
+
+    def is_pristine(self):
+        """
+        True when the ship is indistinguishable from a new one.
+        """
+
+        schema = self.schema
+        return (self.hull == schema.hull and self.shield == schema.shield
+            and self.armor == schema.armor and not any(self.debuffs))
+
+def is_off_schema(record):
+    """
+    True when shield or armor differ from the schema, so remote repairs
+    may target the ship.
+    """
+
+    return record.shield != record.schema.shield or record.armor != record.schema.armor
+
+def is_logistics(schema):
+    buffs = schema.buffs
+    return bool(buffs.remote_shield_repair or buffs.remote_armor_repair)
+
+class ShipStack(object):
+    """
+    count untouched ships of one schema, a single segment of a CombatFleet.
+
+    A ship of the stack that gets hit during a round is given its own
+    CombatShip in touched, keyed by its index in the stack.  Prune splits
+    those out into their own segments, or folds them back in when they
+    are as good as new.
+    """
+
+    __slots__ = ("schema", "count", "debuffs", "touched")
+
+    def __init__(self, schema, count):
+        self.schema = schema
+        self.count = count
+        self.debuffs = _fresh_debuffs
+        self.touched = {}
+
+    def record(self, i):
+        """
+        The CombatShip of the i-th ship in the stack.
+        """
+
+        record = self.touched.get(i)
+        if record is None:
+            schema = self.schema
+            record = CombatShip(schema, schema.shield, schema.armor, schema.hull,
+                self.debuffs)
+            self.touched[i] = record
+        return record
+
+class CombatFleet(object):
+    """
+    A fleet for the python engine, the counterpart to Fleet.
+
+    segments holds the ships in fleet order, each either a CombatShip or a
+    ShipStack of identical untouched ships.  Positions still count every
+    ship, a stack covers count consecutive positions, so memory and
+    bookkeeping scale with the number of damaged ships and ship types
+    rather than the number of ships.
+
+    logistics lists the segments with remote repairs and damaged holds
+    the indices of the segments whose shield or armor is off the schema
+    value, both are passed on by prune or found with a scan when not
+    given.  combat_fleet_attack adds the ships it hits to hits, keyed by
+    position, so repairs never scan the fleet.
+    """
+
+    def __init__(self, segments, ship_count, damaged=None, logistics=None):
+        self.segments = segments
+        self.ship_count = ship_count
+        # first position of each segment, the last entry is the fleet size
+        self.starts = starts = []
+        position = 0
+        for segment in segments:
+            starts.append(position)
+            position += segment.count
+        self.size = position
+        # no stacks, positions index segments directly
+        self.unstacked = self.size == len(segments) and not any(
+            type(segment) is ShipStack for segment in segments)
+        if damaged is None:
+            damaged = [k for k, segment in enumerate(segments)
+                if type(segment) is not ShipStack and is_off_schema(segment)]
+        self.damaged = damaged
+        self.hits = {}
+        if logistics is None:
+            logistics = [segment for segment in segments if is_logistics(segment.schema)]
+        self.logistics = logistics
+
+    def __len__(self):
+        return self.size
+
+    def damaged_records(self):
+        """
+        CombatShips which may be off their schema shield or armor, in
+        fleet order.  Wrecks hit this round are included.
+        """
+
+        return [record for position, record in self.damaged_positions()]
+
+    def damaged_positions(self):
+        """
+        (position, CombatShip) pairs of damaged_records.
+        """
+
+        records = {self.starts[k]: self.segments[k] for k in self.damaged}
+        records.update(self.hits)
+        return sorted(records.items())
+
+    def record(self, position):
+        """
+        The CombatShip at position, split out of its stack if needed.
+        """
+
+        if self.unstacked:
+            return self.segments[position]
+        k = bisect.bisect_right(self.starts, position) - 1
+        segment = self.segments[k]
+        if type(segment) is ShipStack:
+            return segment.record(position - self.starts[k])
+        return segment
+
+    def runs(self):
+        """
+        (first position, ship count, schema) of every segment.
+        """
+
+        return ((start, segment.count, segment.schema)
+            for start, segment in zip(self.starts, self.segments))
+
+    @property
+    def ships(self):
+        """
+        The fleet as a list of Ship namedtuples, for callers expecting a
+        Fleet.
+        """
+
+        result = []
+        for segment in self.segments:
+            if type(segment) is ShipStack:
+                schema = segment.schema
+                fresh = Ship(schema,
+                    ShipAttributes(schema.shield, schema.armor, schema.hull),
+                    segment.debuffs)
+                for i in range(segment.count):
+                    record = segment.touched.get(i)
+                    result.append(fresh if record is None else record.to_ship())
+            else:
+                result.append(segment.to_ship())
+        return result
+
+def combat_ship_attack(attacker_weapon, attacker_debuffs, victim, rng=random,
+        grab_debuffs=grab_debuffs):
+    """
+    ship_attack on a CombatShip, victim is updated in place.
+    Returns the shield, armor and hull the victim lost.
+
+    grab_debuffs is the debuff calculator, an instrumented battle passes a
+    timed one.
+    """
+
+    if victim.hull <= 0:
+        # shots on a wreck are wasted
+        return 0
 
-    if victim_ship.schema.is_structure:
+    if victim.schema.is_structure:
         # strucutres should not be attacked during fleet fights
         # structure damage and destruction is another mechanic outside of fleet engagements
         raise ValueError("Battle.ship_attack() encountered a structure as a victim_ship")
 
-    debuffs = grab_debuffs(attacker_weapon, victim_ship)
-
-    if attacker_weapon["firepower"] <= 0:
-    # no weapons: damage doesn't need to be calculated, but debuffs do
-        return Ship(
-            victim_ship.schema,
-            ShipAttributes(
-                victim_ship.attributes.shield,
-                victim_ship.attributes.armor,
-                victim_ship.attributes.hull,
-            ),
-            debuffs,
-        )
+    debuffs = grab_debuffs(attacker_weapon, victim, rng)
+
+    if attacker_weapon.firepower <= 0:
+        # no weapons: damage doesn't need to be calculated, but debuffs do
+        victim.debuffs = debuffs
+        return 0
 
-    damage = true_damage(attacker_weapon["firepower"],
-        attacker_weapon["weapon_size"],
-        victim_ship.schema.size,
+    # damage uses the debuffs the victim had before this hit
+    damage = true_damage(attacker_weapon.firepower,
+        attacker_weapon.weapon_size,
+        victim.schema.size,
         attacker_debuffs,
-        victim_ship.debuffs
+        victim.debuffs
     )
+    victim.debuffs = debuffs
     if damage <= 0:
-    #if damage modfiers change damage to 0 then victim takes no damage
-        return Ship(
-            victim_ship.schema,
-            ShipAttributes(
-                victim_ship.attributes.shield,
-                victim_ship.attributes.armor,
-                victim_ship.attributes.hull,
-            ),
-            debuffs,
-        )
+        #if damage modfiers change damage to 0 then victim takes no damage
+        return 0
 
-    shield = victim_ship.attributes.shield - damage
-    armor = victim_ship.attributes.armor + min(shield, 0)
-    hull = victim_ship.attributes.hull + min(armor, 0)
-    return Ship(
-        victim_ship.schema,
-        ShipAttributes(max(0, shield), max(0, armor), max(0, hull)),
-        debuffs,
-    )
+    before = victim.shield + victim.armor + victim.hull
+    shield = victim.shield - damage
+    armor = victim.armor + min(shield, 0)
+    hull = victim.hull + min(armor, 0)
+    victim.shield = max(0, shield)
+    victim.armor = max(0, armor)
+    victim.hull = max(0, hull)
+    return before - (victim.shield + victim.armor + victim.hull)
+
+def ship_attack(attacker_weapon, attacker_debuffs, victim_ship, rng=random):
+    """
+    Do a ship attack.
+
+    Apply the attacker's weapon (a CompiledWeapon) onto the victim_ship
+    as an attack and return a new Ship object as the result.
+    """
+
+    if not is_ship_alive(victim_ship):
+        # save us some time, it could be the same dead ship.
+        return victim_ship
+    victim = CombatShip.from_ship(victim_ship)
+    combat_ship_attack(attacker_weapon, attacker_debuffs, victim, rng)
+    return victim.to_ship()
 
 def expand_fleet(ship_count, library):
     # for the listing of numbers of ship we need to expand to each ship
@@ -170,36 +382,102 @@ def expand_fleet(ship_count, library):
             ) for i in range(ship_count[ship_type])])
     return Fleet(ships, ship_count)
 
-def prune_fleet(attack_result):
+def expand_combat_fleet(ship_count, library):
     """
-    Prune an AttackResult of dead ships and restore shields/armor.
-    Returns the pruned fleet and a count of ships.
+    CombatFleet counterpart to expand_fleet, one ShipStack per ship type.
     """
 
-    fleet = []
+    segments = [ShipStack(library.get_ship_schemata(ship_type), number)
+        for ship_type, number in ship_count.items() if number > 0]
+    return CombatFleet(segments, ship_count)
+
+# untouched ships left between hit ones are only kept stacked in runs of at
+# least this many, shorter runs cost more to look up than they save
+MIN_STACK_SIZE = 8
+
+def _append_untouched(segments, schema, number):
+    if number >= MIN_STACK_SIZE:
+        segments.append(ShipStack(schema, number))
+    else:
+        segments.extend(CombatShip(schema, schema.shield, schema.armor, schema.hull,
+            _fresh_debuffs) for _ in range(number))
+
+def _prune_record(segments, record):
+    # local repairs for a surviving record, which rejoins the stack before
+    # it when that leaves it as good as new
+    schema = record.schema
+    buffs = schema.buffs
+    record.shield = min(schema.shield, record.shield + buffs.local_shield_repair)
+    record.armor = min(schema.armor, record.armor + buffs.local_armor_repair)
+    last = segments[-1] if segments else None
+    if type(last) is ShipStack and last.schema is schema and record.is_pristine():
+        last.count += 1
+    else:
+        segments.append(record)
+
+def combat_prune_fleet(attack_result):
+    """
+    prune_fleet for an AttackResult holding a CombatFleet.  Survivors get
+    their local repairs in place, returns a new CombatFleet of them.
+    """
+
+    segments = []
     count = {}
-    damage_taken = 0
+    # segment indices of ships off their schema, and the logistics segments
+    damaged = []
+    logistics = []
+    for segment in attack_result.damaged_fleet.segments:
+        schema = segment.schema
+        buffs = schema.buffs
+        first = len(segments)
+        if type(segment) is not ShipStack:
+            # same as _prune_record, inline since most segments are records
+            # once a fleet has been fighting for a while
+            if not segment.hull > 0:
+                continue
+            shield = segment.shield = min(schema.shield,
+                segment.shield + buffs.local_shield_repair)
+            armor = segment.armor = min(schema.armor,
+                segment.armor + buffs.local_armor_repair)
+            last = segments[-1] if segments else None
+            if type(last) is ShipStack and last.schema is schema and segment.is_pristine():
+                last.count += 1
+            else:
+                if shield != schema.shield or armor != schema.armor:
+                    damaged.append(first)
+                segments.append(segment)
+        elif not segment.touched:
+            segments.append(ShipStack(schema, segment.count))
+        else:
+            # untouched ships between the touched ones stay stacked
+            previous = 0
+            for i in sorted(segment.touched):
+                if i > previous:
+                    _append_untouched(segments, schema, i - previous)
+                record = segment.touched[i]
+                if record.hull > 0:
+                    _prune_record(segments, record)
+                    if segments[-1] is record and is_off_schema(record):
+                        damaged.append(len(segments) - 1)
+                previous = i + 1
+            if segment.count > previous:
+                _append_untouched(segments, schema, segment.count - previous)
+        if buffs.remote_shield_repair or buffs.remote_armor_repair:
+            logistics.extend(segments[first:])
+    for segment in segments:
+        name = segment.schema.name
+        count[name] = count.get(name, 0) + segment.count
+    return CombatFleet(segments, count, damaged, logistics)
 
-    for ship in attack_result.damaged_fleet:
-        if not ship.attributes.hull > 0:
-            continue
+def prune_fleet(attack_result):
+    """
+    Prune an AttackResult of dead ships and restore shields/armor.
+    Returns the pruned fleet and a count of ships.
+    """
 
-        fleet.append(Ship(
-            ship.schema,
-            ShipAttributes(
-                min(ship.schema.shield,
-                    (ship.attributes.shield + ship.schema.buffs.local_shield_repair)
-                ),
-                min(ship.schema.armor,
-                    (ship.attributes.armor + ship.schema.buffs.local_armor_repair)
-                ),
-                ship.attributes.hull,
-            ),
-            ship.debuffs,
-        ))
-        count[ship.schema.name] = count.get(ship.schema.name, 0) + 1
-
-    return Fleet(fleet, count)
+    pruned = combat_prune_fleet(attack_result._replace(damaged_fleet=CombatFleet(
+        [CombatShip.from_ship(ship) for ship in attack_result.damaged_fleet], {})))
+    return Fleet(pruned.ships, pruned.ship_count)
 
 def logi_subfleet(input_fleet):
     """
@@ -253,67 +531,386 @@ def remove_structures_list(input_fleet):
             subfleet.append(i)
     return subfleet
 
-def repair_fleet(input_fleet):
+# run_hullclasses marker for structures, which are never targeted
+_structure = object()
+
+def random_index(rng, n):
     """
-    Have logistics ships do their job and repair other ships in the fleet
+    Returns a uniform random index in range(n).  Draws exactly what
+    rng.choice() draws for a sequence of length n, so picking from an
+    index instead of a list does not change seeded battles.
     """
-    logistics = logi_subfleet(input_fleet)
-    logi_shield = logistics[0]
-    logi_armor = logistics[1]
-    if (logi_shield == []) and (logi_armor == []):
-        return input_fleet
 
-    damaged_shield = []
+    if hasattr(rng, "integers"): # numpy.random.Generator
+        return int(rng.integers(n))
+    return rng.choice(range(n))
+
+class TargetIndex(object):
+    """
+    Positions of the ships a fleet_attack can target, built once per round.
+
+    Structures are left out and the remaining positions are kept as runs
+    of consecutive positions sharing a hullclass id, so a fleet of stacked
+    ships costs one entry per stack instead of one per ship.  Ships
+    destroyed during the round stay in the index until prune_fleet removes
+    them, so shots can still be wasted on a wreck as before.
+    """
+
+    def __init__(self, input_fleet):
+        self._index_runs((i, 1, ship.schema) for i, ship in enumerate(input_fleet))
+
+    @classmethod
+    def from_runs(cls, runs):
+        """
+        Index from (first position, ship count, schema) runs in position
+        order, as given by CombatFleet.runs().
+        """
+
+        targets = cls.__new__(cls)
+        targets._index_runs(runs)
+        return targets
+
+    def _index_runs(self, runs):
+        self.run_starts = []
+        # hullclass id of each run, _structure for structures
+        self.run_hullclasses = []
+        size = 0
+        for start, count, schema in runs:
+            hullclass = _structure if schema.is_structure else schema.hullclass_id
+            if not (self.run_hullclasses and self.run_hullclasses[-1] is hullclass):
+                self.run_starts.append(start)
+                self.run_hullclasses.append(hullclass)
+            size = start + count
+        self.size = size
+        self._levels = {}
+
+    def hullclass_at(self, position):
+        return self.run_hullclasses[bisect.bisect_right(self.run_starts, position) - 1]
+
+    def _level(self, priority):
+        # (run starts, targets before each run, total) of the priority level,
+        # every targetable ship when priority is None
+        level = self._levels.get(priority)
+        if level is None:
+            starts = []
+            before = []
+            total = 0
+            ends = self.run_starts[1:] + [self.size]
+            for start, end, hullclass in zip(self.run_starts, ends, self.run_hullclasses):
+                if hullclass is _structure:
+                    continue
+                if priority is not None and hullclass not in priority:
+                    continue
+                starts.append(start)
+                before.append(total)
+                total += end - start
+            level = (starts, before, total)
+            self._levels[priority] = level
+        return level
+
+    def _positions(self, priority):
+        starts, before, total = self._level(priority)
+        ends = before[1:] + [total]
+        return [position for start, first, last in zip(starts, before, ends)
+            for position in range(start, start + last - first)]
+
+    @property
+    def all(self):
+        """
+        ascending positions of every targetable ship
+        """
+
+        return self._positions(None)
+
+    @property
+    def total(self):
+        """
+        number of targetable ships
+        """
+
+        return self._level(None)[2]
+
+    def level(self, priority):
+        """
+        returns the ascending positions of the ships with a hullclass id
+        in the priority level, a frozenset from CompiledWeapon.priority_targets
+        """
+
+        return self._positions(priority)
+
+    def pick(self, rng, exclude, priority=None):
+        """
+        Pick a random position from the priority level (any targetable ship
+        when priority is None) that is not in exclude.  Returns None when
+        no such ship exists.  Costs O(len(exclude) * log(runs)), not
+        O(fleet size).
+
+        Draws like rng.choice() on the remaining positions in ascending
+        order; the original list(set(...)) order differed for sparse and
+        priority target lists.
+        """
+
+        level = self._levels.get(priority)
+        starts, before, total = level if level is not None else self._level(priority)
+        if priority is None:
+            excluded = exclude
+        else:
+            excluded = [i for i in exclude if self.hullclass_at(i) in priority]
+        remaining = total - len(excluded)
+        if remaining <= 0:
+            return None
+        index = random_index(rng, remaining)
+        # skip over excluded positions which sit at or before index
+        ranks = []
+        for i in excluded:
+            k = bisect.bisect_right(starts, i) - 1
+            ranks.append(before[k] + i - starts[k])
+        for rank in sorted(ranks):
+            if rank <= index:
+                index += 1
+            else:
+                break
+        if len(starts) == 1:
+            return starts[0] + index
+        k = bisect.bisect_right(before, index) - 1
+        return starts[k] + index - before[k]
+
+class FiringSchedule(object):
+    """
+    Weapons of each ship type grouped by cycle time, built once per battle.
+
+    firing(r) returns {ship type: weapons firing on round r} leaving out
+    ship types with nothing to fire.  Rounds with the same set of cycle
+    times dividing r share one cached table, so a fleet of slow siege guns
+    costs a dict lookup per ship on the rounds they are reloading.
+    """
+
+    def __init__(self, schemata):
+        self.schemata = {schema.name: schema for schema in schemata}
+        self.periods = sorted({weapon.cycle_time
+            for schema in self.schemata.values() for weapon in schema.weapon_table})
+        self._tables = {}
+
+    @classmethod
+    def from_fleet(cls, input_fleet):
+        return cls({ship.schema.name: ship.schema for ship in input_fleet}.values())
+
+    def firing(self, current_round_number):
+        active = tuple(period for period in self.periods
+            if current_round_number % period == 0)
+        table = self._tables.get(active)
+        if table is None:
+            table = {}
+            for name, schema in self.schemata.items():
+                # weapon_table order is kept, it decides the order of rolls
+                weapons = tuple(weapon for weapon in schema.weapon_table
+                    if weapon.cycle_time in active)
+                if weapons:
+                    table[name] = weapons
+            self._tables[active] = table
+        return table
+
+def combat_repair_fleet(fleet, rng=random, log=None):
+    """
+    repair_fleet for a CombatFleet, repairs in place.  Costs O(logistics
+    ships + damaged ships), see CombatFleet.logistics and damaged_records.
+
+    log is an optional idleiss.battle_replay.BattleRecorder, told the
+    shield and armor every ship got back.
+    """
+
+    logi_shield = list(_logi_repairs(fleet, "remote_shield_repair"))
+    logi_armor = list(_logi_repairs(fleet, "remote_armor_repair"))
+    if (logi_shield == []) and (logi_armor == []):
+        return
+
+    if log is None:
+        damaged = fleet.damaged_records()
+    else:
+        positions = fleet.damaged_positions()
+        before = [(record.shield, record.armor) for position, record in positions]
+        damaged = [record for position, record in positions]
+    damaged_shield = [record for record in damaged
+        if record.shield != record.schema.shield]
+    damaged_armor = [record for record in damaged
+        if record.armor != record.schema.armor]
 
     # this has a slight bug that ships can rep themselves
     # and a ship might get over repped, but that's actually intended
 
     # shield first
-    for i, v in enumerate(input_fleet):
-        if v.attributes.shield != v.schema.shield:
-            damaged_shield.append(i)
-
-    if damaged_shield != []:
-        for ship in logi_shield:
-            rep_target = random.choice(damaged_shield)
-            input_fleet[rep_target] = Ship(
-                input_fleet[rep_target].schema,
-                ShipAttributes(
-                    min(input_fleet[rep_target].schema.shield,
-                        (input_fleet[rep_target].attributes.shield
-                            + ship.schema.buffs.remote_shield_repair)
-                    ),
-                    input_fleet[rep_target].attributes.armor,
-                    input_fleet[rep_target].attributes.hull,
-                ),
-                input_fleet[rep_target].debuffs,
-            )
-
-    damaged_armor = []
+    if damaged_shield:
+        for amount, repairs in logi_shield:
+            for _ in range(repairs):
+                target = rng.choice(damaged_shield)
+                target.shield = min(target.schema.shield, target.shield + amount)
+
     #armor second
-    for i, v in enumerate(input_fleet):
-        if v.attributes.armor != v.schema.armor:
-            damaged_armor.append(i)
-
-    if damaged_armor != []:
-        for ship in logi_armor:
-            rep_target = random.choice(damaged_armor)
-            input_fleet[rep_target] = Ship(
-                input_fleet[rep_target].schema,
-                ShipAttributes(
-                    input_fleet[rep_target].attributes.shield,
-                    min(input_fleet[rep_target].schema.armor,
-                        (input_fleet[rep_target].attributes.armor
-                            + ship.schema.buffs.remote_armor_repair)
-                    ),
-                    input_fleet[rep_target].attributes.hull,
-                ),
-                input_fleet[rep_target].debuffs,
-            )
+    if damaged_armor:
+        for amount, repairs in logi_armor:
+            for _ in range(repairs):
+                target = rng.choice(damaged_armor)
+                target.armor = min(target.schema.armor, target.armor + amount)
+
+    if log is not None:
+        for (position, record), (shield, armor) in zip(positions, before):
+            if record.shield != shield or record.armor != armor:
+                log.repair(fleet, position, record.shield - shield, record.armor - armor)
+
+def _logi_repairs(fleet, buff):
+    # (repair amount, number of logi ships able to rep) for each logistics
+    # segment with that buff, jammed ships can't target to repair
+    for segment in fleet.logistics:
+        amount = getattr(segment.schema.buffs, buff)
+        if not amount:
+            continue
+        if type(segment) is ShipStack:
+            jammed = sum(1 for record in segment.touched.values() if record.debuffs.ECM)
+            if segment.count > jammed:
+                yield amount, segment.count - jammed
+        elif not segment.debuffs.ECM:
+            yield amount, 1
+
+def repair_fleet(input_fleet, rng=random):
+    """
+    Have logistics ships do their job and repair other ships in the fleet
+    rng picks the repair targets.
+    """
 
+    records = [CombatShip.from_ship(ship) for ship in input_fleet]
+    combat_repair_fleet(CombatFleet(records, {}), rng)
+    for i, record in enumerate(records):
+        if (record.shield, record.armor) != (input_fleet[i].attributes.shield,
+                input_fleet[i].attributes.armor):
+            input_fleet[i] = record.to_ship()
     return input_fleet
 
-def fleet_attack(fleet_a, fleet_b, current_round_number):
+def combat_fleet_attack(fleet_a, fleet_b, current_round_number, rng=random,
+        schedule=None, debuffs=None, log=None, instrument=None):
+    """
+    fleet_attack between two CombatFleets, fleet_b is damaged in place and
+    is also the damaged_fleet of the returned AttackResult.
+
+    debuffs is the list of ShipDebuffs of fleet_a's segments at the start
+    of the round, needed when fleet_a was already hit this round since
+    fire is simultaneous.  The current debuffs are used when it is None.
+
+    The stats of the AttackResult are {ship type: AttackStats} for each
+    ship type of fleet_a that fired, counted as the hits land.
+
+    log is an optional idleiss.battle_replay.BattleRecorder, told about
+    every hit with the positions of the shooter and the victim.
+
+    instrument is an optional idleiss.battle_profile.BattleProfiler, it
+    times every ship_attack and grab_debuffs call.
+    """
+
+    if schedule is None:
+        schedule = FiringSchedule.from_fleet(fleet_a.segments)
+    firing = schedule.firing(current_round_number)
+    if not firing:
+        # every weapon is cycling, nothing is hit
+        return AttackResult(fleet_a, fleet_b, 0, 0, {})
+
+    targets = TargetIndex.from_runs(fleet_b.runs())
+    # if fleet b is only structures:
+    if not targets.total:
+        return AttackResult(fleet_a, fleet_b, 0, 0, {})
+
+    if fleet_b.unstacked:
+        victim_at = fleet_b.segments.__getitem__
+    else:
+        victim_at = fleet_b.record
+    pick = targets.pick
+    hits = fleet_b.hits
+    ship_attack = combat_ship_attack
+    if instrument is not None:
+        timed_debuffs = instrument.timed("grab_debuffs", grab_debuffs)
+        if timed_debuffs is not grab_debuffs:
+            ship_attack = lambda *a: combat_ship_attack(*a, grab_debuffs=timed_debuffs)
+        ship_attack = instrument.timed("ship_attack", ship_attack)
+    stats = {}
+
+    for i, segment in enumerate(fleet_a.segments):
+        weapons = firing.get(segment.schema.name)
+        if not weapons:
+            continue
+        if debuffs is not None:
+            # at the start of the round every ship of a stack was untouched
+            shooters = [debuffs[i]] * segment.count
+        elif type(segment) is ShipStack:
+            shooters = [segment.touched[j].debuffs if j in segment.touched
+                else segment.debuffs for j in range(segment.count)]
+        else:
+            shooters = [segment.debuffs]
+
+        # totals for the segment, damage and kills are counted as hits land
+        shots = 0
+        damage = 0
+        kills = 0
+        for j, ship_debuffs in enumerate(shooters):
+            if ship_debuffs.ECM:
+                # attacker is jammed can't attack or apply debuffs
+                continue
+
+            # only the weapons whose cycle time divides this round
+            for weapon in weapons:
+                # weapons increment shots by 1 if the weapon firepower is > 0
+                if weapon.firepower > 0:
+                    shots += 1
+
+                # aoe weapons cannot hit the same target twice
+                aoe_hit_list = []
+                #repeat for each "area_of_effect" count
+                for area_of_effect in range(weapon.area_of_effect):
+                    target_id = None
+                    # for each priority level, first level with a target wins
+                    for possible_target in weapon.priority_targets:
+                        target_id = pick(rng, aoe_hit_list, possible_target)
+                        if target_id is not None:
+                            break
+                    if target_id is None: # no priority targets found shoot anything
+                        target_id = pick(rng, aoe_hit_list)
+                    if target_id is None:
+                        continue # no remaining targets for AOE
+
+                    victim = victim_at(target_id)
+                    if log is None:
+                        lost = ship_attack(weapon, ship_debuffs, victim, rng)
+                    else:
+                        victim_debuffs = victim.debuffs
+                        lost = ship_attack(weapon, ship_debuffs, victim, rng)
+                        log.hit(fleet_b, fleet_a.starts[i] + j, target_id, lost,
+                            victim, victim_debuffs)
+                    if lost:
+                        damage += lost
+                        hits[target_id] = victim
+                        # wrecks lose nothing, so this was the killing blow
+                        if victim.hull <= 0:
+                            kills += 1
+                    aoe_hit_list.append(target_id)
+                #end of area_of_effect for loop
+
+        add_attack_stats(stats, {segment.schema.name: AttackStats(shots, damage, kills)})
+
+    return AttackResult(fleet_a, fleet_b,
+        sum(type_stats.shots for type_stats in stats.values()),
+        sum(type_stats.damage for type_stats in stats.values()), stats)
+
+def add_attack_stats(totals, stats):
+    """
+    Add the {ship_type: AttackStats} in stats to totals, in place.
+    """
+
+    for name, type_stats in stats.items():
+        total = totals.get(name)
+        if total is None:
+            totals[name] = type_stats
+        else:
+            totals[name] = AttackStats(*(a + b for a, b in zip(total, type_stats)))
+    return totals
+
+def fleet_attack(fleet_a, fleet_b, current_round_number, rng=random, schedule=None):
     """
     Do a round of fleet attack calculation.
 
@@ -321,88 +918,182 @@ def fleet_attack(fleet_a, fleet_b, current_round_number):
 
     current_round_number determines which weapons are fired (on 0 all are fired)
 
-    TODO?: Appends the hit_by attribute on the victim ship in fleet_b for
-    each ship in fleet_a.
+    rng supplies every random choice, it can be the random module, a
+    random.Random or a numpy.random.Generator.
+
+    schedule is the FiringSchedule of fleet_a's ship types, Battle keeps
+    one per side.  One is built from fleet_a when it is not given.
+
+    Neither fleet is modified, see combat_fleet_attack for the in place
+    version used by Battle.
     """
 
-    # if fleet b is only structures:
-    if not remove_structures_list(fleet_b.ships):
-        return AttackResult(fleet_a, fleet_b.ships, 0, 0)
+    ships_a = fleet_a.ships
+    victims = CombatFleet([CombatShip.from_ship(ship) for ship in fleet_b.ships],
+        fleet_b.ship_count)
+    result = combat_fleet_attack(
+        CombatFleet([CombatShip.from_ship(ship) for ship in ships_a], fleet_a.ship_count),
+        victims, current_round_number, rng, schedule)
+    return result._replace(attacker_fleet=ships_a, damaged_fleet=victims.ships)
 
-    result = []
-    result.extend(fleet_b.ships)
-    shots = 0
-    damage = 0
+# lanchester counts are reported with this many decimals in RoundResult.ship_count
+LANCHESTER_PRECISION = 2
 
-    for ship in fleet_a.ships:
-        # Wanted to do apply an "attacked_by" attribute to
-        # the target, but let's wait for that and just mutate this
-        # into the new ship.  Something something hidden running
-        # complexity when dealing with a list (it's an array).
+# hit counts further than this many standard deviations from the mean are
+# left out of the lanchester model
+LANCHESTER_TAIL = 12
 
-        if ship.debuffs.ECM:
-            # attacker is jammed can't attack or apply debuffs
-            continue
+# most distinct hp values a lanchester fleet keeps track of, beyond that
+# neighbouring values are merged into their weighted average
+LANCHESTER_STATES = 256
 
-        for weapon in ship.schema.weapons:
-            #if it isn't time for the weapon to cycle then do not do anything for this weapon
-            if current_round_number % weapon["cycle_time"] != 0:
-                continue
+class LanchesterFleet(object):
+    """
+    One ship type for the lanchester engine.  count is the expected number
+    of live ships and health {hp left: share of the live ships} how damage
+    is spread over them.  Fire is random, as in the python engine, so
+    health keeps track of every partly damaged ship instead of assuming
+    one ship is finished off before the next is engaged.
 
-            # weapons increment shots by 1 if the weapon firepower is > 0
-            if weapon["firepower"] > 0:
-                shots += 1
-
-            aoe_hit_list = []
-            structures = only_strucutre_list(result)
-            #repeat for each "area_of_effect" count
-            for area_of_effect in range(weapon["area_of_effect"]):
-                # check if there are priority targets
-                if weapon["priority_targets"] != []:
-                    target_found = False
-                    for possible_target in weapon["priority_targets"]:
-                        # for each priority level
-                        target_list = priority_target_list(result, possible_target)
-                        # aoe weapons cannot hit the same target twice
-                        target_list = list(set(target_list) - set(aoe_hit_list) - set(structures))
-                        if target_list == []: # no target
-                            continue # try next priority level
-
-                        # target found
-                        target_id = random.choice(target_list)
-                        result[target_id] = ship_attack(weapon, ship.debuffs, result[target_id])
-                        aoe_hit_list.append(target_id)
-                        target_found = True
-                        break # only can hit once per loop
-                    #end of priority_targets for loop
-
-                    if target_found == False: # no priority targets found shoot anything
-                        #aoe weapons cannot hit the same target twice
-                        target_list = list(set(range(len(result))) - set(aoe_hit_list) - set(structures))
-                        if target_list == []:
-                            continue # no remaining targets for AOE
-
-                        target_id = random.choice(target_list)
-                        result[target_id] = ship_attack(weapon, ship.debuffs, result[target_id])
-                        aoe_hit_list.append(target_id)
-                else: # this means: weapon["priority_targets"] is [] (empty)
-                    target_list = list(set(range(len(result))) - set(aoe_hit_list) - set(structures))
-                    if target_list == []:
-                        continue # no remaining targets for AOE
+    A fleet whose expected count drops below half a ship is destroyed.
+    """
 
-                    target_id = random.choice(target_list)
-                    result[target_id] = ship_attack(weapon, ship.debuffs, result[target_id])
-                    aoe_hit_list.append(target_id)
-            #end of area_of_effect for loop
+    def __init__(self, schema, count):
+        self.schema = schema
+        self.count = float(count)
+        self.hp = schema.shield + schema.armor + schema.hull
+        self.health = {self.hp: 1.0}
 
-    # here all the ships have taken their shots and we sum for this round
-    damage = sum((
-            (fresh.attributes.shield - damaged.attributes.shield) +
-            (fresh.attributes.armor - damaged.attributes.armor) +
-            (fresh.attributes.hull - damaged.attributes.hull)
-        for fresh, damaged in zip(fleet_b.ships, result)))
+    @property
+    def ship_count(self):
+        if not self.count:
+            return {}
+        return {self.schema.name: round(self.count, LANCHESTER_PRECISION)}
 
-    return AttackResult(fleet_a.ships, result, shots, damage)
+def lanchester_applicable(attacker, defender, library):
+    """
+    True when a fight can be solved by the lanchester engine: a single
+    ship type on each side, no structures, no weapon debuffs and no
+    repairs of any kind.  Everything else needs a simulation.
+    """
+
+    for ship_count in (attacker, defender):
+        fielded = [name for name, number in ship_count.items() if number > 0]
+        if len(fielded) != 1:
+            return False
+        schema = library.get_ship_schemata(fielded[0])
+        if schema.is_structure or any(schema.buffs):
+            return False
+        if any(any(weapon.debuffs) for weapon in schema.weapon_table):
+            return False
+    return True
+
+def expand_lanchester_fleet(ship_count, library):
+    name, = [name for name, number in ship_count.items() if number > 0]
+    return LanchesterFleet(library.get_ship_schemata(name), ship_count[name])
+
+def _merge_health(health, hp):
+    buckets = {}
+    for left, share in health.items():
+        bucket = buckets.setdefault(left * LANCHESTER_STATES // (hp + 1), [0.0, 0.0])
+        bucket[0] += share
+        bucket[1] += share * left
+    merged = {}
+    for share, weighted in buckets.values():
+        left = max(1, int(round(weighted / share)))
+        merged[left] = merged.get(left, 0.0) + share
+    return merged
+
+def _binomial_pmf(trials, chance, low, high):
+    """
+    P(X = k) for X ~ Binomial(trials, chance), for k in range(low, high).
+    The first term is taken in log space, it underflows for large trials.
+    """
+
+    if chance >= 1:
+        return [1.0 if k == trials else 0.0 for k in range(low, high)]
+    if low > trials or high <= low:
+        return []
+    ratio = chance / (1 - chance)
+    pmf = math.exp(math.lgamma(trials + 1) - math.lgamma(low + 1)
+        - math.lgamma(trials - low + 1) + low * math.log(chance)
+        + (trials - low) * math.log1p(-chance))
+    terms = []
+    for k in range(low, min(high, trials + 1)):
+        terms.append(pmf)
+        pmf *= (trials - k) / (k + 1) * ratio
+    return terms + [0.0] * (high - low - len(terms))
+
+def lanchester_attack(fleet_a, fleet_b, current_round_number, shooters=None):
+    """
+    Fire fleet_a's volley of the round at fleet_b, which is updated in
+    place.  Returns (shots, damage taken, kills), as expected values.
+
+    Every shot lands on a ship picked at random among the fleet_b ships of
+    the start of the round, wrecks included, an area of effect shot on as
+    many distinct ships as it can.  The hits one ship takes from a weapon
+    are then Binomial(shooters, area of effect / ships), and a ship dies
+    once the hits burn through the hp it has left.
+
+    shooters is the number of ships firing, fleet_a.count when None.  Fire
+    is simultaneous so Battle passes the count at the start of the round.
+    Expected counts are rounded to whole shooters.
+    """
+
+    if shooters is None:
+        shooters = fleet_a.count
+    shooters = int(round(shooters))
+    shots = 0
+    taken = 0.0
+    kills = 0.0
+    targets = fleet_b.count
+    for weapon in fleet_a.schema.weapon_table:
+        if current_round_number % weapon.cycle_time != 0 or weapon.firepower <= 0:
+            continue
+        shots += shooters
+        if fleet_b.count == 0 or shooters == 0:
+            continue
+        damage = true_damage(weapon.firepower, weapon.weapon_size,
+            fleet_b.schema.size, _no_debuffs, _no_debuffs)
+        if damage <= 0:
+            continue
+        chance = min(1.0, weapon.area_of_effect / targets)
+        mean = shooters * chance
+        spread = LANCHESTER_TAIL * math.sqrt(mean * (1 - chance)) + 1
+        low = max(0, int(mean - spread))
+        high = min(shooters, int(mean + spread)) + 1
+        pmf = _binomial_pmf(shooters, chance, low, high)
+
+        health = {}
+        survivors = 0.0
+        ship_taken = 0.0
+        for left, share in fleet_b.health.items():
+            needed = -(-left // damage)
+            alive = 0.0
+            for k in range(low, min(needed, high)):
+                p = share * pmf[k - low]
+                if p:
+                    health[left - k * damage] = health.get(left - k * damage, 0.0) + p
+                    alive += p
+                    ship_taken += p * k * damage
+            ship_taken += (share - alive) * left
+            survivors += alive
+        killed = fleet_b.count * (1 - survivors)
+        kills += killed
+        taken += fleet_b.count * ship_taken
+        fleet_b.count -= killed
+        if survivors > 0:
+            fleet_b.health = {left: share / survivors for left, share in health.items()}
+            if len(fleet_b.health) > LANCHESTER_STATES:
+                fleet_b.health = _merge_health(fleet_b.health, fleet_b.hp)
+        else:
+            fleet_b.count = 0.0
+    if 0 < fleet_b.count < 0.5:
+        # destroyed, the ships left are counted as killed
+        kills += fleet_b.count
+        taken += fleet_b.count * sum(left * share for left, share in fleet_b.health.items())
+        fleet_b.count = 0.0
+    return shots, taken, kills
 
 
 class Battle(object):
@@ -421,11 +1112,45 @@ class Battle(object):
             max_rounds: number of rounds battle will calulate
             library: ship library to use
 
-            __init__ will automatically generate results once called
+            __init__ will automatically generate results once called, pass
+            calculate=False and use iter_rounds to get them round by round
         """
         # kwargs:
-        #     calculate: DEBUG/TEST kwarg to stop automatic battle calculation if False
-
+        #     calculate: stop automatic battle calculation if False
+        #     keep_rounds: store every round in round_results, defaults to
+        #         True. If False only the running totals needed by
+        #         generate_summary_data are kept.
+        #     engine: one of ENGINES, defaults to "python"
+        #     rng: random source for every roll in this battle, either a
+        #         random.Random or a numpy.random.Generator. Defaults to the
+        #         global random module.
+        #     seed: shortcut for rng=random.Random(seed)
+        #     fallback_engine: engine used when engine is "lanchester" but
+        #         the fight can't be solved by it, defaults to "python"
+        #     instrument: measures every round, see
+        #         idleiss.battle_profile.BattleProfiler. Defaults to None.
+        #     recorder: writes a replay log of the battle, see
+        #         idleiss.battle_replay.BattleRecorder. python engine only,
+        #         defaults to None.
+
+        self.engine = kw.get("engine", "python")
+        if self.engine not in ENGINES:
+            raise ValueError(f"Battle: unknown engine {self.engine}, valid engines are: {', '.join(ENGINES)}")
+        if self.engine == "lanchester" and not lanchester_applicable(
+                attacker, defender, library):
+            # self.engine reports the path taken
+            self.engine = kw.get("fallback_engine", "python")
+            if self.engine not in ENGINES or self.engine == "lanchester":
+                raise ValueError(f"Battle: invalid fallback engine {self.engine}")
+        self.recorder = kw.get("recorder")
+        if self.recorder is not None and self.engine != "python":
+            raise ValueError(f"Battle: the {self.engine} engine can't be recorded")
+        if kw.get("rng") is not None:
+            self.rng = kw["rng"]
+        elif kw.get("seed") is not None:
+            self.rng = random.Random(kw["seed"])
+        else:
+            self.rng = random
         self.max_rounds = max_rounds
         # attacker and defender are dictionaries with "ship_type": number
         self.attacker_count = attacker
@@ -433,8 +1158,20 @@ class Battle(object):
 
         self.attacker_fleet = self.defender_fleet = None
 
+        self.keep_rounds = kw.get("keep_rounds", True)
+        self.instrument = kw.get("instrument")
         self.round_results = []
+        self.rounds_fought = 0
+        self.attacker_shots = 0
+        self.defender_shots = 0
+        self.attacker_damage_dealt = 0
+        self.defender_damage_dealt = 0
+        # {ship_type: AttackStats} totals of each side's ship types
+        self.attacker_stats = {}
+        self.defender_stats = {}
         self.prepare(library)
+        self.attacker_result = self.attacker_fleet.ship_count
+        self.defender_result = self.defender_fleet.ship_count
         if(kw.get("calculate", True) != False):
             self.calculate_battle()
 
@@ -442,56 +1179,227 @@ class Battle(object):
         # do all the fleet preparation pre-battle using this game
         # library.  Could be called initialize.
         self.stored_library = library
-        self.attacker_fleet = expand_fleet(self.attacker_count, library)
-        self.defender_fleet = expand_fleet(self.defender_count, library)
+        if self.engine == "numpy":
+            # imported here, idleiss.battle_numpy depends on this module
+            from idleiss import battle_numpy
+            self._array_rng = battle_numpy.as_generator(self.rng)
+            self.attacker_fleet = battle_numpy.expand_array_fleet(self.attacker_count, library)
+            self.defender_fleet = battle_numpy.expand_array_fleet(self.defender_count, library)
+            self._bind_phases({
+                "fleet_attack": battle_numpy.array_fleet_attack,
+                "repair_fleet": battle_numpy.array_repair_fleet,
+                "prune_fleet": battle_numpy.array_prune_fleet,
+            })
+            return
+        if self.engine == "expected":
+            from idleiss import battle_expected
+            self.attacker_fleet = battle_expected.expand_expected_fleet(self.attacker_count, library)
+            self.defender_fleet = battle_expected.expand_expected_fleet(self.defender_count, library)
+            # repairs and pruning happen in expected_apply_attack
+            self._bind_phases({
+                "fleet_attack": battle_expected.expected_fleet_attack,
+                "apply_attack": battle_expected.expected_apply_attack,
+            })
+            return
+        if self.engine == "lanchester":
+            self.attacker_fleet = expand_lanchester_fleet(self.attacker_count, library)
+            self.defender_fleet = expand_lanchester_fleet(self.defender_count, library)
+            self._bind_phases({"fleet_attack": lanchester_attack})
+            return
+        self.attacker_fleet = expand_combat_fleet(self.attacker_count, library)
+        self.defender_fleet = expand_combat_fleet(self.defender_count, library)
+        self.attacker_schedule = FiringSchedule(
+            library.get_ship_schemata(name) for name in self.attacker_count)
+        self.defender_schedule = FiringSchedule(
+            library.get_ship_schemata(name) for name in self.defender_count)
+        # ship_attack and grab_debuffs are timed by combat_fleet_attack
+        self._bind_phases({
+            "fleet_attack": combat_fleet_attack,
+            "repair_fleet": combat_repair_fleet,
+            "prune_fleet": combat_prune_fleet,
+        })
+        if self.recorder is not None:
+            self.recorder.start(self.attacker_fleet, self.defender_fleet)
+
+    def _bind_phases(self, phases):
+        # {phase: function} the rounds call, timed when instrumented
+        if self.instrument is not None:
+            phases = {phase: self.instrument.timed(phase, function)
+                for phase, function in phases.items()}
+        self.phases = phases
 
     def calculate_round(self, current_round_number):
-        defender_damaged = fleet_attack(
-            self.attacker_fleet, self.defender_fleet, current_round_number)
-        attacker_damaged = fleet_attack(
-            self.defender_fleet, self.attacker_fleet, current_round_number)
+        """
+        Fight one round, record it and return its
+        (attacker RoundResult, defender RoundResult) pair.
+        """
 
-        attacker_repaired = repair_fleet(attacker_damaged.damaged_fleet)
-        defender_repaired = repair_fleet(defender_damaged.damaged_fleet)
+        if self.instrument is None:
+            round_result = self._calculate_engine_round(current_round_number)
+        else:
+            with self.instrument.round(current_round_number):
+                round_result = self._calculate_engine_round(current_round_number)
+        self.record_round(round_result)
+        return round_result
+
+    def _calculate_engine_round(self, current_round_number):
+        if self.engine == "numpy":
+            return self._calculate_array_round(current_round_number)
+        if self.engine == "expected":
+            return self._calculate_expected_round(current_round_number)
+        if self.engine == "lanchester":
+            return self._calculate_lanchester_round(current_round_number)
+        return self._calculate_python_round(current_round_number)
+
+    def record_round(self, round_result):
+        # when/if we implement more than 1v1 then this will need to change
+        attacker_round, defender_round = round_result
+        if self.keep_rounds:
+            self.round_results.append(round_result)
+        self.rounds_fought += 1
+        self.attacker_shots += defender_round.hits_taken
+        self.defender_shots += attacker_round.hits_taken
+        self.attacker_damage_dealt += defender_round.damage_taken
+        self.defender_damage_dealt += attacker_round.damage_taken
+        self.attacker_result = attacker_round.ship_count
+        self.defender_result = defender_round.ship_count
+
+    def _calculate_python_round(self, current_round_number):
+        # the defenders are hit before they fire back, fire is simultaneous
+        # so they shoot with the debuffs they had at the start of the round
+        log = self.recorder
+        instrument = self.instrument
+        fleet_attack = self.phases["fleet_attack"]
+        repair_fleet = self.phases["repair_fleet"]
+        prune_fleet = self.phases["prune_fleet"]
+        defender_debuffs = [segment.debuffs for segment in self.defender_fleet.segments]
+        defender_damaged = fleet_attack(self.attacker_fleet, self.defender_fleet,
+            current_round_number, self.rng, self.attacker_schedule, log=log,
+            instrument=instrument)
+        attacker_damaged = fleet_attack(self.defender_fleet, self.attacker_fleet,
+            current_round_number, self.rng, self.defender_schedule, defender_debuffs, log,
+            instrument)
+
+        repair_fleet(attacker_damaged.damaged_fleet, self.rng, log)
+        repair_fleet(defender_damaged.damaged_fleet, self.rng, log)
+        if log is not None:
+            log.end_round(current_round_number, attacker_damaged, defender_damaged)
 
         defender_results = prune_fleet(defender_damaged)
         attacker_results = prune_fleet(attacker_damaged)
+        add_attack_stats(self.attacker_stats, defender_damaged.stats)
+        add_attack_stats(self.defender_stats, attacker_damaged.stats)
 
         # TODO figure out a better way to store round information that
         # can accommodate multiple fleets.
 
-        self.round_results.append((
+        self.defender_fleet = defender_results
+        self.attacker_fleet = attacker_results
+
+        return (
             RoundResult(attacker_results.ship_count,
                 attacker_damaged.hits_taken, attacker_damaged.damage_taken),
             RoundResult(defender_results.ship_count,
                 defender_damaged.hits_taken, defender_damaged.damage_taken),
-        ))
+        )
+
+    def _calculate_array_round(self, current_round_number):
+        # same sequence as calculate_round using the struct-of-arrays engine
+        fleet_attack = self.phases["fleet_attack"]
+        repair_fleet = self.phases["repair_fleet"]
+        prune_fleet = self.phases["prune_fleet"]
+        defender_damaged = fleet_attack(
+            self.attacker_fleet, self.defender_fleet, current_round_number, self._array_rng)
+        attacker_damaged = fleet_attack(
+            self.defender_fleet, self.attacker_fleet, current_round_number, self._array_rng)
+
+        repair_fleet(attacker_damaged.damaged_fleet, self._array_rng)
+        repair_fleet(defender_damaged.damaged_fleet, self._array_rng)
+
+        defender_results = prune_fleet(defender_damaged)
+        attacker_results = prune_fleet(attacker_damaged)
+        add_attack_stats(self.attacker_stats, defender_damaged.stats)
+        add_attack_stats(self.defender_stats, attacker_damaged.stats)
 
         self.defender_fleet = defender_results
         self.attacker_fleet = attacker_results
 
-    def calculate_battle(self):
+        return (
+            RoundResult(attacker_results.ship_count,
+                attacker_damaged.hits_taken, attacker_damaged.damage_taken),
+            RoundResult(defender_results.ship_count,
+                defender_damaged.hits_taken, defender_damaged.damage_taken),
+        )
+
+    def _calculate_expected_round(self, current_round_number):
+        # expected values per ship type, repair and prune happen in apply
+        fleet_attack = self.phases["fleet_attack"]
+        apply_attack = self.phases["apply_attack"]
+        defender_attack = fleet_attack(
+            self.attacker_fleet, self.defender_fleet, current_round_number)
+        attacker_attack = fleet_attack(
+            self.defender_fleet, self.attacker_fleet, current_round_number)
+
+        defender_results, defender_damage, attacker_stats = apply_attack(
+            self.defender_fleet, defender_attack)
+        attacker_results, attacker_damage, defender_stats = apply_attack(
+            self.attacker_fleet, attacker_attack)
+        add_attack_stats(self.attacker_stats, attacker_stats)
+        add_attack_stats(self.defender_stats, defender_stats)
+
+        self.defender_fleet = defender_results
+        self.attacker_fleet = attacker_results
+
+        return (
+            RoundResult(attacker_results.ship_count,
+                attacker_attack.shots, attacker_damage),
+            RoundResult(defender_results.ship_count,
+                defender_attack.shots, defender_damage),
+        )
+
+    def _calculate_lanchester_round(self, current_round_number):
+        # both volleys use the ship counts from the start of the round
+        attacker = self.attacker_fleet
+        defender = self.defender_fleet
+        defenders = defender.count
+        fleet_attack = self.phases["fleet_attack"]
+        defender_shots, defender_damage, defender_kills = fleet_attack(
+            attacker, defender, current_round_number)
+        attacker_shots, attacker_damage, attacker_kills = fleet_attack(
+            defender, attacker, current_round_number, defenders)
+        add_attack_stats(self.attacker_stats, {attacker.schema.name:
+            AttackStats(defender_shots, defender_damage, defender_kills)})
+        add_attack_stats(self.defender_stats, {defender.schema.name:
+            AttackStats(attacker_shots, attacker_damage, attacker_kills)})
+
+        return (
+            RoundResult(attacker.ship_count, attacker_shots, attacker_damage),
+            RoundResult(defender.ship_count, defender_shots, defender_damage),
+        )
+
+    def iter_rounds(self):
+        """
+        Generator fighting the battle one round at a time, yields the
+        (attacker RoundResult, defender RoundResult) pair of every round.
+
+        Stop iterating to cancel the battle, the results and summary then
+        cover the rounds fought so far.  Iterating again resumes it.
+        """
+
         # avoid using round as variable name as it's a predefined method
         # that might be useful when working with numbers.
-        for r in range(self.max_rounds):
-            if not (self.defender_fleet.ships and self.attacker_fleet.ships):
+        for r in range(self.rounds_fought, self.max_rounds):
+            # ship_count rather than ships so array fleets are not materialized
+            if not (any(self.defender_fleet.ship_count.values())
+                    and any(self.attacker_fleet.ship_count.values())):
                 break
-            self.calculate_round(r)
+            yield self.calculate_round(r)
 
-        # when/if we implement more than 1v1 then this will need to change
-        self.attacker_result = self.round_results[-1][0].ship_count
-        self.defender_result = self.round_results[-1][1].ship_count
+    def calculate_battle(self):
+        for round_result in self.iter_rounds():
+            pass
 
     def generate_summary_data(self):
-        attacker_shots = 0
-        defender_shots = 0
-        attacker_damage_dealt = 0
-        defender_damage_dealt = 0
-        for round_result in self.round_results:
-            attacker_shots += round_result[1].hits_taken
-            defender_shots += round_result[0].hits_taken
-            attacker_damage_dealt += round_result[1].damage_taken
-            defender_damage_dealt += round_result[0].damage_taken
         attacker_losses = {key: self.attacker_count[key] - self.attacker_result.get(key, 0) for key in self.attacker_count.keys()}
         defender_losses = {key: self.defender_count[key] - self.defender_result.get(key, 0) for key in self.defender_count.keys()}
         return {
@@ -499,14 +1407,26 @@ class Battle(object):
             "defender_fleet": self.defender_count,
             "attacker_result": self.attacker_result,
             "attacker_losses": attacker_losses,
-            "attacker_shots_fired": attacker_shots,
-            "attacker_damage_dealt": attacker_damage_dealt,
+            "attacker_shots_fired": self.attacker_shots,
+            "attacker_damage_dealt": self.attacker_damage_dealt,
             "defender_result": self.defender_result,
             "defender_losses": defender_losses,
-            "defender_shots_fired": defender_shots,
-            "defender_damage_dealt": defender_damage_dealt
+            "defender_shots_fired": self.defender_shots,
+            "defender_damage_dealt": self.defender_damage_dealt,
+            "attacker_ship_stats": self._ship_stats(self.attacker_count, self.attacker_stats),
+            "defender_ship_stats": self._ship_stats(self.defender_count, self.defender_stats),
         }
 
+    def _ship_stats(self, ship_count, stats):
+        # per ship type breakdown of the shots_fired/damage_dealt totals,
+        # plus the ships each type destroyed
+        no_stats = AttackStats(0, 0, 0)
+        return {key: {
+                "shots_fired": stats.get(key, no_stats).shots,
+                "damage_dealt": stats.get(key, no_stats).damage,
+                "kills": stats.get(key, no_stats).kills,
+            } for key in ship_count.keys()}
+
     def generate_summary_text(self):
         summary = self.generate_summary_data()
         out_array = []
@@ -0,0 +1,89 @@
+"""
+LRU cache of battle summaries.
+
+A Battle with a fixed seed is deterministic, so the summary of a fight can
+be reused whenever the same fleets meet again under the same ship library.
+Site encounters are fought over and over against similar player fleets,
+which makes them the main customer.
+"""
+
+from collections import namedtuple
+from collections import OrderedDict
+import copy
+
+from idleiss.battle import Battle
+
+CacheInfo = namedtuple("CacheInfo",
+    ["hits", "misses", "invalidations", "maxsize", "currsize"])
+
+def _fleet_key(ship_count):
+    # fleets are built in dict order and targets are drawn by position, so
+    # the same ships in another order are another fight with another result
+    return tuple(ship_count.items())
+
+class BattleCache(object):
+
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("BattleCache: maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.library_fingerprint = None
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.invalidations,
+            self.maxsize, len(self._entries))
+
+    def clear(self):
+        self._entries.clear()
+
+    def _check_library(self, library):
+        """
+        Drop every entry when the library has been (re)loaded with
+        different ships since the entries were stored.
+        """
+
+        if library.fingerprint != self.library_fingerprint:
+            if self._entries:
+                self.invalidations += 1
+                self.clear()
+            self.library_fingerprint = library.fingerprint
+
+    def fight(self, attacker, defender, max_rounds, library, seed, engine="python"):
+        """
+        Returns Battle(...).generate_summary_data() for the fight, from the
+        cache when the same fight was already simulated.
+
+        The fleets are simulated in the order given, so the summary is the
+        same as an uncached Battle with the same seed returns.  A seed of
+        None is not deterministic so it is always simulated, never stored
+        and counted neither as a hit nor as a miss.
+        """
+
+        if seed is None:
+            return Battle(attacker, defender, max_rounds, library, engine=engine,
+                keep_rounds=False).generate_summary_data()
+
+        self._check_library(library)
+        attacker_key = _fleet_key(attacker)
+        defender_key = _fleet_key(defender)
+        key = (attacker_key, defender_key, max_rounds, library.fingerprint, seed, engine)
+        summary = self._entries.get(key)
+        if summary is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return copy.deepcopy(summary)
+
+        self.misses += 1
+        summary = Battle(dict(attacker), dict(defender), max_rounds,
+            library, engine=engine, seed=seed, keep_rounds=False).generate_summary_data()
+        self._entries[key] = summary
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return copy.deepcopy(summary)
@@ -0,0 +1,254 @@
+"""
+Expected-value battle engine.
+
+Fleets are kept as expected ship counts per ship type instead of being
+expanded into individual ships, and every round is resolved from expected
+values, so a battle costs O(rounds * types * weapons) no matter how many
+ships are involved.  Nothing is random: the same fight always gives the
+same answer, which makes it suited to AI planning and UI previews.
+
+The model for one round, per target ship type:
+  - every firing weapon spreads its hits over the target types of the first
+    priority level that still has ships, weighted by ship count, and spills
+    area of effect hits over to the next level once a level is used up
+  - damage per hit is idleiss.battle.true_damage against an undebuffed
+    target of that size
+  - hits on a ship are Poisson distributed, a ship dies when it takes enough
+    hits to burn through the shield, armor and hull it has left
+  - ECM jams a ship with the probability the python engine uses for one
+    roll, ECM strength / sensor_strength
+  - surviving ships carry their average damage into the next round, local
+    and remote repairs reduce it
+
+A ship type whose expected count drops below half a ship is destroyed.
+"""
+
+from collections import namedtuple
+import math
+
+from idleiss.battle import AttackStats
+from idleiss.battle import true_damage
+from idleiss.ship import ShipDebuffs
+
+# counts are reported with this many decimals in RoundResult.ship_count
+COUNT_PRECISION = 2
+
+_no_debuffs = ShipDebuffs(0, 0, 0, 0)
+
+ExpectedAttack = namedtuple("ExpectedAttack",
+    ["hits", "damage", "jam_rate", "shots", "type_shots", "type_damage"])
+
+
+class ExpectedFleet(object):
+    """
+    Expected ship counts for one side of a battle.
+
+        count: {ship_type: expected number of ships}
+        wear: {ship_type: average damage carried by a surviving ship}
+        jammed: {ship_type: fraction of the ships that are jammed}
+    """
+
+    def __init__(self, schemata, count, wear, jammed):
+        self.schemata = schemata
+        self.count = count
+        self.wear = wear
+        self.jammed = jammed
+
+    @property
+    def ship_count(self):
+        return {name: round(count, COUNT_PRECISION)
+            for name, count in self.count.items()}
+
+
+def expand_expected_fleet(ship_count, library):
+    """
+    Expected-value counterpart to idleiss.battle.expand_fleet.
+    """
+
+    schemata = {name: library.get_ship_schemata(name) for name in ship_count}
+    count = {name: float(number) for name, number in ship_count.items() if number > 0}
+    return ExpectedFleet(schemata, count,
+        {name: 0.0 for name in count}, {name: 0.0 for name in count})
+
+
+def expected_fleet_attack(fleet_a, fleet_b, current_round_number):
+    """
+    Expected hits, damage and ECM pressure from fleet_a on every ship type
+    of fleet_b.  Neither fleet is modified.
+
+    type_shots and type_damage break shots and damage down by the ship
+    type of fleet_a firing them, type_damage is
+    {ship type: {target type: damage}}.
+    """
+
+    hits = {}
+    damage = {}
+    jam_rate = {}
+    shots = 0.0
+    type_shots = {}
+    type_damage = {}
+    targets = {name: count for name, count in fleet_b.count.items()
+        if not fleet_b.schemata[name].is_structure}
+    if not targets:
+        return ExpectedAttack(hits, damage, jam_rate, shots, type_shots, type_damage)
+
+    for name, count in fleet_a.count.items():
+        schema = fleet_a.schemata[name]
+        shooters = count * (1 - fleet_a.jammed[name])
+        if shooters <= 0:
+            continue
+        type_shots.setdefault(name, 0.0)
+        sources = type_damage.setdefault(name, {})
+        for weapon in schema.weapon_table:
+            if current_round_number % weapon.cycle_time != 0:
+                continue
+            if weapon.firepower > 0:
+                shots += shooters
+                type_shots[name] += shooters
+            ecm = weapon.debuffs.ECM
+
+            # hits per shooter on each target type
+            spread = {}
+            needed = float(weapon.area_of_effect)
+            claimed = set()
+            for level in weapon.priority_targets + (None,):
+                members = [target for target in targets if target not in claimed
+                    and (level is None or fleet_b.schemata[target].hullclass_id in level)]
+                available = sum(targets[target] for target in members)
+                if available <= 0:
+                    continue
+                taken = min(needed, available)
+                for target in members:
+                    spread[target] = taken * targets[target] / available
+                claimed.update(members)
+                needed -= taken
+                if needed <= 0:
+                    break
+
+            for target, per_shooter in spread.items():
+                target_schema = fleet_b.schemata[target]
+                target_hits = shooters * per_shooter
+                hits[target] = hits.get(target, 0.0) + target_hits
+                if weapon.firepower > 0:
+                    target_damage = target_hits * true_damage(
+                        weapon.firepower, weapon.weapon_size,
+                        target_schema.size, _no_debuffs, _no_debuffs)
+                    damage[target] = damage.get(target, 0.0) + target_damage
+                    sources[target] = sources.get(target, 0.0) + target_damage
+                if ecm and not target_schema.ecm_immune:
+                    if target_schema.sensor_strength == 0:
+                        chance = 1.0
+                    else:
+                        chance = min(1.0, float(ecm) / target_schema.sensor_strength)
+                    jam_rate[target] = jam_rate.get(target, 0.0) + target_hits * chance
+
+    return ExpectedAttack(hits, damage, jam_rate, shots, type_shots, type_damage)
+
+
+def _poisson_kill(rate, needed):
+    """
+    For hits ~ Poisson(rate) returns (P(hits >= needed), E[hits | hits < needed]).
+    """
+
+    if needed <= 0:
+        return 1.0, 0.0
+    if rate <= 0:
+        return 0.0, 0.0
+    if needed > rate + 12 * math.sqrt(rate) + 30:
+        # survival is certain for all practical purposes
+        return 0.0, rate
+    # terms further below the mean than this are negligible, start there
+    # with the first term taken in log space: exp(-rate) underflows to 0
+    # for rates above ~745
+    start = max(0, int(rate - 12 * math.sqrt(rate) - 30))
+    if start >= needed:
+        # death is certain for all practical purposes
+        return 1.0, 0.0
+    pmf = math.exp(start * math.log(rate) - rate - math.lgamma(start + 1))
+    below = 0.0
+    weighted = 0.0
+    for k in range(start, int(needed)):
+        below += pmf
+        weighted += k * pmf
+        pmf *= rate / (k + 1)
+    below = min(below, 1.0)
+    if below <= 0:
+        return 1.0, 0.0
+    return 1.0 - below, weighted / below
+
+
+def expected_apply_attack(fleet, attack):
+    """
+    Apply an ExpectedAttack to fleet, then repair and prune it.
+    Returns (new ExpectedFleet, expected damage actually taken, stats),
+    stats is {attacking ship type: AttackStats} with the damage taken and
+    ships lost by each ship type of fleet split in proportion to the
+    damage each attacking type fired at it.
+    """
+
+    count = {}
+    wear = {}
+    jammed = {}
+    damage_taken = 0.0
+    # expected damage taken by each ship type of fleet
+    taken = {}
+
+    for name, number in fleet.count.items():
+        schema = fleet.schemata[name]
+        hits = attack.hits.get(name, 0.0)
+        ship_wear = fleet.wear[name]
+        rate = hits / number
+        if attack.damage.get(name, 0.0) > 0:
+            remaining = schema.shield + schema.armor + schema.hull - ship_wear
+            per_hit = attack.damage[name] / hits
+            kill_chance, survivor_hits = _poisson_kill(rate, math.ceil(remaining / per_hit))
+            survivors = number * (1 - kill_chance)
+            taken[name] = number * kill_chance * remaining + survivors * survivor_hits * per_hit
+            damage_taken += taken[name]
+            ship_wear += survivor_hits * per_hit
+        else:
+            survivors = number
+        # jams persist until the ship is hit again
+        fresh_jam = 1 - math.exp(-attack.jam_rate.get(name, 0.0) / number)
+        jammed[name] = fresh_jam + (1 - fresh_jam) * fleet.jammed[name] * math.exp(-rate)
+        count[name] = survivors
+        wear[name] = ship_wear
+
+    # remote repairs are shared in proportion to the damage carried, local
+    # repairs only fix shield and armor, never hull
+    remote = sum(count[name] * (1 - jammed[name]) * (
+            fleet.schemata[name].buffs.remote_shield_repair
+            + fleet.schemata[name].buffs.remote_armor_repair)
+        for name in count)
+    total_wear = sum(count[name] * wear[name] for name in count)
+    for name in count:
+        schema = fleet.schemata[name]
+        repair = schema.buffs.local_shield_repair + schema.buffs.local_armor_repair
+        if remote > 0 and total_wear > 0:
+            repair += remote * wear[name] / total_wear
+        hull_damage = max(0.0, wear[name] - schema.shield - schema.armor)
+        wear[name] = max(hull_damage, wear[name] - repair)
+
+    # types below half a ship are destroyed, what they had left is damage
+    # taken so the kills they count come with their damage
+    for name in list(count):
+        if count[name] < 0.5:
+            schema = fleet.schemata[name]
+            left = count[name] * (schema.shield + schema.armor + schema.hull - wear[name])
+            taken[name] = taken.get(name, 0.0) + left
+            damage_taken += left
+            del count[name], wear[name], jammed[name]
+
+    stats = {}
+    for attacker, sources in attack.type_damage.items():
+        damage = 0.0
+        kills = 0.0
+        for name, source_damage in sources.items():
+            if not source_damage:
+                continue
+            share = source_damage / attack.damage[name]
+            damage += share * taken.get(name, 0.0)
+            kills += share * (fleet.count[name] - count.get(name, 0.0))
+        stats[attacker] = AttackStats(attack.type_shots[attacker], damage, kills)
+
+    return ExpectedFleet(fleet.schemata, count, wear, jammed), damage_taken, stats
@@ -0,0 +1,467 @@
+"""
+Struct-of-arrays battle engine.
+
+Each side of a battle is stored as parallel NumPy arrays (one row per ship)
+instead of a list of Ship namedtuples.  A round resolves every weapon volley
+of a fleet at once: targets are drawn in bulk, damage is summed per target
+with a bincount and the shield -> armor -> hull cascade is applied once.
+
+Shots inside a volley are simultaneous: damage and debuffs are calculated
+against the state the target had at the start of the round, so a web or
+painter applied this round only helps from the next round onwards.  The
+results are statistically equivalent to the sequential engine in
+idleiss.battle but the random draws differ, so identical seeds will not
+produce identical fights across engines.
+
+Area of effect volleys are resolved shooter by shooter in _aoe_kernel,
+compiled with Numba when it is installed.  Its random numbers are drawn
+up front, so the compiled and the pure python kernel give the same fight
+for the same seed.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError: # optional, the pure python kernel is used without it
+    numba = None
+
+from idleiss.battle import AttackResult
+from idleiss.battle import AttackStats
+from idleiss.ship import Ship
+from idleiss.ship import ShipDebuffs
+from idleiss.ship import ShipAttributes
+from idleiss.ship import debuff_effects
+
+# debuff columns, in ShipDebuffs order
+TARGET_PAINTER, TRACKING_DISRUPTION, ECM, WEB = range(len(debuff_effects))
+
+
+def as_generator(rng):
+    """
+    Returns a numpy Generator for rng.  A numpy Generator is used as is,
+    the random module or a random.Random seeds a new Generator so the
+    battle stays reproducible from the same seed.
+    """
+
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng.getrandbits(64))
+
+
+class FleetTables(object):
+    """
+    Per-schema lookup arrays shared by every ship row of an ArrayFleet.
+    Row data only stores a schema index into these tables.
+    """
+
+    def __init__(self, schemata):
+        self.schemata = schemata
+        self.names = [schema.name for schema in schemata]
+        self.hullclass_ids = np.array([s.hullclass_id for s in schemata], dtype=np.int64)
+        self.shield = np.array([s.shield for s in schemata], dtype=np.int64)
+        self.armor = np.array([s.armor for s in schemata], dtype=np.int64)
+        self.hull = np.array([s.hull for s in schemata], dtype=np.int64)
+        self.size = np.array([s.size for s in schemata], dtype=np.float64)
+        self.sensor_strength = np.array(
+            [s.sensor_strength for s in schemata], dtype=np.float64)
+        self.ecm_immune = np.array([bool(s.ecm_immune) for s in schemata], dtype=bool)
+        self.is_structure = np.array([bool(s.is_structure) for s in schemata], dtype=bool)
+        self.local_shield_repair = np.array(
+            [s.buffs.local_shield_repair for s in schemata], dtype=np.int64)
+        self.local_armor_repair = np.array(
+            [s.buffs.local_armor_repair for s in schemata], dtype=np.int64)
+        self.remote_shield_repair = np.array(
+            [s.buffs.remote_shield_repair for s in schemata], dtype=np.int64)
+        self.remote_armor_repair = np.array(
+            [s.buffs.remote_armor_repair for s in schemata], dtype=np.int64)
+        # (schema index, CompiledWeapon) for every weapon this fleet can fire
+        self.weapons = [(i, weapon)
+            for i, schema in enumerate(schemata) for weapon in schema.weapon_table]
+        self.periods = sorted({weapon.cycle_time for i, weapon in self.weapons})
+        self._firing = {}
+        self._masks = {}
+
+    def firing(self, current_round_number):
+        """
+        The (schema index, CompiledWeapon) pairs of self.weapons firing on
+        current_round_number, cached per set of cycle times dividing it.
+        """
+
+        active = tuple(period for period in self.periods
+            if current_round_number % period == 0)
+        weapons = self._firing.get(active)
+        if weapons is None:
+            weapons = [(i, weapon) for i, weapon in self.weapons
+                if weapon.cycle_time in active]
+            self._firing[active] = weapons
+        return weapons
+
+    def hullclass_mask(self, hullclasses):
+        """
+        returns a boolean array over schemata which is True where the
+        schema hullclass id is in hullclasses, a priority level frozenset
+        """
+
+        mask = self._masks.get(hullclasses)
+        if mask is None:
+            mask = np.isin(self.hullclass_ids, list(hullclasses))
+            self._masks[hullclasses] = mask
+        return mask
+
+
+class ArrayFleet(object):
+    """
+    A fleet stored as parallel arrays.
+
+    Rows are kept grouped by schema index (expand_array_fleet creates them
+    that way and pruning preserves order) so each ship type is a
+    contiguous slice.
+    """
+
+    def __init__(self, tables, schema_index, shield, armor, hull, debuffs, ship_count):
+        self.tables = tables
+        self.schema_index = schema_index
+        self.shield = shield
+        self.armor = armor
+        self.hull = hull
+        self.debuffs = debuffs
+        self.ship_count = ship_count
+
+    def __len__(self):
+        return len(self.schema_index)
+
+    def copy(self):
+        return ArrayFleet(self.tables, self.schema_index, self.shield.copy(),
+            self.armor.copy(), self.hull.copy(), self.debuffs.copy(),
+            self.ship_count)
+
+    def schema_bounds(self):
+        """
+        returns an array where rows bounds[k]:bounds[k+1] are the ships
+        using schema k
+        """
+        return np.searchsorted(self.schema_index,
+            np.arange(len(self.tables.schemata) + 1))
+
+    @property
+    def ships(self):
+        """
+        The fleet as a list of Ship namedtuples, for callers expecting a
+        Fleet from idleiss.battle.
+        """
+        schemata = self.tables.schemata
+        result = []
+        for index, shield, armor, hull, debuffs in zip(self.schema_index.tolist(),
+                self.shield.tolist(), self.armor.tolist(), self.hull.tolist(),
+                self.debuffs.tolist()):
+            result.append(Ship(
+                schemata[index],
+                ShipAttributes(shield, armor, hull),
+                ShipDebuffs(*debuffs) if any(debuffs) else None,
+            ))
+        return result
+
+
+def expand_array_fleet(ship_count, library):
+    """
+    Array counterpart to idleiss.battle.expand_fleet.
+    """
+
+    schemata = [library.get_ship_schemata(ship_type) for ship_type in ship_count]
+    tables = FleetTables(schemata)
+    schema_index = np.repeat(np.arange(len(schemata), dtype=np.int64),
+        [ship_count[ship_type] for ship_type in ship_count])
+    return ArrayFleet(
+        tables,
+        schema_index,
+        tables.shield[schema_index],
+        tables.armor[schema_index],
+        tables.hull[schema_index],
+        np.zeros((len(schema_index), len(debuff_effects)), dtype=np.float64),
+        ship_count,
+    )
+
+
+def array_true_damage(damage, weapon_size, target_size, tracking_disruption,
+        target_painter, web):
+    """
+    Vectorized idleiss.battle.true_damage, returns an int64 array.
+    """
+
+    true_weapon_size = (weapon_size * np.maximum(1 - web, 0)) * (1 + tracking_disruption)
+    true_target_size = target_size * (1 + target_painter)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        damage_factor = np.where(true_weapon_size <= true_target_size, 1.0,
+            (true_target_size ** 2) / (true_weapon_size ** 2))
+    raw = damage_factor * damage
+    return np.where(raw < 0, 0, np.ceil(raw)).astype(np.int64)
+
+
+def _target_groups(victim, candidates, priority_targets):
+    """
+    Split the candidate rows by priority level.  Returns a list of non-empty
+    arrays: one per priority level (ships already claimed by an earlier
+    level are not repeated) followed by every remaining candidate.
+    """
+
+    if not priority_targets:
+        return [candidates]
+    candidate_schemata = victim.schema_index[candidates]
+    remaining = np.ones(len(candidates), dtype=bool)
+    groups = []
+    for level in priority_targets:
+        in_level = victim.tables.hullclass_mask(level)[candidate_schemata] & remaining
+        if in_level.any():
+            groups.append(candidates[in_level])
+            remaining &= ~in_level
+    if remaining.any():
+        groups.append(candidates[remaining])
+    return groups
+
+
+def _aoe_kernel(pool, offsets, shooters, area_of_effect, draws,
+        out_shooters, out_targets):
+    """
+    Shot resolution for area of effect weapons.  pool holds the target
+    groups back to back, group g is pool[offsets[g]:offsets[g + 1]].  Each
+    shooter takes up to area_of_effect distinct targets, from the highest
+    priority group first, using a partial Fisher-Yates shuffle of the
+    group driven by draws, area_of_effect uniform numbers per shooter.
+    pool is shuffled in place.  The hits are written to out_shooters and
+    out_targets, returns how many there are.
+
+    Written for both numba.njit and plain python, which gets lists.
+    """
+
+    hits = 0
+    for s in range(len(shooters)):
+        needed = area_of_effect
+        draw = s * area_of_effect
+        for g in range(len(offsets) - 1):
+            start = offsets[g]
+            size = offsets[g + 1] - start
+            if size <= needed:
+                for i in range(start, start + size):
+                    out_shooters[hits] = shooters[s]
+                    out_targets[hits] = pool[i]
+                    hits += 1
+                needed -= size
+            else:
+                for j in range(needed):
+                    k = j + int(draws[draw] * (size - j))
+                    if k >= size: # draws[draw] rounded up to 1.0
+                        k = size - 1
+                    draw += 1
+                    chosen = pool[start + k]
+                    pool[start + k] = pool[start + j]
+                    pool[start + j] = chosen
+                    out_shooters[hits] = shooters[s]
+                    out_targets[hits] = chosen
+                    hits += 1
+                needed = 0
+            if needed == 0:
+                break
+    return hits
+
+
+if numba is not None:
+    _aoe_kernel_jit = numba.njit(cache=True)(_aoe_kernel)
+else:
+    _aoe_kernel_jit = None
+
+# use the compiled kernel when there is one
+USE_JIT = _aoe_kernel_jit is not None
+
+
+def _pick_targets(groups, shooters, area_of_effect, rng):
+    """
+    Returns (shooter rows, target rows) for one weapon fired by every
+    shooter.  Each shooter hits up to area_of_effect distinct targets,
+    taking them from the highest priority group first.
+    """
+
+    if area_of_effect == 1:
+        pool = groups[0]
+        return shooters, pool[rng.integers(0, len(pool), len(shooters))]
+
+    pool = np.concatenate(groups)
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(group) for group in groups], out=offsets[1:])
+    draws = rng.random(len(shooters) * area_of_effect)
+    capacity = len(shooters) * min(area_of_effect, len(pool))
+    if USE_JIT:
+        hit_shooters = np.empty(capacity, dtype=np.int64)
+        hit_targets = np.empty(capacity, dtype=np.int64)
+        hits = _aoe_kernel_jit(pool, offsets, shooters, area_of_effect, draws,
+            hit_shooters, hit_targets)
+        return hit_shooters[:hits], hit_targets[:hits]
+    # element access is much faster on lists than arrays in plain python
+    hit_shooters = [0] * capacity
+    hit_targets = [0] * capacity
+    hits = _aoe_kernel(pool.tolist(), offsets.tolist(), shooters.tolist(),
+        area_of_effect, draws.tolist(), hit_shooters, hit_targets)
+    return (np.array(hit_shooters[:hits], dtype=np.int64),
+        np.array(hit_targets[:hits], dtype=np.int64))
+
+
+def array_fleet_attack(fleet_a, fleet_b, current_round_number, rng):
+    """
+    Array counterpart to idleiss.battle.fleet_attack.
+
+    fleet_b is not modified, the damaged fleet in the AttackResult is a copy.
+    Damage and kills on a ship hit by several ship types of fleet_a are
+    split between them in the stats, in proportion to the damage each
+    type fired at it.
+    """
+
+    candidates = np.flatnonzero(~fleet_b.tables.is_structure[fleet_b.schema_index])
+    if len(candidates) == 0:
+        return AttackResult(fleet_a, fleet_b.copy(), 0, 0, {})
+
+    bounds = fleet_a.schema_bounds()
+    free = fleet_a.debuffs[:, ECM] == 0
+    hits = []
+    # shots per schema index of fleet_a
+    shots = {}
+
+    for schema_index, weapon in fleet_a.tables.firing(current_round_number):
+        rows = np.arange(bounds[schema_index], bounds[schema_index + 1])
+        shooters = rows[free[rows]]
+        if len(rows) == 0:
+            continue
+        shots.setdefault(schema_index, 0)
+        if len(shooters) == 0:
+            continue
+        if weapon.firepower > 0:
+            shots[schema_index] += len(shooters)
+        groups = _target_groups(fleet_b, candidates, weapon.priority_targets)
+        hit_shooters, hit_targets = _pick_targets(
+            groups, shooters, weapon.area_of_effect, rng)
+        hits.append((schema_index, weapon, hit_shooters, hit_targets))
+
+    result = fleet_b.copy()
+    if not hits:
+        return AttackResult(fleet_a, result, sum(shots.values()), 0,
+            _array_stats(fleet_a, shots, {}, None, None))
+
+    incoming = np.zeros(len(fleet_b), dtype=np.int64)
+    # damage fired at each ship, per schema index of fleet_a
+    incoming_by_type = {}
+    debuffs = result.debuffs
+    hit_rows = np.concatenate([targets for index, weapon, shooters, targets in hits])
+    debuffs[hit_rows, ECM] = 0  # any hit that does not jam clears ECM
+    target_tables = fleet_b.tables
+
+    for schema_index, weapon, hit_shooters, hit_targets in hits:
+        if weapon.firepower > 0:
+            damage = array_true_damage(
+                weapon.firepower,
+                weapon.weapon_size,
+                target_tables.size[fleet_b.schema_index[hit_targets]],
+                fleet_a.debuffs[hit_shooters, TRACKING_DISRUPTION],
+                fleet_b.debuffs[hit_targets, TARGET_PAINTER],
+                fleet_b.debuffs[hit_targets, WEB],
+            )
+            weapon_incoming = np.bincount(hit_targets, weights=damage,
+                minlength=len(fleet_b)).astype(np.int64)
+            incoming += weapon_incoming
+            if schema_index in incoming_by_type:
+                incoming_by_type[schema_index] += weapon_incoming
+            else:
+                incoming_by_type[schema_index] = weapon_incoming
+
+        new_debuffs = weapon.debuffs
+        for column in (TARGET_PAINTER, TRACKING_DISRUPTION, WEB):
+            if new_debuffs[column]:
+                np.maximum.at(debuffs[:, column], hit_targets, new_debuffs[column])
+        if new_debuffs.ECM != 0:
+            # only ships that were not jammed at the start of the round roll
+            rollers = hit_targets[fleet_b.debuffs[hit_targets, ECM] == 0]
+            sensor_strength = target_tables.sensor_strength[fleet_b.schema_index[rollers]]
+            rolls = rng.random(len(rollers))
+            with np.errstate(divide="ignore"):
+                jammed = (sensor_strength == 0) | (
+                    rolls < float(new_debuffs.ECM) / sensor_strength)
+            np.maximum.at(debuffs[:, ECM], rollers[jammed], new_debuffs.ECM)
+
+    immune = target_tables.ecm_immune[fleet_b.schema_index[hit_rows]]
+    debuffs[hit_rows[immune]] = 0
+
+    shield = result.shield - incoming
+    armor = result.armor + np.minimum(shield, 0)
+    hull = result.hull + np.minimum(armor, 0)
+    np.maximum(shield, 0, out=result.shield)
+    np.maximum(armor, 0, out=result.armor)
+    np.maximum(hull, 0, out=result.hull)
+
+    lost = ((fleet_b.shield + fleet_b.armor + fleet_b.hull)
+        - (result.shield + result.armor + result.hull))
+    damage = int(lost.sum())
+    stats = _array_stats(fleet_a, shots, incoming_by_type, incoming,
+        (lost, (fleet_b.hull > 0) & (result.hull <= 0)))
+    return AttackResult(fleet_a, result, sum(shots.values()), damage, stats)
+
+
+def _array_stats(fleet_a, shots, incoming_by_type, incoming, outcome):
+    # {ship type: AttackStats} of fleet_a, outcome is the (hp lost,
+    # destroyed) arrays of the victims
+    stats = {}
+    for schema_index, type_shots in shots.items():
+        damage = 0
+        kills = 0
+        type_incoming = incoming_by_type.get(schema_index)
+        if type_incoming is not None:
+            lost, destroyed = outcome
+            share = np.divide(type_incoming, incoming,
+                out=np.zeros(len(incoming)), where=incoming > 0)
+            damage = float((lost * share).sum())
+            kills = float((destroyed * share).sum())
+        stats[fleet_a.tables.names[schema_index]] = AttackStats(type_shots, damage, kills)
+    return stats
+
+
+def array_repair_fleet(fleet, rng):
+    """
+    Array counterpart to idleiss.battle.repair_fleet, repairs in place.
+    """
+
+    tables = fleet.tables
+    schema_index = fleet.schema_index
+    free = fleet.debuffs[:, ECM] == 0
+
+    for attribute, maximum, remote_repair in (
+            (fleet.shield, tables.shield, tables.remote_shield_repair),
+            (fleet.armor, tables.armor, tables.remote_armor_repair)):
+        amounts = remote_repair[schema_index[free]]
+        amounts = amounts[amounts > 0]
+        if len(amounts) == 0:
+            continue
+        ship_maximum = maximum[schema_index]
+        damaged = np.flatnonzero(attribute != ship_maximum)
+        if len(damaged) == 0:
+            continue
+        rep_targets = damaged[rng.integers(0, len(damaged), len(amounts))]
+        np.add.at(attribute, rep_targets, amounts)
+        np.minimum(attribute, ship_maximum, out=attribute)
+
+    return fleet
+
+
+def array_prune_fleet(attack_result):
+    """
+    Array counterpart to idleiss.battle.prune_fleet.
+    """
+
+    fleet = attack_result.damaged_fleet
+    tables = fleet.tables
+    alive = fleet.hull > 0
+    schema_index = fleet.schema_index[alive]
+    shield = np.minimum(tables.shield[schema_index],
+        fleet.shield[alive] + tables.local_shield_repair[schema_index])
+    armor = np.minimum(tables.armor[schema_index],
+        fleet.armor[alive] + tables.local_armor_repair[schema_index])
+    counts = np.bincount(schema_index, minlength=len(tables.schemata)).tolist()
+    ship_count = {name: count for name, count in zip(tables.names, counts) if count}
+    return ArrayFleet(tables, schema_index, shield, armor, fleet.hull[alive],
+        fleet.debuffs[alive], ship_count)
@@ -0,0 +1,143 @@
+"""
+Phase profiler for Battle.
+
+Pass a BattleProfiler as Battle(..., instrument=profiler) to collect the
+wall time and call count of every battle phase, and with memory=True the
+memory blocks each round allocates.  The battle wraps the phase functions it calls in the timers of
+its own instrument, the engine modules are never touched: a Battle without
+an instrument runs exactly the code it always did, and battles profiled by
+other instruments, or by none, are not counted.
+
+Phases, by engine:
+
+    python: fleet_attack, ship_attack, grab_debuffs, repair_fleet, prune_fleet
+    numpy: fleet_attack, repair_fleet, prune_fleet
+    expected: fleet_attack, apply_attack
+    lanchester: fleet_attack
+
+Times are inclusive: fleet_attack contains the ship_attack and
+grab_debuffs calls it makes.
+
+Memory is traced with tracemalloc, which slows every allocation down and
+distorts the timings, so it is off unless asked for.  allocated_blocks
+counts the blocks a round allocated that were still alive at its end,
+summed per source line from tracemalloc snapshots; blocks allocated and
+freed within the round only show in peak_bytes.
+"""
+
+from collections import namedtuple
+import contextlib
+import time
+import tracemalloc
+
+# leave out what taking the snapshots allocates
+_SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+RoundProfile = namedtuple("RoundProfile",
+    ["round_number", "seconds", "allocated_blocks", "peak_bytes"])
+
+
+class BattleProfiler(object):
+    """
+    Collects, over every round it measures:
+
+        times: {phase: seconds}
+        calls: {phase: number of calls}
+        rounds: a RoundProfile per round.  allocated_blocks is the number
+            of memory blocks the round allocated and still held at its end,
+            peak_bytes the most memory it had allocated at once, both None
+            without memory
+    """
+
+    def __init__(self, memory=False, phases=None):
+        """
+        memory: trace the memory blocks of every round
+        phases: names of the phases to time, every phase when None.  The
+            others run unwrapped, e.g. to keep the per shot ship_attack
+            timers out of a benchmark.
+        """
+
+        self.memory = memory
+        self.phases = phases
+        self.times = {}
+        self.calls = {}
+        self.rounds = []
+
+    def timed(self, phase, function):
+        """
+        function, its time and calls counted as phase, function itself
+        when phase is not timed.
+        """
+
+        if self.phases is not None and phase not in self.phases:
+            return function
+        times = self.times
+        calls = self.calls
+
+        def timed(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return function(*a, **kw)
+            finally:
+                times[phase] = times.get(phase, 0.0) + time.perf_counter() - start
+                calls[phase] = calls.get(phase, 0) + 1
+        return timed
+
+    @contextlib.contextmanager
+    def round(self, current_round_number):
+        """
+        Context manager measuring one round, Battle.calculate_round
+        enters it.
+        """
+
+        if not self.memory:
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.rounds.append(RoundProfile(current_round_number,
+                    time.perf_counter() - start, None, None))
+            return
+
+        # trace only while the round is fought, unless someone else already
+        # is; their peak is reset where Python can (3.9+)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            if not tracing:
+                tracemalloc.stop()
+            blocks = sum(max(stat.count_diff, 0)
+                for stat in after.compare_to(before, "lineno"))
+            self.rounds.append(RoundProfile(current_round_number, seconds,
+                blocks, max(peak - current, 0)))
+
+    def report(self):
+        """
+        The collected numbers as a printable table.
+        """
+
+        total = sum(profile.seconds for profile in self.rounds)
+        lines = [f"{'phase':14} {'calls':>9} {'seconds':>10} {'share':>7}"]
+        for phase, seconds in sorted(self.times.items(), key=lambda item: -item[1]):
+            share = seconds / total if total else 0.0
+            lines.append(f"{phase:14} {self.calls[phase]:>9} {seconds:>10.4f} {share:>7.1%}")
+        lines.append("")
+        lines.append(f"{'round':>5} {'seconds':>10} {'allocated blocks':>17} {'peak bytes':>12}")
+        for profile in self.rounds:
+            blocks = "-" if profile.allocated_blocks is None else profile.allocated_blocks
+            peak = "-" if profile.peak_bytes is None else profile.peak_bytes
+            lines.append(f"{profile.round_number:>5} {profile.seconds:>10.4f} "
+                f"{blocks:>17} {peak:>12}")
+        lines.append(f"{'total':>5} {total:>10.4f}")
+        return "\n".join(lines)
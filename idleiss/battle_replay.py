@@ -0,0 +1,406 @@
+"""
+Compact binary replay logs of python engine battles.
+
+Pass a BattleRecorder as Battle(..., recorder=recorder) and it writes, to
+any binary stream, the starting fleets followed by one block of deltas per
+round: every hit as (shooter, target, damage, killed) with the debuffs it
+left on the target when they changed, the shots each side fired, and the
+shield and armor remote repairs gave back.  Ships are referred to by their
+position in their fleet at the start of the round, the same positions the
+engine uses, so a log costs a few bytes per hit no matter how large the
+fleets are.
+
+BattleReplay reads a log back.  It indexes the rounds when opened, then
+gives the events of any round and rebuilds the fleets at the start of any
+round by applying the deltas, so a log can be stepped through, seeked or
+streamed without the ship library.
+
+Layout, little endian:
+
+    b"IRPL", version (H), ship type count (H)
+    per ship type: name length (H), utf-8 name,
+        shield, armor, hull, local shield repair, local armor repair (5I)
+    per side, attacker first: run count (I), runs of (type index, count) (2I)
+    per round: round number, byte length of the rest of the round (2I)
+        per attack, the attacker's first:
+            shots, hits, debuff changes (3I)
+            hits as (shooter, target, damage, killed) (4I each)
+            index of the hit that changed the debuffs (I each)
+            the new debuffs (4d each)
+        per fleet, the attacker's first: repairs (I)
+            repairs as (target, shield, armor) (3I each)
+"""
+
+from array import array
+from collections import namedtuple
+import io
+import struct
+import sys
+
+from idleiss.ship import ShipDebuffs
+
+MAGIC = b"IRPL"
+VERSION = 1
+
+_header = struct.Struct("<4sHH")
+_name = struct.Struct("<H")
+_ship_type = struct.Struct("<5I")
+_count = struct.Struct("<I")
+_round = struct.Struct("<II")
+_attack = struct.Struct("<III")
+
+ReplayShipType = namedtuple("ReplayShipType",
+    ["name", "shield", "armor", "hull", "local_shield_repair", "local_armor_repair"])
+# debuffs is None when the hit left the target's debuffs as they were
+ReplayHit = namedtuple("ReplayHit", ["shooter", "target", "damage", "killed", "debuffs"])
+ReplayAttack = namedtuple("ReplayAttack", ["shots", "hits"])
+ReplayRepair = namedtuple("ReplayRepair", ["target", "shield", "armor"])
+# attacks and repairs are (attacker's, defender's) pairs, the hits of the
+# attacker's attack land on the defender's fleet
+ReplayRound = namedtuple("ReplayRound", ["round_number", "attacks", "repairs"])
+
+_no_debuffs = ShipDebuffs(0.0, 0.0, 0.0, 0.0)
+
+def _packed(values):
+    # arrays are written little endian whatever the machine
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def _unpacked(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class _FleetEvents(object):
+    """
+    What happened to one fleet during the round being recorded.
+    """
+
+    __slots__ = ("hits", "debuff_hits", "debuffs", "repairs")
+
+    def __init__(self):
+        self.hits = array("I")
+        self.debuff_hits = array("I")
+        self.debuffs = array("d")
+        self.repairs = array("I")
+
+
+class BattleRecorder(object):
+    """
+    Writes the replay log of a Battle to stream, a BytesIO by default.
+
+    The engine reports to it through start, hit, repair and end_round,
+    a round is written once it is over.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = io.BytesIO() if stream is None else stream
+        self.rounds = 0
+        self._events = {}
+
+    def getvalue(self):
+        """
+        The log written so far, when stream is a BytesIO.
+        """
+
+        return self.stream.getvalue()
+
+    def start(self, attacker, defender):
+        """
+        Write the header for the starting CombatFleets.
+        """
+
+        types = {}
+        for fleet in (attacker, defender):
+            for start, count, schema in fleet.runs():
+                types.setdefault(schema.name, schema)
+        index = {name: i for i, name in enumerate(types)}
+        out = [_header.pack(MAGIC, VERSION, len(types))]
+        for name, schema in types.items():
+            encoded = name.encode("utf-8")
+            out.append(_name.pack(len(encoded)))
+            out.append(encoded)
+            out.append(_ship_type.pack(schema.shield, schema.armor, schema.hull,
+                schema.buffs.local_shield_repair, schema.buffs.local_armor_repair))
+        for fleet in (attacker, defender):
+            runs = array("I")
+            for start, count, schema in fleet.runs():
+                runs.extend((index[schema.name], count))
+            out.append(_count.pack(len(runs) // 2))
+            out.append(_packed(runs))
+        self.stream.write(b"".join(out))
+
+    def _fleet_events(self, fleet):
+        events = self._events.get(id(fleet))
+        if events is None:
+            events = self._events[id(fleet)] = _FleetEvents()
+        return events
+
+    def hit(self, fleet, shooter, target, lost, victim, debuffs):
+        """
+        victim, at position target of fleet, was hit by the ship at
+        position shooter of the other side and lost lost hit points,
+        debuffs are the ones it had before the hit.
+        """
+
+        changed = victim.debuffs is not debuffs and victim.debuffs != debuffs
+        if not lost and not changed:
+            return
+        events = self._fleet_events(fleet)
+        if changed:
+            events.debuff_hits.append(len(events.hits) // 4)
+            events.debuffs.extend(victim.debuffs)
+        events.hits.extend((shooter, target, lost, victim.hull <= 0))
+
+    def repair(self, fleet, target, shield, armor):
+        """
+        The ship at position target of fleet got shield and armor back.
+        """
+
+        self._fleet_events(fleet).repairs.extend((target, shield, armor))
+
+    def end_round(self, current_round_number, attacker_result, defender_result):
+        """
+        Write the round, attacker_result and defender_result are the
+        AttackResults that damaged the attacker and the defender.
+        """
+
+        attacker = self._events.pop(id(attacker_result.damaged_fleet), None) or _FleetEvents()
+        defender = self._events.pop(id(defender_result.damaged_fleet), None) or _FleetEvents()
+        self._events.clear()
+        out = []
+        for shots, events in ((defender_result.hits_taken, defender),
+                (attacker_result.hits_taken, attacker)):
+            out.append(_attack.pack(shots, len(events.hits) // 4, len(events.debuff_hits)))
+            out.append(_packed(events.hits))
+            out.append(_packed(events.debuff_hits))
+            out.append(_packed(events.debuffs))
+        for events in (attacker, defender):
+            out.append(_count.pack(len(events.repairs) // 3))
+            out.append(_packed(events.repairs))
+        body = b"".join(out)
+        self.stream.write(_round.pack(current_round_number, len(body)))
+        self.stream.write(body)
+        self.rounds += 1
+
+
+class ReplayFleet(object):
+    """
+    One side of a replayed battle, a ship per position:
+
+        types, shield, armor, hull: lists with the ReplayShipType and hit
+            points of every ship
+        debuffs: list of ShipDebuffs, values read back as floats
+    """
+
+    def __init__(self, types, shield, armor, hull, debuffs):
+        self.types = types
+        self.shield = shield
+        self.armor = armor
+        self.hull = hull
+        self.debuffs = debuffs
+
+    @classmethod
+    def from_runs(cls, runs):
+        types = []
+        for ship_type, count in runs:
+            types.extend([ship_type] * count)
+        return cls(types,
+            [ship_type.shield for ship_type in types],
+            [ship_type.armor for ship_type in types],
+            [ship_type.hull for ship_type in types],
+            [_no_debuffs] * len(types))
+
+    def __len__(self):
+        return len(self.types)
+
+    def copy(self):
+        return ReplayFleet(list(self.types), list(self.shield), list(self.armor),
+            list(self.hull), list(self.debuffs))
+
+    @property
+    def ship_count(self):
+        count = {}
+        for ship_type in self.types:
+            count[ship_type.name] = count.get(ship_type.name, 0) + 1
+        return count
+
+    def apply_hits(self, hits):
+        shield = self.shield
+        armor = self.armor
+        hull = self.hull
+        for hit in hits:
+            k = hit.target
+            if hit.debuffs is not None:
+                self.debuffs[k] = hit.debuffs
+            # same order as idleiss.battle.combat_ship_attack
+            remaining_shield = shield[k] - hit.damage
+            remaining_armor = armor[k] + min(remaining_shield, 0)
+            hull[k] = max(0, hull[k] + min(remaining_armor, 0))
+            shield[k] = max(0, remaining_shield)
+            armor[k] = max(0, remaining_armor)
+
+    def apply_repairs(self, repairs):
+        for repair in repairs:
+            self.shield[repair.target] += repair.shield
+            self.armor[repair.target] += repair.armor
+
+    def prune(self):
+        """
+        Drop the wrecks and apply local repairs, as combat_prune_fleet.
+        """
+
+        alive = [k for k, hull in enumerate(self.hull) if hull > 0]
+        if len(alive) != len(self.hull):
+            self.types = [self.types[k] for k in alive]
+            self.shield = [self.shield[k] for k in alive]
+            self.armor = [self.armor[k] for k in alive]
+            self.hull = [self.hull[k] for k in alive]
+            self.debuffs = [self.debuffs[k] for k in alive]
+        for k, ship_type in enumerate(self.types):
+            if self.shield[k] < ship_type.shield:
+                self.shield[k] = min(ship_type.shield,
+                    self.shield[k] + ship_type.local_shield_repair)
+            if self.armor[k] < ship_type.armor:
+                self.armor[k] = min(ship_type.armor,
+                    self.armor[k] + ship_type.local_armor_repair)
+
+
+class BattleReplay(object):
+    """
+    Reader for a log written by BattleRecorder, data is any bytes-like
+    object holding it, e.g. the contents of a file or an mmap.
+
+        types: the ReplayShipTypes in the log
+        len(replay): number of rounds
+        replay[k]: ReplayRound of the k-th round fought
+        replay.fleets(k): (attacker, defender) ReplayFleets at the start of
+            the k-th round, replay.fleets(len(replay)) is the outcome
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data).cast("B")
+        magic, version, type_count = _header.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError("BattleReplay: not a battle replay log")
+        if version != VERSION:
+            raise ValueError(f"BattleReplay: unsupported log version {version}")
+        offset = _header.size
+        self.types = []
+        for _ in range(type_count):
+            length, = _name.unpack_from(self.data, offset)
+            offset += _name.size
+            name = bytes(self.data[offset:offset + length]).decode("utf-8")
+            offset += length
+            self.types.append(ReplayShipType(name, *_ship_type.unpack_from(self.data, offset)))
+            offset += _ship_type.size
+        self.runs = []
+        for _ in range(2):
+            count, = _count.unpack_from(self.data, offset)
+            offset += _count.size
+            runs = self._array("I", offset, 2 * count)
+            offset += runs.itemsize * len(runs)
+            self.runs.append([(self.types[runs[i]], runs[i + 1])
+                for i in range(0, len(runs), 2)])
+        # start of every round block, skipping over the bodies
+        self.offsets = []
+        while offset < len(self.data):
+            self.offsets.append(offset)
+            round_number, length = _round.unpack_from(self.data, offset)
+            offset += _round.size + length
+        # fleets at the start of a round, forward seeks continue from it
+        self._position = 0
+        self._fleets = self._start()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, k):
+        return self._read_round(self.offsets[k])
+
+    def __iter__(self):
+        for offset in self.offsets:
+            yield self._read_round(offset)
+
+    def _array(self, typecode, offset, count):
+        size = array(typecode).itemsize
+        return _unpacked(typecode, self.data[offset:offset + size * count])
+
+    def _start(self):
+        return tuple(ReplayFleet.from_runs(runs) for runs in self.runs)
+
+    def _read_round(self, offset):
+        round_number, length = _round.unpack_from(self.data, offset)
+        offset += _round.size
+        attacks = []
+        for _ in range(2):
+            shots, hit_count, debuff_count = _attack.unpack_from(self.data, offset)
+            offset += _attack.size
+            packed = self._array("I", offset, 4 * hit_count)
+            offset += 16 * hit_count
+            debuff_hits = self._array("I", offset, debuff_count)
+            offset += 4 * debuff_count
+            values = self._array("d", offset, 4 * debuff_count)
+            offset += 32 * debuff_count
+            debuffs = {k: ShipDebuffs(*values[4 * i:4 * i + 4])
+                for i, k in enumerate(debuff_hits)}
+            attacks.append(ReplayAttack(shots, [
+                ReplayHit(packed[4 * k], packed[4 * k + 1], packed[4 * k + 2],
+                    bool(packed[4 * k + 3]), debuffs.get(k))
+                for k in range(hit_count)]))
+        repairs = []
+        for _ in range(2):
+            count, = _count.unpack_from(self.data, offset)
+            offset += _count.size
+            packed = self._array("I", offset, 3 * count)
+            offset += 12 * count
+            repairs.append([ReplayRepair(*packed[3 * k:3 * k + 3]) for k in range(count)])
+        return ReplayRound(round_number, tuple(attacks), tuple(repairs))
+
+    def apply(self, attacker, defender, replay_round):
+        """
+        Apply replay_round to the fleets at its start, in place.
+        """
+
+        attacker_attack, defender_attack = replay_round.attacks
+        defender.apply_hits(attacker_attack.hits)
+        attacker.apply_hits(defender_attack.hits)
+        attacker.apply_repairs(replay_round.repairs[0])
+        defender.apply_repairs(replay_round.repairs[1])
+        defender.prune()
+        attacker.prune()
+
+    def fleets(self, k):
+        """
+        Copies of the (attacker, defender) ReplayFleets at the start of the
+        k-th round.  Seeking forward continues from the last seek, seeking
+        back replays from the starting fleets.
+        """
+
+        if not 0 <= k <= len(self):
+            raise ValueError(f"BattleReplay: no round {k} in a {len(self)} round log")
+        if k < self._position:
+            self._position = 0
+            self._fleets = self._start()
+        attacker, defender = self._fleets
+        for offset in self.offsets[self._position:k]:
+            self.apply(attacker, defender, self._read_round(offset))
+        self._position = k
+        return attacker.copy(), defender.copy()
+
+    def replay(self):
+        """
+        Generator yielding (ReplayRound, attacker, defender) for every
+        round, with the fleets as they are at the end of the round.  The
+        same two ReplayFleets are updated in place from round to round.
+        """
+
+        attacker, defender = self._start()
+        for replay_round in self:
+            self.apply(attacker, defender, replay_round)
+            yield replay_round, attacker, defender
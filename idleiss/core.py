@@ -149,10 +149,15 @@ class MessageManager(object):
 
 class GameEngine(object):
 
-    def __init__(self, universe_filename, library_filename, scanning_filename, savedata=None):
+    def __init__(self, universe_filename, library_filename, scanning_filename, savedata=None,
+            universe_snapshot=None):
+        """
+        universe_snapshot: cache file of the generated universe, see
+            Universe.load.  None always generates it.
+        """
         self.users = {}
         self.current_channel_list = set()
-        self.universe = Universe(universe_filename)
+        self.universe = Universe(universe_filename, universe_snapshot)
         self.library = ShipLibrary(library_filename)
         self.scanning = Scanning(scanning_filename, self.library)
 
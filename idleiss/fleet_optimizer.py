@@ -0,0 +1,273 @@
+"""
+Cheapest fleet search for site encounters.
+
+find_cheapest_fleet looks for the least expensive fleet of ShipLibrary
+ships that beats a defending fleet, e.g. the ships of a scan site, in at
+least a given share of battles.  Candidates come in families, each a fixed
+ratio of one or two ship types scaled up ship by ship; every family is
+searched for its smallest winning size.  A candidate is only simulated
+when it would be cheaper than the best fleet found so far and the fast
+estimators (the lanchester engine, falling back to the expected engine)
+say it wins.  Simulations run in batches of seeds spread over a process
+pool and a candidate is decided as soon as the batches settle it either
+way.
+
+The search assumes a bigger fleet of the same family never does worse,
+and the estimators are only a screen: a candidate they write off is never
+simulated.  Pass screen=False to simulate everything.
+"""
+
+from collections import namedtuple
+import itertools
+import math
+import os
+import random
+import time
+
+from idleiss.battle import Battle
+from idleiss.montecarlo import SamplePool
+from idleiss.montecarlo import run_samples
+
+# success_rate is over the battles fought before the fleet was settled,
+# candidates counts the distinct fleets looked at, screened the ones the
+# estimators wrote off and simulated the ones given battles
+FleetSearch = namedtuple("FleetSearch", [
+    "fleet",
+    "cost",
+    "success_rate",
+    "candidates",
+    "screened",
+    "simulated",
+    "battles",
+    "complete",
+])
+
+# ratios tried for every pair of ship types
+PAIR_RATIOS = ((1, 3), (1, 1), (3, 1))
+
+# share of the defending ships the fast estimators may leave alive before a
+# candidate is written off without simulating it
+SCREEN_MARGIN = 0.5
+
+COST_WEIGHTS = {"money": 1, "basic_materials": 1, "advanced_materials": 1}
+
+def ship_cost(schema, weights=COST_WEIGHTS):
+    """
+    The cost of one ship as a single number, weights is
+    {cost type: value of one unit}.
+    """
+
+    return sum(weights.get(kind, 0) * amount for kind, amount in schema.cost.items())
+
+def fleet_cost(fleet, library, weights=COST_WEIGHTS):
+    return sum(count * ship_cost(library.get_ship_schemata(name), weights)
+        for name, count in fleet.items())
+
+def scaled_fleet(ratio, size):
+    """
+    size ships split over the ship types of ratio, {ship type: weight},
+    rounding goes to the first type.
+    """
+
+    total = sum(ratio.values())
+    fleet = {name: size * weight // total for name, weight in ratio.items()}
+    first = next(iter(fleet))
+    fleet[first] += size - sum(fleet.values())
+    return {name: count for name, count in fleet.items() if count > 0}
+
+def _families(ship_types):
+    for name in ship_types:
+        yield {name: 1}
+    for a, b in itertools.combinations(ship_types, 2):
+        for weight_a, weight_b in PAIR_RATIOS:
+            yield {a: weight_a, b: weight_b}
+
+
+class _Search(object):
+    """
+    State of one find_cheapest_fleet call.
+    """
+
+    def __init__(self, defender, max_rounds, library, success, seeds,
+            batch_size, workers, pool, engine, screen, deadline):
+        self.defender = defender
+        self.max_rounds = max_rounds
+        self.library = library
+        self.success = success
+        self.seeds = seeds
+        self.batch_size = batch_size
+        self.workers = workers
+        self.pool = pool
+        self.engine = engine
+        self.screen = screen
+        self.deadline = deadline
+        # {canonical fleet: success rate, None when it was written off}
+        self.results = {}
+        self.screened = 0
+        self.simulated = 0
+        self.battles = 0
+
+    def out_of_time(self):
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def _hopeless(self, fleet):
+        # the estimators are rough, only write off fleets expected to
+        # leave more than SCREEN_MARGIN of the defending ships alive
+        battle_instance = Battle(fleet, self.defender, self.max_rounds, self.library,
+            engine="lanchester", fallback_engine="expected", keep_rounds=False)
+        return (sum(battle_instance.defender_result.values())
+            > SCREEN_MARGIN * sum(self.defender.values()))
+
+    def _run_batch(self, fleet, seeds):
+        if self.pool is None:
+            return run_samples(fleet, self.defender, self.max_rounds, self.library,
+                seeds, self.engine)
+        chunk_size = max(1, math.ceil(len(seeds) / self.workers))
+        futures = [self.pool.submit(fleet, self.defender, self.max_rounds,
+                seeds[i:i + chunk_size], self.engine)
+            for i in range(0, len(seeds), chunk_size)]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def _simulate(self, fleet):
+        # stop as soon as the remaining batches can't change the verdict
+        samples = len(self.seeds)
+        allowed_losses = samples - math.ceil(self.success * samples)
+        wins = losses = 0
+        self.simulated += 1
+        for start in range(0, samples, self.batch_size):
+            results = self._run_batch(fleet, self.seeds[start:start + self.batch_size])
+            self.battles += len(results)
+            for result in results:
+                if (any(result.attacker_result.values())
+                        and not any(result.defender_result.values())):
+                    wins += 1
+                else:
+                    losses += 1
+            if losses > allowed_losses or wins >= samples - allowed_losses:
+                break
+        if losses > allowed_losses:
+            return None
+        return wins / (wins + losses)
+
+    def evaluate(self, fleet):
+        """
+        The success rate of fleet, None when it falls short.
+        """
+
+        key = tuple(sorted(fleet.items()))
+        if key not in self.results:
+            if self.screen and self._hopeless(fleet):
+                self.screened += 1
+                self.results[key] = None
+            else:
+                self.results[key] = self._simulate(fleet)
+        return self.results[key]
+
+
+def _smallest_winner(search, ratio, low, high):
+    """
+    Smallest size in (low, high] at which the ratio family wins, sizes are
+    doubled from low + 1 until one wins and then bisected.  None when high
+    loses or time runs out before a winner is found.
+    """
+
+    size = low + 1
+    while size < high:
+        if search.out_of_time():
+            return None
+        if search.evaluate(scaled_fleet(ratio, size)) is not None:
+            break
+        low = size
+        size *= 2
+    else:
+        if high <= low or search.evaluate(scaled_fleet(ratio, high)) is None:
+            return None
+        size = high
+    while size - low > 1 and not search.out_of_time():
+        middle = (low + size) // 2
+        if search.evaluate(scaled_fleet(ratio, middle)) is None:
+            low = middle
+        else:
+            size = middle
+    return size
+
+
+def find_cheapest_fleet(defender, library, max_rounds=10, success=0.95,
+        ship_types=None, max_ships=1000, samples=200, batch_size=50,
+        time_budget=None, workers=None, seed=None, engine="python",
+        screen=True, cost_weights=COST_WEIGHTS):
+    """
+    Search for the cheapest fleet that wins against defender, a
+    {ship type: count} dict such as SiteSchema.ships, in at least success
+    of samples battles of max_rounds rounds.
+
+        ship_types: ship types the fleet may use, every ship of the library
+            that is not a structure by default
+        max_ships: largest fleet considered
+        batch_size: battles simulated at once before checking whether a
+            candidate is settled
+        time_budget: seconds the search may take, None for no limit.  Once
+            spent the best fleet found so far is returned with complete
+            False.
+        workers: worker process count, None for os.cpu_count(), 1 runs
+            every battle in this process
+        seed: seed used to draw the battle seeds, every candidate is
+            fought with the same seeds
+        engine: battle engine used for the simulations
+        screen: skip candidates the fast estimators expect to lose
+        cost_weights: see ship_cost
+
+    Returns a FleetSearch, fleet is None when no fleet of at most
+    max_ships ships wins often enough.
+    """
+
+    if not 0 < success <= 1:
+        raise ValueError("find_cheapest_fleet: success must be in (0, 1]")
+    if samples < 1 or batch_size < 1:
+        raise ValueError("find_cheapest_fleet: samples and batch_size must be at least 1")
+    if ship_types is None:
+        ship_types = [name for name, schema in library.ship_data.items()
+            if not schema.is_structure]
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    seed_source = random.Random(seed)
+    seeds = [seed_source.getrandbits(64) for x in range(samples)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, batch_size)
+
+    def cost(fleet):
+        return fleet_cost(fleet, library, cost_weights)
+
+    pool = None
+    if workers > 1:
+        pool = SamplePool(library, workers)
+    search = _Search(defender, max_rounds, library, success, seeds, batch_size,
+        workers, pool, engine, screen, deadline)
+    best = best_cost = best_rate = None
+    try:
+        for ratio in _families(ship_types):
+            if search.out_of_time():
+                break
+            # largest size of the family still cheaper than the best fleet
+            high = max_ships
+            if best is not None:
+                low = 0
+                while low < high:
+                    middle = (low + high + 1) // 2
+                    if cost(scaled_fleet(ratio, middle)) < best_cost:
+                        low = middle
+                    else:
+                        high = middle - 1
+            size = _smallest_winner(search, ratio, len(ratio) - 1, high)
+            if size is not None:
+                best = scaled_fleet(ratio, size)
+                best_cost = cost(best)
+                best_rate = search.evaluate(best)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return FleetSearch(best, best_cost, best_rate, len(search.results),
+        search.screened, search.simulated, search.battles, not search.out_of_time())
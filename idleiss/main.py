@@ -1,6 +1,8 @@
 from idleiss.universe import Universe
 from idleiss.ship import ShipLibrary
 from idleiss.battle import Battle
+from idleiss.battle import ENGINES
+from idleiss.battle_profile import BattleProfiler
 from idleiss.interpreter import Interpreter
 from idleiss.scan import Scanning
 import argparse
@@ -33,6 +35,18 @@ def run():
     parser.add_argument("-b", "--simulate-battle", default=None, dest="simbattle",
         const=example_fleet_fight, nargs="?", action="store", type=str,
         help=f"Simulate a fleet fight between two fleets using a file and exit. Example file: {example_fleet_fight}")
+    parser.add_argument("-e", "--battle-engine", default="python", dest="battleengine", action="store",
+        choices=ENGINES, help="Battle engine used by --simulate-battle, defaults to python")
+    parser.add_argument("--battle-seed", default=None, dest="battleseed", action="store", type=int,
+        help="Seed used by --simulate-battle so a fight can be replayed, random if not provided")
+    parser.add_argument("--profile-battle", action="store_true", dest="battleprofile",
+        help="Print where --simulate-battle spent its time, per battle phase and per round")
+    parser.add_argument("--profile-memory", action="store_true", dest="memoryprofile",
+        help="With --profile-battle also trace the memory blocks each round allocates, slowing the battle down")
+    parser.add_argument("--site-outcomes", default=None, dest="siteoutcomes", action="store", type=str,
+        help="Precompute the outcomes of site encounters into this file, or load them from it when it is up to date")
+    parser.add_argument("--universe-snapshot", default=None, dest="universesnapshot", action="store", type=str,
+        help="Cache the generated universe in this file and load it from there while the config and code are unchanged")
     parser.add_argument("-p", "--preload", dest="interpreter_preload", action="store", type=str,
         help="if the interpreter is executed then this file will be used as the initial commands before control is "
              "given to the user")
@@ -43,7 +57,7 @@ def run():
     args = parser.parse_args()
     if args.uniconfig != default_universe_config:
         print(f"Generating universe using alternate config: {args.uniconfig}")
-    uni = Universe(args.uniconfig)
+    uni = Universe(args.uniconfig, args.universesnapshot)
     print(''.join(uni.debug_output))
     print(f"Universe successfully loaded from {args.uniconfig}")
     if args.shipsconfig != default_ships_config:
@@ -55,6 +69,9 @@ def run():
         print(f"Loading scan settings using alternate config: {args.scanconfig}")
     scanning = Scanning(args.scanconfig, library)
     print(f"Scan settings successfully loaded from {args.scanconfig}: ")
+    if args.siteoutcomes:
+        outcomes = scanning.precompute_outcomes(args.siteoutcomes)
+        print(f"\tSite outcomes for {len(outcomes.outcomes)} sites ready in {args.siteoutcomes}")
     # map generation
     if args.genallmaps:
         args.genmaps = True
@@ -93,18 +110,22 @@ def run():
     # battle simulation
     if args.simbattle:
         one_shot_only = True
-        # this must be a one_shot_due to random being reseeded
-        random.seed()
         print(f"\nSimulating fleet fight using {args.simbattle}")
         raw_data = {}
         with open(args.simbattle) as fd:
             raw_data = json.load(fd)
         if type(raw_data) != dict:
             raise ValueError("--simulate-battle was not passed a json dictionary")
+        profiler = BattleProfiler(args.memoryprofile) if args.battleprofile else None
         battle_instance = Battle(raw_data["attacker"], raw_data["defender"],
-                                 raw_data["rounds"], library)
+                                 raw_data["rounds"], library, engine=args.battleengine,
+                                 rng=random.Random(args.battleseed), keep_rounds=False,
+                                 instrument=profiler)
         print(str(battle_instance.generate_summary_text()))
-        print(f"\nBattle lasted {len(battle_instance.round_results)} rounds.")
+        print(f"\nBattle lasted {battle_instance.rounds_fought} rounds.")
+        if profiler is not None:
+            print(f"\nBattle profile ({battle_instance.engine} engine):")
+            print(profiler.report())
 
     if not one_shot_only and not args.quickrun:
         # execute interpreter
@@ -0,0 +1,172 @@
+"""
+Monte Carlo battle outcome estimation.
+
+A single Battle is one random sample.  estimate_battle runs many
+independently seeded Battles of the same fleets across a process pool and
+reports the odds.  The ship library is handed to every worker once through
+the pool initializer instead of being pickled with each task; SamplePool
+offers that pool to other modules running batches of samples.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import random
+import os
+
+import numpy as np
+
+from idleiss.battle import Battle
+
+BattleEstimate = namedtuple("BattleEstimate", [
+    "samples",
+    "attacker_win_probability",
+    "defender_win_probability",
+    "draw_probability",
+    "attacker_mean_losses",
+    "defender_mean_losses",
+    "attacker_loss_percentiles",
+    "defender_loss_percentiles",
+    "mean_rounds",
+])
+
+# SampleResult only holds plain dicts and ints so it is cheap to send back
+# from a worker process.
+SampleResult = namedtuple("SampleResult",
+    ["attacker_result", "defender_result", "rounds"])
+
+# set in each worker process by _init_worker
+_worker_library = None
+
+def _init_worker(library):
+    global _worker_library
+    _worker_library = library
+
+def run_samples(attacker, defender, max_rounds, library, seeds, engine="python"):
+    """
+    Fight one Battle per seed and return a list of SampleResult.
+    """
+
+    results = []
+    for seed in seeds:
+        battle_instance = Battle(attacker, defender, max_rounds, library,
+            engine=engine, seed=seed, keep_rounds=False)
+        results.append(SampleResult(battle_instance.attacker_result,
+            battle_instance.defender_result, battle_instance.rounds_fought))
+    return results
+
+def _run_worker_samples(attacker, defender, max_rounds, seeds, engine):
+    return run_samples(attacker, defender, max_rounds, _worker_library, seeds, engine)
+
+class SamplePool(object):
+    """
+    Process pool running batches of run_samples against one ship library,
+    handed to every worker once when it starts.  Use it as a context
+    manager or call shutdown when done.
+    """
+
+    def __init__(self, library, workers):
+        self.executor = ProcessPoolExecutor(max_workers=workers,
+            initializer=_init_worker, initargs=(library,))
+
+    def submit(self, attacker, defender, max_rounds, seeds, engine="python"):
+        """
+        Future of run_samples(attacker, defender, max_rounds, library,
+        seeds, engine) in a worker.
+        """
+
+        return self.executor.submit(_run_worker_samples, attacker, defender,
+            max_rounds, seeds, engine)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+def summarize_samples(attacker, defender, results, percentiles=(5, 50, 95)):
+    """
+    Reduce a list of SampleResult into a BattleEstimate.
+    """
+
+    samples = len(results)
+    if samples == 0:
+        raise ValueError("summarize_samples: no samples to summarize")
+    attacker_wins = defender_wins = 0
+    for result in results:
+        attacker_alive = any(result.attacker_result.values())
+        defender_alive = any(result.defender_result.values())
+        if attacker_alive and not defender_alive:
+            attacker_wins += 1
+        elif defender_alive and not attacker_alive:
+            defender_wins += 1
+
+    def losses(fleet, side):
+        mean_losses = {}
+        loss_percentiles = {}
+        for ship_type, count in fleet.items():
+            lost = np.array([count - getattr(result, side).get(ship_type, 0)
+                for result in results])
+            mean_losses[ship_type] = float(lost.mean())
+            loss_percentiles[ship_type] = {p: float(v)
+                for p, v in zip(percentiles, np.percentile(lost, percentiles))}
+        return mean_losses, loss_percentiles
+
+    attacker_mean_losses, attacker_loss_percentiles = losses(attacker, "attacker_result")
+    defender_mean_losses, defender_loss_percentiles = losses(defender, "defender_result")
+    return BattleEstimate(
+        samples,
+        attacker_wins / samples,
+        defender_wins / samples,
+        (samples - attacker_wins - defender_wins) / samples,
+        attacker_mean_losses,
+        defender_mean_losses,
+        attacker_loss_percentiles,
+        defender_loss_percentiles,
+        sum(result.rounds for result in results) / samples,
+    )
+
+def estimate_battle(attacker, defender, max_rounds, library, samples=1000,
+        seed=None, workers=None, engine="python", chunk_size=None,
+        percentiles=(5, 50, 95)):
+    """
+    Estimate the outcome of Battle(attacker, defender, max_rounds, library)
+    from independently seeded simulations.
+
+        samples: number of battles to simulate
+        seed: seed used to draw the per-battle seeds, None for a random run
+        workers: worker process count, None for os.cpu_count(), 1 runs
+            every sample in this process
+        engine: battle engine, see idleiss.battle.ENGINES
+        chunk_size: samples per task sent to a worker
+        percentiles: loss percentiles to report for each ship type
+
+    The same seed gives the same estimate regardless of workers and
+    chunk_size since every sample has its own seed.
+    """
+
+    if samples < 1:
+        raise ValueError("estimate_battle: samples must be at least 1")
+    seed_source = random.Random(seed)
+    seeds = [seed_source.getrandbits(64) for x in range(samples)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, samples)
+
+    if workers == 1:
+        results = run_samples(attacker, defender, max_rounds, library, seeds, engine)
+        return summarize_samples(attacker, defender, results, percentiles)
+
+    if chunk_size is None:
+        # a few tasks per worker keeps them busy without flooding the queue
+        chunk_size = max(1, samples // (workers * 4))
+    chunks = [seeds[i:i + chunk_size] for i in range(0, samples, chunk_size)]
+    results = []
+    with SamplePool(library, workers) as pool:
+        futures = [pool.submit(attacker, defender, max_rounds, chunk, engine)
+            for chunk in chunks]
+        for future in futures:
+            results.extend(future.result())
+    return summarize_samples(attacker, defender, results, percentiles)
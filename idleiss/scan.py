@@ -1,6 +1,9 @@
 from collections import namedtuple
+import hashlib
 import json
 
+from idleiss.site_outcomes import SiteOutcomeTable
+
 site_schema_fields = ["low_chance", "focus_height", "focus_width",
     "high_chance", "quality", "initial_description", "arrival_message",
     "duration", "success_rate", "completion_message", "basic_materials_reward",
@@ -89,6 +92,8 @@ class Scanning(object):
 
     def __init__(self, config_file, ship_library):
         self.library = ship_library
+        # SiteOutcomeTable set by precompute_outcomes
+        self.outcomes = None
         self._load(config_file)
 
     def _check_missing_keys(self, key_id, value):
@@ -105,6 +110,9 @@ class Scanning(object):
         """
         with open(filename) as fd:
             raw_data = json.load(fd)
+        # precomputed site outcomes are keyed on it, see SiteOutcomeTable
+        self.fingerprint = hashlib.sha256(
+            json.dumps(raw_data, sort_keys=True).encode("utf-8")).hexdigest()
         missing = self._check_missing_keys("", raw_data)
         if missing:
             raise ValueError(", ".join(missing) + " not found")
@@ -185,6 +193,16 @@ class Scanning(object):
     def get_site_schemata(self, site_name):
         return self.site_data[site_name]
 
+    def precompute_outcomes(self, filename, **kw):
+        """
+        Load the site outcome tables from filename, building and saving
+        them first when the file is missing or was built from other
+        configs.  kw are passed on to SiteOutcomeTable.build.
+        """
+
+        self.outcomes = SiteOutcomeTable.load_or_build(filename, self, self.library, **kw)
+        return self.outcomes
+
     def process_focus_sites(self, scannable_sites, sel_x, sel_y, rand):
         max_width = self.settings.focus_width_max
         max_height = self.settings.focus_height_max
@@ -1,5 +1,6 @@
 from collections import namedtuple
 from os.path import join, dirname, abspath
+import hashlib
 import json
 
 ship_schema_fields = ["hullclass", "shield", "armor", "hull", "weapons", "size", "sensor_strength", "cost"]
@@ -19,8 +20,90 @@ ShipBuffs = namedtuple("ShipBuffs", buff_effects)
 # weapons will have debuff_effects on them that can apply these effects
 ShipDebuffs = namedtuple("ShipDebuffs", debuff_effects)
 
-ShipSchema = namedtuple("ShipSchema", ["name"] + ship_schema_fields +
+_ShipSchema = namedtuple("ShipSchema", ["name"] + ship_schema_fields +
     ship_schema_optional_fields)
+class ShipSchema(_ShipSchema):
+    """
+    hullclass_id and weapon_table are compiled from the fields by
+    ShipLibrary._load for the battle engines.  They are plain attributes,
+    not fields, so schemas compare and construct the same as before.
+    _replace compiles them again from the new fields, with the hullclass
+    ids the schema was compiled with.
+    """
+
+    hullclass_id = None
+    weapon_table = ()
+    hullclass_ids = None
+
+    def compile(self, hullclass_ids):
+        """
+        Compile hullclass_id and weapon_table, hullclass_ids is
+        {hullclass: id} as in ShipLibrary.hullclass_ids.
+        """
+
+        self.hullclass_ids = hullclass_ids
+        self.hullclass_id = hullclass_ids[self.hullclass]
+        self.weapon_table = tuple(compile_weapon(weapon, hullclass_ids)
+            for weapon in self.weapons)
+        return self
+
+    @classmethod
+    def _make(cls, iterable, hullclass_ids=None):
+        """
+        A new schema from a sequence, compiled when hullclass_ids is given.
+        """
+
+        schema = super()._make(iterable)
+        if hullclass_ids is not None:
+            schema.compile(hullclass_ids)
+        return schema
+
+    def _replace(self, **kwargs):
+        schema = super()._replace(**kwargs)
+        if self.hullclass_ids is not None:
+            schema.compile(self.hullclass_ids)
+        return schema
+
+class CompiledWeapon(object):
+    """
+    A weapon from a ship schema, compiled for the battle engines.
+
+        priority_targets: tuple of frozensets of hullclass ids, one per
+            priority level
+        debuffs: ShipDebuffs the weapon applies
+    """
+
+    __slots__ = ("weapon_name", "weapon_size", "firepower", "area_of_effect",
+        "cycle_time", "priority_targets", "debuffs")
+
+    def __init__(self, weapon_name, weapon_size, firepower, area_of_effect,
+            cycle_time, priority_targets, debuffs):
+        self.weapon_name = weapon_name
+        self.weapon_size = weapon_size
+        self.firepower = firepower
+        self.area_of_effect = area_of_effect
+        self.cycle_time = cycle_time
+        self.priority_targets = priority_targets
+        self.debuffs = debuffs
+
+    def __repr__(self):
+        return f"CompiledWeapon({self.weapon_name!r})"
+
+def compile_weapon(weapon, hullclass_ids):
+    """
+    Returns the CompiledWeapon for a validated weapon dict.
+    """
+
+    return CompiledWeapon(
+        weapon["weapon_name"],
+        weapon["weapon_size"],
+        weapon["firepower"],
+        weapon["area_of_effect"],
+        weapon["cycle_time"],
+        tuple(frozenset(hullclass_ids[hullclass] for hullclass in level)
+            for level in weapon["priority_targets"]),
+        _construct_tuple(ShipDebuffs, weapon.get("debuffs", {})),
+    )
 
 StructureSchema = namedtuple("StructureSchema", ["name"] + structure_schema_fields)
 
@@ -79,6 +162,10 @@ class ShipLibrary(object):
         self._load(raw_data)
 
     def _load(self, raw_data):
+        # fingerprint the config before it is normalized in place below,
+        # caches of battle results are keyed on it
+        self.fingerprint = hashlib.sha256(
+            json.dumps(raw_data, sort_keys=True).encode("utf-8")).hexdigest()
         self.starting_structure = None
         self.sov_structure = None
         missing = self._check_missing_keys("", raw_data)
@@ -89,6 +176,9 @@ class ShipLibrary(object):
         self.size_data.update(raw_data["sizes"])
 
         self.hullclasses_data = raw_data["hullclasses"]
+        # battle engines compare hullclasses by their position in hullclasses
+        self.hullclass_ids = {hullclass: i
+            for i, hullclass in enumerate(self.hullclasses_data)}
         if raw_data.get("sortclasses", None) != None:
             self.sortclasses_exists = True
             self.sortclasses_data = raw_data["sortclasses"]
@@ -226,7 +316,8 @@ class ShipLibrary(object):
 
             # final schema object to limit side effects.
             data.update(updates)
-            self.ship_data[ship_name] = _construct_tuple(ShipSchema, data)
+            schema = _construct_tuple(ShipSchema, data).compile(self.hullclass_ids)
+            self.ship_data[ship_name] = schema
         # end for loop: ship_name, data in ships_and_structures.items():
 
         self.ordered_ship_data = sorted(self.ship_data.values(), key=lambda s: s.sortclass)
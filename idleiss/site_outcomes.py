@@ -0,0 +1,227 @@
+"""
+Precomputed outcomes of site encounters.
+
+Every site with defending ships is fought, ahead of time, against a grid of
+standard attacking fleets.  The results are kept as a histogram of battle
+outcomes per (site, attacking fleet), so resolving a site fight with one of
+those fleets is a lookup and a weighted random draw instead of a live
+Battle.  Tables are built over a process pool and saved as JSON keyed by
+the hashes of the ship and scan configs and of the build settings, a
+stale file is rebuilt instead of being used.
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import random
+
+from idleiss.montecarlo import SamplePool
+from idleiss.montecarlo import SampleResult
+from idleiss.montecarlo import run_samples
+
+VERSION = 1
+
+# ships of each type in the standard attacking fleets
+STANDARD_SIZES = (1, 2, 5, 10, 20, 50)
+
+def standard_attackers(library, sizes=STANDARD_SIZES, ship_types=None):
+    """
+    The standard attacking fleets: every size of every ship type, all
+    ships of the library that are not structures by default.
+    """
+
+    if ship_types is None:
+        ship_types = [name for name, schema in library.ship_data.items()
+            if not schema.is_structure]
+    return [{name: size} for name in ship_types for size in sizes]
+
+def _canonical_fleet(ship_count):
+    return tuple(sorted((name, count) for name, count in ship_count.items() if count > 0))
+
+def table_key(library, scanning, attackers, samples, max_rounds, seed, engine):
+    """
+    Hash of everything a table depends on.
+    """
+
+    settings = {
+        "version": VERSION,
+        "ships": library.fingerprint,
+        "sites": scanning.fingerprint,
+        "attackers": sorted(_canonical_fleet(attacker) for attacker in attackers),
+        "samples": samples,
+        "max_rounds": max_rounds,
+        "seed": seed,
+        "engine": engine,
+    }
+    return hashlib.sha256(
+        json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _histogram(results):
+    counts = {}
+    for result in results:
+        outcome = (_canonical_fleet(result.attacker_result),
+            _canonical_fleet(result.defender_result), result.rounds)
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return [(count, SampleResult(dict(attacker), dict(defender), rounds))
+        for (attacker, defender, rounds), count in sorted(counts.items())]
+
+def _copy(outcome):
+    # the table keeps its SampleResults, callers get their own dicts
+    return SampleResult(dict(outcome.attacker_result),
+        dict(outcome.defender_result), outcome.rounds)
+
+
+class SiteOutcomeTable(object):
+    """
+    Battle outcomes of site defenders against standard attacking fleets.
+
+        key: see table_key
+        max_rounds: rounds the battles lasted at most
+        outcomes: {site name: {canonical attacking fleet:
+            [(weight, SampleResult)]}}
+    """
+
+    def __init__(self, key, max_rounds, outcomes):
+        self.key = key
+        self.max_rounds = max_rounds
+        self.outcomes = outcomes
+        # cumulative weights for draw
+        self._cumulative = {site: {attacker: self._cumulate(entries)
+                for attacker, entries in tables.items()}
+            for site, tables in outcomes.items()}
+
+    @staticmethod
+    def _cumulate(entries):
+        total = 0
+        cumulative = []
+        for weight, outcome in entries:
+            total += weight
+            cumulative.append(total)
+        return cumulative
+
+    @classmethod
+    def build(cls, scanning, library, attackers=None, samples=100, max_rounds=10,
+            seed=0, workers=None, engine="python"):
+        """
+        Fight every site with ships against every fleet of attackers,
+        standard_attackers(library) by default, samples times.
+
+        workers: worker process count, None for os.cpu_count(), 1 runs
+            every battle in this process.  Every fight has its own seeds so
+            the table is the same for any workers.
+        """
+
+        if samples < 1:
+            raise ValueError("SiteOutcomeTable: samples must be at least 1")
+        if attackers is None:
+            attackers = standard_attackers(library)
+        seed_source = random.Random(seed)
+        tasks = []
+        for site_name, site in scanning.site_data.items():
+            if not site.ships:
+                continue
+            for attacker in attackers:
+                tasks.append((site_name, attacker,
+                    [seed_source.getrandbits(64) for x in range(samples)]))
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, max(1, len(tasks)))
+
+        if workers == 1:
+            results = [run_samples(attacker, scanning.site_data[site_name].ships,
+                    max_rounds, library, seeds, engine)
+                for site_name, attacker, seeds in tasks]
+        else:
+            with SamplePool(library, workers) as pool:
+                futures = [pool.submit(attacker, scanning.site_data[site_name].ships,
+                        max_rounds, seeds, engine)
+                    for site_name, attacker, seeds in tasks]
+                results = [future.result() for future in futures]
+
+        outcomes = {}
+        for (site_name, attacker, seeds), site_results in zip(tasks, results):
+            outcomes.setdefault(site_name, {})[_canonical_fleet(attacker)] = \
+                _histogram(site_results)
+        key = table_key(library, scanning, attackers, samples, max_rounds, seed, engine)
+        return cls(key, max_rounds, outcomes)
+
+    def save(self, filename):
+        data = {
+            "key": self.key,
+            "max_rounds": self.max_rounds,
+            "sites": {site_name: [{
+                    "attacker": dict(attacker),
+                    "outcomes": [[weight, outcome.attacker_result,
+                        outcome.defender_result, outcome.rounds]
+                        for weight, outcome in entries],
+                } for attacker, entries in tables.items()]
+                for site_name, tables in self.outcomes.items()},
+        }
+        with open(filename, "w") as fd:
+            json.dump(data, fd)
+
+    @classmethod
+    def load(cls, filename, key=None):
+        """
+        The table saved in filename, None when there is no such file or its
+        key is not key.
+        """
+
+        if not os.path.exists(filename):
+            return None
+        with open(filename) as fd:
+            data = json.load(fd)
+        if key is not None and data.get("key") != key:
+            return None
+        outcomes = {}
+        for site_name, tables in data["sites"].items():
+            outcomes[site_name] = {_canonical_fleet(table["attacker"]): [
+                    (weight, SampleResult(attacker_result, defender_result, rounds))
+                    for weight, attacker_result, defender_result, rounds
+                    in table["outcomes"]]
+                for table in tables}
+        return cls(data["key"], data["max_rounds"], outcomes)
+
+    @classmethod
+    def load_or_build(cls, filename, scanning, library, attackers=None,
+            samples=100, max_rounds=10, seed=0, workers=None, engine="python"):
+        """
+        The table saved in filename if it was built from the same configs
+        and settings, otherwise build it and save it there.
+        """
+
+        if attackers is None:
+            attackers = standard_attackers(library)
+        key = table_key(library, scanning, attackers, samples, max_rounds, seed, engine)
+        table = cls.load(filename, key)
+        if table is None:
+            table = cls.build(scanning, library, attackers, samples, max_rounds,
+                seed, workers, engine)
+            table.save(filename)
+        return table
+
+    def lookup(self, site_name, attacker):
+        """
+        [(weight, SampleResult)] of attacker against the site, None when
+        the fight is not in the table.  The results are copies.
+        """
+
+        entries = self.outcomes.get(site_name, {}).get(_canonical_fleet(attacker))
+        if entries is None:
+            return None
+        return [(weight, _copy(outcome)) for weight, outcome in entries]
+
+    def draw(self, site_name, attacker, rng=random):
+        """
+        A random SampleResult of attacker against the site, weighted by how
+        often it came up, None when the fight is not in the table.  The
+        result is a copy, changing it leaves the table alone.
+        """
+
+        key = _canonical_fleet(attacker)
+        cumulative = self._cumulative.get(site_name, {}).get(key)
+        if cumulative is None:
+            return None
+        k = bisect.bisect_right(cumulative, rng.random() * cumulative[-1])
+        return _copy(self.outcomes[site_name][key][k][1])
@@ -0,0 +1,179 @@
+"""
+Compressed sparse row adjacency of the system graph.
+
+SystemGraph keeps the jump network of a universe as flat integer arrays,
+one pair per network: offsets, where the neighbors of system x are
+neighbors[offsets[x]:offsets[x + 1]], in the order of x.connections.  The
+capital network is the same over cap_connections.  Systems are referred to
+by id, their position in Universe.systems.
+
+Floods, jump distances and routes walk the arrays a whole BFS level at a
+time.  A graph saves as a single .npy file; SystemGraph.load memory maps
+it read only, so worker processes loading the same file share one copy of
+the pages instead of each holding the object graph.  Universe keeps the
+graph of its systems as system_graph, floods and routes over systems go
+through it, and a universe snapshot saves it next to itself as
+<snapshot>.npy.
+
+File layout, one int32 array:
+
+    magic, version, system count, jump count, capital jump count
+    offsets (system count + 1), neighbors (jump count)
+    capital offsets (system count + 1), capital neighbors (capital jump count)
+"""
+
+import numpy as np
+
+MAGIC = 0x48505247 # "GRPH"
+VERSION = 1
+HEADER = 5
+
+
+class SystemGraph(object):
+    """
+    offsets, neighbors: the jump network
+    cap_offsets, cap_neighbors: the capital jump network
+    """
+
+    def __init__(self, offsets, neighbors, cap_offsets, cap_neighbors):
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.cap_offsets = cap_offsets
+        self.cap_neighbors = cap_neighbors
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def _csr(systems, connections):
+        offsets = np.zeros(len(systems) + 1, dtype=np.int32)
+        neighbors = []
+        for x, system in enumerate(systems):
+            if system.id != x:
+                raise ValueError(f"SystemGraph: {system.name} has id {system.id} at position {x}")
+            neighbors.extend(y.id for y in getattr(system, connections))
+            offsets[x + 1] = len(neighbors)
+        return offsets, np.array(neighbors, dtype=np.int32)
+
+    @classmethod
+    def from_systems(cls, systems):
+        """
+        The graph of systems, a list where every system is at the position
+        of its id, such as Universe.systems.
+        """
+
+        return cls(*cls._csr(systems, "connections"), *cls._csr(systems, "cap_connections"))
+
+    def save(self, filename):
+        """
+        Write the graph to filename, a .npy file load can memory map.
+        """
+
+        header = [MAGIC, VERSION, len(self), len(self.neighbors), len(self.cap_neighbors)]
+        data = np.concatenate([np.array(header, dtype=np.int32), self.offsets,
+            self.neighbors, self.cap_offsets, self.cap_neighbors]).astype(np.int32)
+        np.save(filename, data, allow_pickle=False)
+
+    @classmethod
+    def load(cls, filename, mmap=True):
+        """
+        The graph saved in filename, its arrays are read only views of the
+        memory mapped file unless mmap is False.
+        """
+
+        data = np.load(filename, mmap_mode="r" if mmap else None, allow_pickle=False)
+        if len(data) < HEADER or data[0] != MAGIC:
+            raise ValueError(f"SystemGraph.load: {filename} is not a system graph")
+        if data[1] != VERSION:
+            raise ValueError(f"SystemGraph.load: {filename} is version {data[1]}, expected {VERSION}")
+        count, jumps, cap_jumps = (int(x) for x in data[2:HEADER])
+        arrays = []
+        start = HEADER
+        for length in (count + 1, jumps, count + 1, cap_jumps):
+            arrays.append(data[start:start + length])
+            start += length
+        if start != len(data):
+            raise ValueError(f"SystemGraph.load: {filename} is truncated or corrupt")
+        return cls(*arrays)
+
+    def _network(self, capital):
+        if capital:
+            return self.cap_offsets, self.cap_neighbors
+        return self.offsets, self.neighbors
+
+    def adjacent(self, system_id, capital=False):
+        """
+        ids of the systems one jump from system_id.
+        """
+
+        offsets, neighbors = self._network(capital)
+        return neighbors[offsets[system_id]:offsets[system_id + 1]]
+
+    def _expand(self, frontier, capital):
+        # every neighbor of every system in frontier, duplicates included
+        offsets, neighbors = self._network(capital)
+        starts = offsets[frontier]
+        counts = offsets[frontier + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return neighbors[:0]
+        # position of each gathered neighbor: the start of its row plus its
+        # rank within the row
+        ranks = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        return neighbors[np.repeat(starts, counts) + ranks]
+
+    def jump_distances(self, start, capital=False):
+        """
+        Jumps from start to every system, -1 for the unreachable ones.
+        """
+
+        distances = np.full(len(self), -1, dtype=np.int32)
+        distances[start] = 0
+        frontier = np.array([start], dtype=np.int32)
+        distance = 0
+        # position of each system in the level being reached, to keep one
+        # copy of systems reached from several others
+        first = np.empty(len(self), dtype=np.int64)
+        while len(frontier):
+            distance += 1
+            reached = self._expand(frontier, capital)
+            reached = reached[distances[reached] == -1]
+            distances[reached] = distance
+            order = np.arange(len(reached))
+            first[reached] = order
+            frontier = reached[first[reached] == order]
+        return distances
+
+    def flood(self, start, capital=False):
+        """
+        Boolean array of the systems reachable from start.
+        """
+
+        return self.jump_distances(start, capital) >= 0
+
+    def floodfill(self, system_ids, capital=False):
+        """
+        True when every one of system_ids reaches the first one, within
+        the whole graph like Universe.floodfill.
+        """
+
+        system_ids = np.asarray(system_ids)
+        return bool(self.flood(system_ids[0], capital)[system_ids].all())
+
+    def route(self, source, destination, capital=False):
+        """
+        ids of the systems along a shortest route from source to
+        destination, both included, None when there is no route.
+        """
+
+        distances = self.jump_distances(source, capital)
+        if distances[destination] < 0:
+            return None
+        # walk back from destination, every step to a system one jump closer
+        route = [int(destination)]
+        while route[-1] != source:
+            adjacent = self.adjacent(route[-1], capital)
+            closer = adjacent[distances[adjacent] == distances[route[-1]] - 1]
+            route.append(int(closer[0]))
+        route.reverse()
+        return route
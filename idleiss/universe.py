@@ -1,18 +1,44 @@
 from random import Random
+import hashlib
 import json
 import math
+import os
 import networkx as nx
 import matplotlib.pyplot as plt
 import matplotlib.patheffects as PathEffects
 import itertools
 
 from idleiss.scan import SiteInstance
+from idleiss.system_graph import SystemGraph
+
+SNAPSHOT_VERSION = 1
 
 def tupleize(obj):
     if isinstance(obj, list):
         return tuple([tupleize(o) for o in obj])
     return obj
 
+# modules whose code shapes a generated universe, see snapshot_key
+SNAPSHOT_MODULES = ("universe.py", "system_graph.py", "scan.py")
+
+def snapshot_key(raw_data):
+    """
+    Hash of a universe config and of the code generating it, snapshots of
+    a universe are only used when it matches.
+    """
+    code = hashlib.sha256()
+    for module in SNAPSHOT_MODULES:
+        with open(os.path.join(os.path.dirname(__file__), module), "rb") as fd:
+            code.update(fd.read())
+    code = code.hexdigest()
+    settings = {
+        "version": SNAPSHOT_VERSION,
+        "code": code,
+        "config": raw_data,
+    }
+    return hashlib.sha256(
+        json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
 class SolarSystem(object):
     def __init__(self, random_state, universe, security, name, const, region):
         if universe.name_exists(name):
@@ -29,8 +55,9 @@ class SolarSystem(object):
         self.connections = []
         self.cap_connections = []
         self.id = universe.get_next_system_id()
-        self.flooded = False
-        self.cap_flooded = False
+        # generation of the last flood that reached this node
+        self.flood_generation = 0
+        self.cap_flood_generation = 0
         self.owned_by = None
         self.structures = {}
         self.sites = []
@@ -59,8 +86,8 @@ security: {self.security}
 connections: {connection_list}
 cap connections: {cap_connection_list}
 id: {self.id}
-flooded: {self.flooded}
-cap flooded: {self.cap_flooded}
+flood generation: {self.flood_generation}
+cap flood generation: {self.cap_flood_generation}
 owned by: {self.owned_by}
 structures: {self.structures}
 sites: {self.sites}
@@ -113,8 +140,9 @@ class Constellation(object):
         if len(self.systems) < universe.systems_per_constellation:
             if security != "Null":
                 raise ValueError("Constellation __init__: "+name+": too few systems for non-nullsec")
-            for x in range(universe.systems_per_constellation - len(self.systems)):
-                new_sys = SolarSystem(random_state, universe, security, universe.generate_unused_nullsec_name(), self.name, region)
+            names = universe.generate_unused_nullsec_names(universe.systems_per_constellation - len(self.systems))
+            for name in names:
+                new_sys = SolarSystem(random_state, universe, security, name, self.name, region)
                 self.systems.append(new_sys)
         #self.debug_output.append(f"idleiss.universe._build_universe: calling stitch nodes on: {region}: {self.name}: systems: {len(self.systems)}\n")#DEBUG LINE
         self.systems = universe.stitch_nodes(self.systems)
@@ -123,8 +151,9 @@ class Constellation(object):
         self.connections = []
         self.cap_connections = []
         self.id = universe.get_next_constellation_id()
-        self.flooded = False
-        self.cap_flooded = False
+        # generation of the last flood that reached this node
+        self.flood_generation = 0
+        self.cap_flood_generation = 0
 
     def __str__(self):
         connections_str = ""
@@ -181,8 +210,9 @@ class Region(object):
         self.cap_connections = []
         self.border_edge_systems = []
         self.id = universe.get_next_constellation_id()
-        self.flooded = False
-        self.cap_flooded = False
+        # generation of the last flood that reached this node
+        self.flood_generation = 0
+        self.cap_flood_generation = 0
 
     def __str__(self):
         connections_str = ""
@@ -212,6 +242,81 @@ class Region(object):
             self.cap_connections.append(region)
         return True # connection added
 
+class DisjointSet(object):
+    """
+    Union-find over nodes, with union by size and path halving.
+    """
+
+    def __init__(self, items=()):
+        self.parent = {}
+        self.size = {}
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return item in self.parent
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] is not item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        a = self.find(a)
+        b = self.find(b)
+        if a is b:
+            return a
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return a
+
+class _OrderedSubset(object):
+    """
+    A growing subset of items in their list order, followed by the nodes
+    in extra, as a sequence rand.choice can pick from.  A Fenwick tree of
+    the positions added finds the k-th one in O(log n).
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.tree = [0] * (len(items) + 1)
+        self.count = 0
+        self.extra = []
+        self.top = 1 << (len(items).bit_length() - 1) if items else 0
+
+    def add(self, position):
+        self.count += 1
+        i = position + 1
+        while i < len(self.tree):
+            self.tree[i] += 1
+            i += i & -i
+
+    def __len__(self):
+        return self.count + len(self.extra)
+
+    def __getitem__(self, k):
+        if k >= self.count:
+            return self.extra[k - self.count]
+        # walk down the tree to the position holding the k-th member
+        position = 0
+        remaining = k + 1
+        step = self.top
+        while step:
+            if position + step < len(self.tree) and self.tree[position + step] < remaining:
+                position += step
+                remaining -= self.tree[position]
+            step >>= 1
+        return self.items[position]
+
 class Universe(object):
     _required_keys = [
         "Universe Seed", #top level keys
@@ -241,13 +346,15 @@ class Universe(object):
         "Constellations"
     ]
 
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, snapshot=None):
         """
         generates a universe with #systems, #constellations and #regions
         using connectedness as a rough guide to how linked nodes are within a collection
+
+        snapshot: see load
         """
         self.rand = Random()
-        self.used_names = []
+        self.used_names = set()
         self.regions = []
         self.constellations = []
         self.systems = []
@@ -255,14 +362,19 @@ class Universe(object):
         self.current_unused_constellation_id = 0
         self.current_unused_region_id = 0
         self.debug_output = []
+        self.flood_generation = 1
+        # SystemGraph of the systems as generated, floods and routes over
+        # systems use it once the universe is built
+        self.system_graph = None
         if filename:
-            self.load(filename)
+            self.load(filename, snapshot)
 
     def load_savedata(self, savedata):
         """
         Unlike most of the other items in this library we will let the saved seed
-        random generation rebuild the full universe first. Then update the differences
-        between a new generated uni and one where the players have built things
+        random generation rebuild the full universe first (or load its snapshot, see load).
+        Then update the differences between a new generated uni and one where the players
+        have built things
         """
         self.rand.setstate(tupleize(savedata['rand']))
         system_updates = savedata['system_updates']
@@ -297,6 +409,143 @@ class Universe(object):
         }
         return save
 
+    def save_snapshot(self, filename, key):
+        """
+        Write the generated universe to filename, see load_snapshot.
+        Snapshots are only a cache, failing to write one is not an error.
+        """
+        position = {}
+        for nodes in (self.regions, self.constellations, self.systems):
+            for x, node in enumerate(nodes):
+                position[node] = x
+
+        def linked(node):
+            return ([position[x] for x in node.connections],
+                [position[x] for x in node.cap_connections])
+
+        data = {
+            "key": key,
+            "rand": self.rand.getstate(),
+            "ids": [self.current_unused_system_id,
+                self.current_unused_constellation_id,
+                self.current_unused_region_id],
+            "debug_output": self.debug_output,
+            # galaxy_stitch shuffles these
+            "security": [[position[x] for x in regions] for regions in
+                (self.highsec_regions, self.lowsec_regions, self.nullsec_regions)],
+            "regions": [[region.name, region.id, region.security,
+                    [position[x] for x in region.constellations], *linked(region)]
+                for region in self.regions],
+            "constellations": [[constellation.name, constellation.id,
+                    constellation.security, constellation.region,
+                    [position[x] for x in constellation.systems], *linked(constellation)]
+                for constellation in self.constellations],
+            "systems": [[system.name, system.id, system.security,
+                    system.constellation, system.region, system.bordertype, *linked(system)]
+                for system in self.systems],
+        }
+        # the graph first, a snapshot is never newer than its graph
+        self._save_atomic(filename + ".npy", "wb", self.system_graph.save)
+        self._save_atomic(filename, "w", lambda fd: json.dump(data, fd))
+
+    @staticmethod
+    def _save_atomic(filename, mode, write):
+        temporary = f"{filename}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, mode) as fd:
+                write(fd)
+            os.replace(temporary, filename)
+        except OSError:
+            for name in (temporary, filename):
+                if os.path.exists(name):
+                    os.remove(name)
+
+    def _snapshot_node(self, cls, name, id, security):
+        node = cls.__new__(cls)
+        node.name = name
+        node.id = id
+        node.security = security
+        node.rand = self.rand
+        node.flood_generation = 0
+        node.cap_flood_generation = 0
+        return node
+
+    def load_snapshot(self, filename, key, raw_data):
+        """
+        Load the universe saved in filename by save_snapshot instead of
+        generating it from raw_data, the config it was generated from.
+        False when there is no such file or its key is not key.
+        """
+        if not os.path.exists(filename):
+            return False
+        try:
+            with open(filename) as fd:
+                data = json.load(fd)
+        except ValueError: # truncated or otherwise unreadable, regenerate
+            return False
+        if data.get("key") != key:
+            return False
+        self._load_settings(raw_data)
+        self.rand.setstate(tupleize(data["rand"]))
+        (self.current_unused_system_id, self.current_unused_constellation_id,
+            self.current_unused_region_id) = data["ids"]
+        self.debug_output = data["debug_output"]
+
+        systems = []
+        for name, id, security, constellation, region, bordertype, connections, cap_connections in data["systems"]:
+            system = self._snapshot_node(SolarSystem, name, id, security)
+            system.entitytype = "System"
+            system.constellation = constellation
+            system.region = region
+            system.bordertype = bordertype
+            system.owned_by = None
+            system.structures = {}
+            system.sites = []
+            systems.append(system)
+        constellations = []
+        for name, id, security, region, members, connections, cap_connections in data["constellations"]:
+            constellation = self._snapshot_node(Constellation, name, id, security)
+            constellation.entitytype = "Constellation"
+            constellation.region = region
+            constellation.systems = [systems[x] for x in members]
+            constellations.append(constellation)
+        regions = []
+        for name, id, security, members, connections, cap_connections in data["regions"]:
+            region = self._snapshot_node(Region, name, id, security)
+            region.entitytype = "Region"
+            region.constellations = [constellations[x] for x in members]
+            region.border_edge_systems = []
+            regions.append(region)
+        for nodes, rows in ((systems, data["systems"]),
+                (constellations, data["constellations"]), (regions, data["regions"])):
+            for node, row in zip(nodes, rows):
+                node.connections = [nodes[x] for x in row[-2]]
+                node.cap_connections = [nodes[x] for x in row[-1]]
+
+        self.systems = systems
+        self.constellations = constellations
+        self.regions = regions
+        self.highsec_regions, self.lowsec_regions, self.nullsec_regions = (
+            [regions[x] for x in members] for members in data["security"])
+        self.used_names = set(x.name for x in regions + constellations + systems)
+        self.system_graph = self._load_system_graph(filename + ".npy")
+        self.networkx_graph = self.generate_networkx(self.systems)
+        self._populate_master_dict()
+        return True
+
+    def _load_system_graph(self, filename):
+        # the memory mapped graph saved with a snapshot, rebuilt when it is
+        # missing or does not fit the systems
+        try:
+            graph = SystemGraph.load(filename)
+        except (OSError, ValueError):
+            graph = None
+        if (graph is None or len(graph) != len(self.systems)
+                or len(graph.neighbors) != sum(len(x.connections) for x in self.systems)
+                or len(graph.cap_neighbors) != sum(len(x.cap_connections) for x in self.systems)):
+            return SystemGraph.from_systems(self.systems)
+        return graph
+
     def get_next_system_id(self):
         ret_val = self.current_unused_system_id
         self.current_unused_system_id += 1
@@ -326,10 +575,25 @@ class Universe(object):
                 return str(region)+": "+", ".join(missing)
         return False
 
-    def load(self, filename):
+    def load(self, filename, snapshot=None):
+        """
+        snapshot: file the generated universe is cached in, filename with a
+            .snapshot suffix when True.  The universe is loaded from it when
+            it was generated from the same config by the same code,
+            otherwise generated and saved there.  None or False, the
+            default, always generates and writes nothing.
+        """
         with open(filename) as fd:
             raw_data = json.load(fd)
-        self._load(raw_data)
+        if snapshot is True:
+            snapshot = filename + ".snapshot"
+        if not snapshot:
+            self._load(raw_data)
+            return
+        key = snapshot_key(raw_data)
+        if not self.load_snapshot(snapshot, key, raw_data):
+            self._load(raw_data)
+            self.save_snapshot(snapshot, key)
 
     def _load(self, raw_data):
         missing = self._missing_universe_keys(raw_data)
@@ -337,6 +601,15 @@ class Universe(object):
             raise ValueError(str(missing)+" not found in config")
 
         self.rand.seed(raw_data["Universe Seed"])
+        self._load_settings(raw_data)
+
+        self._verify_config_settings(raw_data)
+        #TODO: config file is verified except for rigidly defined structures
+
+        self._build_universe(raw_data)
+        self._populate_master_dict()
+
+    def _load_settings(self, raw_data):
         self.system_count_target = raw_data["System Count"]
         self.constellation_count_target = raw_data["Constellation Count"]
         self.region_count_target = raw_data["Region Count"]
@@ -348,11 +621,7 @@ class Universe(object):
         self.high_null_bonus = raw_data["High-Null Bonus Connections"]
         self.null_low_depth = raw_data["Null-Low Depth Ratio"]
 
-        self._verify_config_settings(raw_data)
-        #TODO: config file is verified except for rigidly defined structures
-
-        self._build_universe(raw_data)
-        #populate dictionaries:
+    def _populate_master_dict(self):
         self.master_dict = {}
         for region in self.regions:
             self.master_dict[region.name] = region
@@ -465,13 +734,13 @@ class Universe(object):
         self.debug_output.append(f"{constellations_verified} constellations\n")
         self.debug_output.append(f"{systems_verified} systems\n")
 
-        self.used_names = []
+        self.used_names = set()
 
     def register_name(self, name):
         if self.name_exists(name):
             raise ValueError(f"Universe generation: entity name exists: {name}")
         else:
-            self.used_names.append(name)
+            self.used_names.add(name)
 
     def name_exists(self, name):
         return name in self.used_names
@@ -590,8 +859,9 @@ class Universe(object):
                 self.constellations.append(constellation)
                 for system in constellation.systems:
                     self.systems.append(system)
+        # id indexed adjacency arrays for routing and floods over systems
+        self.system_graph = SystemGraph.from_systems(self.systems)
         # final validation
-        self.drain(self.systems)
         self.networkx_graph = self.generate_networkx(self.systems)
         if not nx.is_connected(self.networkx_graph):
             raise ValueError("_build_universe: failed to connect all nodes")
@@ -832,33 +1102,7 @@ class Universe(object):
         """
         if len(node_list) < 2:
             raise ValueError(f"idleiss.universe.stitch_nodes: must have at least two systems for a connection. List provided was: {node_list}")
-        # floodfill
-        if len(node_list[0].connections) == 0: #floodfill will start on orphan, avoid this
-            node_list[0].add_connection(self.rand.choice(node_list[1:]))
-        while not self.floodfill(node_list):
-            #floodfill failed, find failed nodes:
-            valid_nodes = []
-            orphan_nodes = []
-            disjoint_nodes = []
-            for x in node_list:
-                if len(x.connections) == 0:
-                    orphan_nodes.append(x)
-                elif x.flooded:
-                    valid_nodes.append(x)
-                else: # not flooded, not orphan, must be disjoint
-                    disjoint_nodes.append(x)
-            #first pin disjoint graphs to valid nodes
-            if len(disjoint_nodes) > 0:
-                disjoint_nodes[0].add_connection(self.rand.choice(valid_nodes))
-                self.drain(node_list)
-                continue #go around again
-            #next pin all orphans, there are only ophans remaining
-            for x in range(len(orphan_nodes)): #include already processed orphans
-                orphan_nodes[x].add_connection(self.rand.choice((valid_nodes + orphan_nodes[:x])))
-            self.drain(node_list)
-        #end of floodfill
-        self.drain(node_list)
-        return node_list
+        return self._stitch(node_list, "connections")
 
     def cap_stitch_nodes(self, unpruned_node_list):
         """
@@ -868,35 +1112,58 @@ class Universe(object):
         node_list = [x for x in unpruned_node_list if x.security != "High"]
         if len(node_list) < 2:
             raise ValueError("idleiss.universe.cap_stitch_nodes: must have at least two systems for a connection. List provided was: "+str(node_list))
-        # floodfill
-        if len(node_list[0].cap_connections) == 0: #floodfill will start on orphan, avoid this
+        return self._stitch(node_list, "cap_connections")
+
+    def _stitch(self, node_list, connections):
+        """
+        stitch_nodes over the edges in the connections attribute.
+
+        Components are tracked in a DisjointSet and bridged in a single
+        pass, making the same rand calls in the same order as repeatedly
+        floodfilling from node_list[0] would: each disjoint graph, in the
+        order of its first node, is pinned to a random valid node, then
+        every orphan to a random valid node or earlier orphan.  Valid
+        nodes are picked in node_list order.
+        """
+        if len(getattr(node_list[0], connections)) == 0: #floodfill would start on orphan, avoid this
             node_list[0].add_connection(self.rand.choice(node_list[1:]))
-        while not self.cap_floodfill(node_list):
-            #floodfill failed, find failed nodes:
-            valid_nodes = []
-            orphan_nodes = []
-            disjoint_nodes = []
-            for x in node_list:
-                if len(x.cap_connections) == 0:
-                    orphan_nodes.append(x)
-                elif x.cap_flooded:
-                    valid_nodes.append(x)
-                else: # not flooded, not orphan, must be disjoint
-                    disjoint_nodes.append(x)
-            #first pin disjoint graphs to valid nodes
-            if len(disjoint_nodes) > 0:
-                disjoint_nodes[0].add_connection(self.rand.choice(valid_nodes))
-                self.cap_drain(node_list)
-                continue #go around again
-            #next pin all orphans, there are only ophans remaining
-            for x in range(len(orphan_nodes)): #include already processed orphans
-                orphan_nodes[x].add_connection(self.rand.choice((valid_nodes + orphan_nodes[:x])))
-            self.cap_drain(node_list)
-        #end of floodfill
-        self.cap_drain(node_list)
+        components = DisjointSet(node_list)
+        # edges through nodes outside node_list connect as well
+        pending = list(node_list)
+        while pending:
+            node = pending.pop()
+            for x in getattr(node, connections):
+                if x not in components:
+                    components.add(x)
+                    pending.append(x)
+                components.union(node, x)
+        root = components.find(node_list[0])
+        valid_nodes = _OrderedSubset(node_list)
+        orphan_nodes = []
+        disjoint_graphs = {} # first node: positions in node_list, by first position
+        for position, x in enumerate(node_list):
+            x_root = components.find(x)
+            if x_root is root:
+                valid_nodes.add(position)
+            elif len(getattr(x, connections)) == 0:
+                orphan_nodes.append(x)
+            else: # not connected, not orphan, must be disjoint
+                disjoint_graphs.setdefault(x_root, []).append(position)
+        #first pin disjoint graphs to valid nodes
+        for positions in disjoint_graphs.values():
+            target = self.rand.choice(valid_nodes)
+            node_list[positions[0]].add_connection(target)
+            components.union(target, node_list[positions[0]])
+            for position in positions:
+                valid_nodes.add(position)
+        #next pin all orphans, including already processed orphans
+        for x in orphan_nodes:
+            target = self.rand.choice(valid_nodes)
+            x.add_connection(target)
+            components.union(target, x)
+            valid_nodes.extra.append(x)
         return node_list
 
-
     def count_edges(self, node_list):
         connection_list = []
         for x in node_list:
@@ -926,6 +1193,21 @@ class Universe(object):
             possible_name = self._generate_nullsec_name()
         return possible_name
 
+    def generate_unused_nullsec_names(self, count):
+        """
+        count distinct unused nullsec names, drawn with the same rand calls as
+        count generate_unused_nullsec_name calls registering each name
+        before the next, names are not registered
+        """
+        names = []
+        drawn = set()
+        while len(names) < count:
+            possible_name = self._generate_nullsec_name()
+            if possible_name not in drawn and not self.name_exists(possible_name):
+                drawn.add(possible_name)
+                names.append(possible_name)
+        return names
+
     def draw_graph(self, graph):
         nx.draw_networkx(graph, pos=nx.spring_layout(graph), with_labels=True)
         plt.show()
@@ -971,33 +1253,80 @@ class Universe(object):
             dpi=100)
         plt.close()
 
+    def _flood(self, node, connections, mark):
+        # iterative so universe size isn't capped by the recursion limit,
+        # a node is flooded when its mark is the current generation
+        generation = self.flood_generation
+        if getattr(node, mark) == generation:
+            return
+        setattr(node, mark, generation)
+        stack = [node]
+        while stack:
+            for x in getattr(stack.pop(), connections):
+                if getattr(x, mark) != generation:
+                    setattr(x, mark, generation)
+                    stack.append(x)
+
+    def _on_graph(self, node_list):
+        # True when node_list are systems of this universe, which
+        # system_graph floods a BFS level at a time
+        systems = self.systems
+        count = len(systems)
+        return self.system_graph is not None and all(
+            x.id < count and systems[x.id] is x for x in node_list)
+
+    def _graph_flood(self, node, capital, mark):
+        systems = self.systems
+        generation = self.flood_generation
+        for x in self.system_graph.flood(node.id, capital).nonzero()[0].tolist():
+            setattr(systems[x], mark, generation)
+
     #TODO: Distance floodfill?
     def flood(self, node):
-        if(node.flooded):
-            return
-        node.flooded = True
-        for x in node.connections:
-            self.flood(x)
+        if self._on_graph([node]):
+            self._graph_flood(node, False, "flood_generation")
+        else:
+            self._flood(node, "connections", "flood_generation")
+
+    def flooded(self, node):
+        return node.flood_generation == self.flood_generation
 
     def floodfill(self, node_list):
+        self.drain(node_list)
         self.flood(node_list[0])
-        return all(x.flooded for x in node_list)
+        return all(x.flood_generation == self.flood_generation for x in node_list)
 
-    def drain(self, node_list):
-        for x in node_list: #reset flood state
-            x.flooded = False
+    def route(self, source, destination, capital=False):
+        """
+        Systems along a shortest route from source to destination, both
+        included, None when there is none.  capital routes over capital
+        jumps only.
+        """
+        route = self.system_graph.route(source.id, destination.id, capital)
+        if route is None:
+            return None
+        return [self.systems[x] for x in route]
+
+    def drain(self, node_list=None):
+        """
+        reset flood state of every node, starting a new generation leaves
+        all earlier marks stale so node_list is not walked
+        """
+        self.flood_generation += 1
 
     def cap_flood(self, node):
-        if(node.cap_flooded):
-            return
-        node.cap_flooded = True
-        for x in node.cap_connections:
-            self.cap_flood(x)
+        if self._on_graph([node]):
+            self._graph_flood(node, True, "cap_flood_generation")
+        else:
+            self._flood(node, "cap_connections", "cap_flood_generation")
+
+    def cap_flooded(self, node):
+        return node.cap_flood_generation == self.flood_generation
 
     def cap_floodfill(self, node_list):
+        self.cap_drain(node_list)
         self.cap_flood(node_list[0])
-        return all(x.cap_flooded for x in node_list)
+        return all(x.cap_flood_generation == self.flood_generation for x in node_list)
 
-    def cap_drain(self, node_list):
-        for x in node_list: #reset cap_flood state
-            x.cap_flooded = False
+    def cap_drain(self, node_list=None):
+        self.drain(node_list)
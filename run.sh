@@ -16,6 +16,7 @@ idleiss -q
 # Run Example Combat Sim
 echo "Running Combat Sim"
 idleiss --simulate-battle config/Example_Fleet_Fight.json
+idleiss --simulate-battle config/Example_Fleet_Fight.json --battle-engine numpy
 
 # Run with interpreter with pre-set instructions
 echo "Running Sample Interpreter"
@@ -32,7 +32,7 @@ setup(name='idleiss',
       zip_safe=False,
       install_requires=requirements,
       tests_require=test_requirements,
-      extras_require={'dev': [test_requirements]},
+      extras_require={'dev': [test_requirements], 'jit': ['numba>=0.56']},
       entry_points={
           'console_scripts': [
               'idleiss = idleiss.main:run',
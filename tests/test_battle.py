@@ -1,8 +1,13 @@
 from unittest import TestCase
+from unittest import skipIf
+import json
+import math
 import random
 from os.path import dirname, join
 
 from idleiss import battle
+from idleiss import battle_expected
+from idleiss import battle_numpy
 from idleiss.battle import Battle
 from idleiss.battle import Fleet
 from idleiss.battle import AttackResult
@@ -869,15 +874,46 @@ class BattleTestCase(TestCase):
 
         random.seed(1)
         #ship_attack(attacker, victim)
-        ship1_1 = battle.ship_attack(ship2.schema.weapons[0], ship2.debuffs, ship1)
+        ship1_1 = battle.ship_attack(ship2.schema.weapon_table[0], ship2.debuffs, ship1)
         self.assertEqual(ship1_1, Ship(schema1, ShipAttributes(0, 0, 0)))
 
-        ship2_1 = battle.ship_attack(ship1.schema.weapons[0], ship1.debuffs, ship2)
+        ship2_1 = battle.ship_attack(ship1.schema.weapon_table[0], ship1.debuffs, ship2)
         self.assertEqual(ship2_1, Ship(schema2, ShipAttributes(50, 100, 100)))
 
-        ship2_2 = battle.ship_attack(ship1.schema.weapons[0], ship1.debuffs, ship2_1)
+        ship2_2 = battle.ship_attack(ship1.schema.weapon_table[0], ship1.debuffs, ship2_1)
         self.assertEqual(ship2_2, Ship(schema2, ShipAttributes(0, 100, 100)))
 
+    def test_combat_ship_round_trip(self):
+        library = ShipLibraryMock()
+        original = Ship(library.get_ship_schemata("ship2"), ShipAttributes(10, 20, 30))
+        record = battle.CombatShip.from_ship(original)
+        self.assertEqual((record.shield, record.armor, record.hull), (10, 20, 30))
+        self.assertEqual(record.to_ship(), original)
+        with self.assertRaises(AttributeError):
+            record.extra = 1
+
+    def test_combat_ship_attack_in_place(self):
+        library = ShipLibraryMock()
+        ship1 = library.get_ship_schemata("ship1")
+        victim = battle.expand_combat_fleet({"ship2": 1}, library).record(0)
+        debuffs = victim.debuffs
+        damage = battle.combat_ship_attack(
+            ship1.weapon_table[0], ShipDebuffs(0, 0, 0, 0), victim, random.Random(0))
+        self.assertEqual(damage, 50)
+        self.assertEqual((victim.shield, victim.armor, victim.hull), (50, 100, 100))
+        # plain guns leave the debuffs alone, no new tuple is built
+        self.assertIs(victim.debuffs, debuffs)
+
+    def test_jammed_this_round_still_fires(self):
+        # ECM landing on the defenders must not stop them firing back in
+        # the same round
+        library = ShipLibraryMock()
+        battle_instance = Battle({"ewar_ecm_test": 1}, {"ewar_test_target": 1}, 1,
+            library, calculate=False)
+        attacker_round, defender_round = battle_instance.calculate_round(0)
+        self.assertEqual(attacker_round.hits_taken, 1)
+        self.assertEqual(defender_round.ship_count, {"ewar_test_target": 1})
+
     def test_fleet_attack_empty(self):
         library = ShipLibraryMock()
         schema1 = library.get_ship_schemata("ship1")
@@ -898,6 +934,152 @@ class BattleTestCase(TestCase):
         self.assertEqual(result.damaged_fleet,
             [Ship(schema1, ShipAttributes(10, 10, 100)),])
 
+    def test_target_index(self):
+        library = ShipLibraryMock()
+        fleet = battle.expand_fleet({
+            "ship1": 2,
+            "test_structure": 1,
+            "priority_test_target": 2,
+        }, library).ships
+        targets = battle.TargetIndex(fleet)
+        level = lambda *hullclasses: frozenset(
+            library.hullclass_ids[hullclass] for hullclass in hullclasses)
+        self.assertEqual(targets.all, [0, 1, 3, 4])
+        self.assertEqual(targets.level(level("priority_test_target")), [3, 4])
+        self.assertEqual(targets.level(level("priority_test_target", "generic")), [0, 1, 3, 4])
+        self.assertEqual(targets.level(level("test_structure")), [])
+
+        rng = random.Random(0)
+        self.assertIn(targets.pick(rng, [], level("priority_test_target")), [3, 4])
+        self.assertEqual(targets.pick(rng, [3], level("priority_test_target")), 4)
+        self.assertIsNone(targets.pick(rng, [3, 4], level("priority_test_target")))
+        self.assertEqual(targets.pick(rng, [0, 1, 4]), 3)
+        self.assertIsNone(targets.pick(rng, [0, 1, 3, 4]))
+
+    def test_target_index_pick_matches_choice(self):
+        # picking through the index must draw the same numbers as
+        # rng.choice() on the ascending filtered list
+        library = ShipLibraryMock()
+        targets = battle.TargetIndex(battle.expand_fleet({"ship1": 50}, library).ships)
+        exclude = [3, 17, 18, 40]
+        expected_rng = random.Random(4)
+        rng = random.Random(4)
+        for i in range(20):
+            expected = expected_rng.choice([i for i in range(50) if i not in exclude])
+            self.assertEqual(targets.pick(rng, exclude), expected)
+
+    def test_target_index_pick_ascending(self):
+        # priority and sparse picks draw over ascending positions, not the
+        # list(set(...)) order the baseline drew from
+        library = ShipLibraryMock()
+        targets = battle.TargetIndex(battle.expand_fleet({
+            "ship1": 45,
+            "priority_test_target": 4,
+            "ship2": 10,
+        }, library).ships)
+        priority = frozenset([library.hullclass_ids["priority_test_target"]])
+        expected_rng = random.Random(6)
+        rng = random.Random(6)
+        for exclude in ([], [46], [0, 2, 30, 31, 32], list(range(40)) + [58]):
+            expected = expected_rng.choice([x for x in range(59) if x not in exclude])
+            self.assertEqual(targets.pick(rng, exclude), expected)
+            expected = expected_rng.choice([x for x in range(45, 49) if x not in exclude])
+            self.assertEqual(targets.pick(rng, exclude, priority), expected)
+
+    def test_priority_targets_seeded(self):
+        # pins the targets of a seeded volley with priority targets at
+        # positions 45-48, where list(set(...)) is not ascending
+        library = ShipLibraryMock()
+        attacker = battle.expand_fleet({"priority_test_ship": 3, "area_of_effect_test": 3},
+            library)
+        defender = battle.expand_fleet({
+            "ship1": 45,
+            "priority_test_target": 4,
+            "ship2": 10,
+        }, library)
+        result = battle.fleet_attack(attacker, defender, 0, random.Random(5))
+        hit = [x for x, (fresh, damaged) in enumerate(zip(defender.ships, result.damaged_fleet))
+            if fresh != damaged]
+        self.assertEqual(hit, [3, 7, 10, 15, 29, 42, 45, 47, 50, 53, 57])
+
+    def test_target_index_from_runs(self):
+        library = ShipLibraryMock()
+        ship_count = {"ship1": 20, "test_structure": 3, "priority_test_target": 10}
+        per_ship = battle.TargetIndex(battle.expand_fleet(ship_count, library).ships)
+        stacked = battle.TargetIndex.from_runs(
+            battle.expand_combat_fleet(ship_count, library).runs())
+        priority = frozenset([library.hullclass_ids["priority_test_target"]])
+        self.assertEqual(stacked.all, per_ship.all)
+        self.assertEqual(stacked.total, 30)
+        self.assertEqual(stacked.level(priority), per_ship.level(priority))
+        per_ship_rng = random.Random(2)
+        rng = random.Random(2)
+        for exclude in ([], [0, 5], [24, 30, 31], [21]):
+            self.assertEqual(stacked.pick(rng, exclude), per_ship.pick(per_ship_rng, exclude))
+            self.assertEqual(stacked.pick(rng, exclude, priority),
+                per_ship.pick(per_ship_rng, exclude, priority))
+
+    def test_combat_fleet_stacks(self):
+        library = ShipLibraryMock()
+        fleet = battle.expand_combat_fleet({"ship1": 1000, "ship2": 10}, library)
+        self.assertEqual(len(fleet.segments), 2)
+        self.assertEqual(len(fleet), 1010)
+        self.assertEqual(fleet.ships, battle.expand_fleet({"ship1": 1000, "ship2": 10},
+            library).ships)
+
+        # a hit splits the ship out of its stack
+        hit = fleet.record(500)
+        hit.armor = 0
+        self.assertIs(fleet.record(500), hit)
+        self.assertEqual(fleet.ships[500].attributes.armor, 0)
+        fleet = battle.combat_prune_fleet(battle.AttackResult(None, fleet, 1, 10))
+        self.assertEqual([segment.count for segment in fleet.segments], [500, 1, 499, 10])
+        self.assertIs(fleet.segments[1], hit)
+
+        # a ship repaired back to new rejoins the stack before it
+        hit.armor = hit.schema.armor
+        fleet = battle.combat_prune_fleet(battle.AttackResult(None, fleet, 0, 0))
+        self.assertEqual([segment.count for segment in fleet.segments], [501, 499, 10])
+
+        # dead ships are pruned and short runs between hits are unstacked
+        for position in (0, 3):
+            fleet.record(position).hull = 0
+        fleet = battle.combat_prune_fleet(battle.AttackResult(None, fleet, 2, 0))
+        self.assertEqual([segment.count for segment in fleet.segments][:4], [1, 1, 497, 499])
+        self.assertEqual(fleet.ship_count, {"ship1": 998, "ship2": 10})
+
+    def test_firing_schedule(self):
+        weapon = lambda cycle_time: ship.compile_weapon({"weapon_name": "gun",
+            "weapon_size": 1, "firepower": 100, "area_of_effect": 1,
+            "cycle_time": cycle_time, "priority_targets": []}, {})
+        fast = weapon(1)
+        slow = weapon(3)
+        gunboat = ship._construct_tuple(ship.ShipSchema, {"name": "gunboat"})
+        gunboat.weapon_table = (slow, fast)
+        siege = ship._construct_tuple(ship.ShipSchema, {"name": "siege"})
+        siege.weapon_table = (slow,)
+
+        schedule = battle.FiringSchedule([gunboat, siege])
+        self.assertEqual(schedule.periods, [1, 3])
+        self.assertEqual(schedule.firing(0), {"gunboat": (slow, fast), "siege": (slow,)})
+        self.assertEqual(schedule.firing(1), {"gunboat": (fast,)})
+        self.assertIs(schedule.firing(4), schedule.firing(1))
+        self.assertEqual(battle.FiringSchedule([siege]).firing(2), {})
+
+    def test_fleet_attack_while_reloading(self):
+        library = ShipLibraryMock()
+        schema = library.get_ship_schemata("ship1")
+        siege = schema._replace(name="siege",
+            weapons=[dict(weapon, cycle_time=2) for weapon in schema.weapons])
+        attacker = Fleet([Ship(siege, ShipAttributes(10, 10, 100))] * 2, {"siege": 2})
+        defender = battle.expand_fleet({"ship1": 2}, library)
+        schedule = battle.FiringSchedule([siege])
+        result = battle.fleet_attack(attacker, defender, 1, random.Random(0), schedule)
+        self.assertEqual((result.hits_taken, result.damage_taken), (0, 0))
+        self.assertEqual(result.damaged_fleet, defender.ships)
+        result = battle.fleet_attack(attacker, defender, 2, random.Random(0), schedule)
+        self.assertEqual(result.hits_taken, 2)
+
     def test_size_unity_factor(self):
         self.assertEqual(battle.size_damage_factor(2,2), 1.0)
 
@@ -1121,6 +1303,23 @@ class BattleTestCase(TestCase):
         result = battle.repair_fleet(tattered_fleet)
         self.assertEqual(result, expected_fleet)
 
+    def test_combat_repair_fleet_uses_hits(self):
+        library = ShipLibraryMock()
+        fleet = battle.expand_combat_fleet({"ship1": 20, "remote_rep_test": 3}, library)
+        self.assertEqual(fleet.logistics, [fleet.segments[1]])
+        self.assertEqual(fleet.damaged_records(), [])
+        attacker = battle.expand_combat_fleet({"ship1": 1}, library)
+        result = battle.combat_fleet_attack(attacker, fleet, 0, random.Random(1))
+        victim, = fleet.damaged_records()
+        self.assertEqual(list(fleet.hits.values()), [victim])
+        self.assertEqual(victim.shield, 0)
+
+        battle.combat_repair_fleet(fleet, random.Random(1))
+        self.assertEqual(victim.shield, victim.schema.shield)
+        pruned = battle.combat_prune_fleet(result)
+        self.assertEqual(pruned.hits, {})
+        self.assertEqual(len(pruned.logistics), 1)
+
     def test_calculate_battle(self):
         attacker = {
             "ship2": 25,
@@ -1204,10 +1403,34 @@ class BattleTestCase(TestCase):
             "defender_result": {},
             "defender_losses": {"ship1": 25},
             "defender_shots_fired": 34,
-            "defender_damage_dealt": 1_700
+            "defender_damage_dealt": 1_700,
+            "attacker_ship_stats": {
+                "ship2": {"shots_fired": 50, "damage_dealt": 3_000, "kills": 25},
+            },
+            "defender_ship_stats": {
+                "ship1": {"shots_fired": 34, "damage_dealt": 1_700, "kills": 0},
+            },
         }
         self.assertEqual(summary, summary_test)
 
+    def test_ship_stats_add_up(self):
+        library = ShipLibraryMock()
+        attacker = {"ship1": 20, "ship2": 10}
+        defender = {"ship1": 15, "ship2": 10}
+        for engine in battle.ENGINES:
+            summary = Battle(attacker, defender, 4, library, engine=engine,
+                seed=2).generate_summary_data()
+            for side, other in (("attacker", "defender"), ("defender", "attacker")):
+                stats = summary[side + "_ship_stats"].values()
+                self.assertEqual(len(stats), 2)
+                self.assertAlmostEqual(sum(s["shots_fired"] for s in stats),
+                    summary[side + "_shots_fired"])
+                self.assertAlmostEqual(sum(s["damage_dealt"] for s in stats),
+                    summary[side + "_damage_dealt"], places=6)
+                self.assertAlmostEqual(sum(s["kills"] for s in stats),
+                    # expected engine counts are rounded to two decimals
+                    sum(summary[other + "_losses"].values()), delta=0.01)
+
     def test_generate_summary_text(self):
         attacker = {
             "ship2": 25,
@@ -1328,6 +1551,451 @@ Defender:
         self.assertEqual(output_lines, battle_instance.generate_summary_text())
 
 
+class ArrayEngineTestCase(TestCase):
+    # the numpy engine draws different random numbers than the python
+    # engine, these fights are chosen so the outcome does not depend on them
+
+    def setUp(self):
+        random.seed(0)
+        self.library = ShipLibraryMock()
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            Battle({"ship1": 1}, {"ship1": 1}, 1, self.library, engine="abacus")
+
+    def test_expand_array_fleet(self):
+        schema = self.library.get_ship_schemata("ship1")
+        result = battle_numpy.expand_array_fleet({"ship1": 3}, self.library)
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result.ship_count, {"ship1": 3})
+        self.assertEqual(result.ships, [Ship(schema, ShipAttributes(10, 10, 100))] * 3)
+
+    def test_array_true_damage_matches_true_damage(self):
+        d = ship._construct_tuple(ShipDebuffs, {})
+        sizes = [(1, 2), (2, 2), (3, 2), (1000, 2), (10_000, 9_999)]
+        result = battle_numpy.array_true_damage(100,
+            battle_numpy.np.array([w for w, t in sizes]),
+            battle_numpy.np.array([t for w, t in sizes]), 0, 0, 0)
+        self.assertEqual(result.tolist(),
+            [battle.true_damage(100, w, t, d, d) for w, t in sizes])
+
+    def test_aoe_weapon(self):
+        battle_instance = Battle({"area_of_effect_test": 1}, {"ship1": 3}, 1,
+            self.library, engine="numpy")
+        self.assertEqual(battle_instance.attacker_result, {"area_of_effect_test": 1})
+        self.assertEqual(battle_instance.defender_result, {})
+        self.assertEqual(battle_instance.round_results[0][1].damage_taken, 360)
+
+    def test_aoe_kernel(self):
+        # priority group [10, 11] is used up first, the rest comes from a
+        # partial shuffle of [20, 21, 22] driven by the draws
+        pool = [10, 11, 20, 21, 22]
+        hit_shooters = [0] * 6
+        hit_targets = [0] * 6
+        hits = battle_numpy._aoe_kernel(pool, [0, 2, 5], [7, 8], 3,
+            [0.9, 0.0, 0.0, 0.5, 0.0, 0.0], hit_shooters, hit_targets)
+        self.assertEqual(hits, 6)
+        self.assertEqual(hit_shooters, [7, 7, 7, 8, 8, 8])
+        self.assertEqual(hit_targets, [10, 11, 22, 10, 11, 21])
+
+    @skipIf(battle_numpy.numba is None, "numba is not installed")
+    def test_aoe_kernel_jit_matches_python(self):
+        np = battle_numpy.np
+        groups = [np.arange(0, 5), np.arange(5, 40)]
+        shooters = np.arange(100, 150)
+        results = []
+        for use_jit in (True, False):
+            battle_numpy.USE_JIT = use_jit
+            try:
+                results.append(battle_numpy._pick_targets(
+                    groups, shooters, 8, np.random.default_rng(3)))
+            finally:
+                battle_numpy.USE_JIT = battle_numpy._aoe_kernel_jit is not None
+        self.assertEqual(results[0][0].tolist(), results[1][0].tolist())
+        self.assertEqual(results[0][1].tolist(), results[1][1].tolist())
+
+    def test_aoe_kernel_array_path_matches_python(self):
+        # runs the jit branch of _pick_targets with the undecorated kernel,
+        # so the numpy array calling convention is covered without numba
+        np = battle_numpy.np
+        groups = [np.arange(0, 5), np.arange(5, 40)]
+        shooters = np.arange(100, 150)
+        results = []
+        for kernel in (battle_numpy._aoe_kernel, None):
+            jit, use_jit = battle_numpy._aoe_kernel_jit, battle_numpy.USE_JIT
+            battle_numpy._aoe_kernel_jit = kernel
+            battle_numpy.USE_JIT = kernel is not None
+            try:
+                results.append(battle_numpy._pick_targets(
+                    groups, shooters, 8, np.random.default_rng(3)))
+            finally:
+                battle_numpy._aoe_kernel_jit, battle_numpy.USE_JIT = jit, use_jit
+        self.assertEqual(results[0][0].tolist(), results[1][0].tolist())
+        self.assertEqual(results[0][1].tolist(), results[1][1].tolist())
+        hit_shooters, hit_targets = results[0]
+        self.assertEqual(len(hit_targets), 50 * 8)
+        for shooter in shooters:
+            targets = hit_targets[hit_shooters == shooter].tolist()
+            # the priority group is used up first, then distinct others
+            self.assertEqual(targets[:5], list(range(5)))
+            self.assertEqual(len(set(targets)), 8)
+
+    def test_multiple_weapons(self):
+        battle_instance = Battle({"multiple_weapon_test": 1}, {"ship2": 1}, 1,
+            self.library, calculate=False, engine="numpy")
+        battle_instance.calculate_round(0)
+        self.assertEqual(battle_instance.defender_fleet.ships, [])
+        self.assertEqual(battle_instance.attacker_fleet.ships, [])
+
+    def test_priority_targets(self):
+        battle_instance = Battle({"priority_test_ship": 1},
+            {"priority_test_not_target": 1, "priority_test_target": 1}, 2,
+            self.library, engine="numpy")
+        counts = [(a.ship_count, d.ship_count)
+            for a, d in battle_instance.round_results]
+        self.assertEqual(counts, [
+            ({"priority_test_ship": 1}, {"priority_test_not_target": 1}),
+            ({"priority_test_ship": 1}, {})
+        ])
+
+    def test_calculate_battle_stalemate(self):
+        stalemates = {"ship4": 3}
+        battle_instance = Battle(stalemates, stalemates, 6, self.library, engine="numpy")
+        self.assertEqual(len(battle_instance.round_results), 6)
+        for a, d in battle_instance.round_results:
+            self.assertEqual(a, battle.RoundResult(stalemates, 3, 750_000))
+            self.assertEqual(d, battle.RoundResult(stalemates, 3, 750_000))
+
+    def test_ewar_ecm_battle(self):
+        # the target has no sensor strength so it is jammed on every roll
+        battle_instance = Battle({"ewar_ecm_test": 1}, {"ewar_test_target": 1}, 6,
+            self.library, engine="numpy")
+        self.assertEqual(battle_instance.attacker_result, {"ewar_ecm_test": 1})
+        self.assertEqual(battle_instance.defender_result, {})
+
+    def test_repair_fleet(self):
+        fleet = battle_numpy.expand_array_fleet({"remote_rep_test": 3}, self.library)
+        fleet.shield[:] = [100, 0, 50]
+        fleet.armor[:] = [100, 100, 100]
+        rng = battle_numpy.np.random.default_rng(0)
+        battle_numpy.array_repair_fleet(fleet, rng)
+        # 3 logi ships rep 10 shield each, split over the 2 damaged ships
+        self.assertEqual(fleet.shield[0], 100)
+        self.assertEqual(fleet.shield.sum(), 100 + 0 + 50 + 30)
+        self.assertEqual(fleet.armor.tolist(), [100, 100, 100])
+
+    def test_summary_shape_matches_python_engine(self):
+        attacker = {"ship2": 25}
+        defender = {"ship1": 25}
+        python_summary = Battle(attacker, defender, 6, self.library).generate_summary_data()
+        numpy_summary = Battle(attacker, defender, 6, self.library,
+            engine="numpy").generate_summary_data()
+        self.assertEqual(python_summary.keys(), numpy_summary.keys())
+        self.assertEqual(numpy_summary["defender_result"], {})
+        self.assertEqual(numpy_summary["attacker_losses"], {"ship2": 0})
+
+
+class ExpectedEngineTestCase(TestCase):
+
+    def setUp(self):
+        self.library = ShipLibraryMock()
+
+    def test_expand_expected_fleet(self):
+        result = battle_expected.expand_expected_fleet(
+            {"ship1": 3, "ship2": 0}, self.library)
+        self.assertEqual(result.ship_count, {"ship1": 3})
+        self.assertEqual(result.wear, {"ship1": 0})
+        self.assertEqual(result.jammed, {"ship1": 0})
+
+    def test_deterministic(self):
+        attacker = {"ship1": 15, "remote_rep_test": 5, "ewar_ecm_test": 3}
+        defender = {"ship1": 20, "ewar_test": 4}
+        first = Battle(attacker, defender, 6, self.library, engine="expected")
+        random.seed(1)
+        second = Battle(attacker, defender, 6, self.library, engine="expected")
+        self.assertEqual(first.round_results, second.round_results)
+
+    def test_poisson_kill(self):
+        self.assertEqual(battle_expected._poisson_kill(2.0, 0), (1.0, 0.0))
+        self.assertEqual(battle_expected._poisson_kill(0.0, 3), (0.0, 0.0))
+        kill_chance, survivor_hits = battle_expected._poisson_kill(1.0, 1)
+        self.assertAlmostEqual(kill_chance, 1 - math.exp(-1))
+        self.assertEqual(survivor_hits, 0)
+
+    def test_poisson_kill_large_rate(self):
+        # exp(-rate) underflows above ~745, the terms are taken in log space
+        def kill_chance(rate, needed):
+            return 1 - sum(math.exp(k * math.log(rate) - rate - math.lgamma(k + 1))
+                for k in range(needed))
+        for rate, needed in ((1000.0, 1000), (800.0, 900), (5000.0, 4900)):
+            self.assertAlmostEqual(battle_expected._poisson_kill(rate, needed)[0],
+                kill_chance(rate, needed), places=9)
+        self.assertAlmostEqual(battle_expected._poisson_kill(1000.0, 1000)[1], 974.56, places=2)
+        self.assertEqual(battle_expected._poisson_kill(5000.0, 100), (1.0, 0.0))
+
+    def test_large_rate_survivor(self):
+        # 850 fighters deal at most 8500 damage to a 9000 hull ship
+        with open(join(dirname(__file__), "data", "Ships_Config.json")) as fd:
+            raw_data = json.load(fd)
+        raw_data["ships"]["Standard Siege Engine"].update(shield=0, armor=0, hull=9000)
+        library = ShipLibrary()
+        library._load(raw_data)
+        for engine in ("python", "expected"):
+            battle_instance = Battle({"Standard Fighter": 850},
+                {"Standard Siege Engine": 1}, 1, library, engine=engine, seed=1)
+            self.assertGreater(
+                battle_instance.defender_result.get("Standard Siege Engine", 0), 0.9)
+
+    def test_aoe_weapon(self):
+        battle_instance = Battle({"area_of_effect_test": 1}, {"ship1": 3}, 1,
+            self.library, engine="expected")
+        # one shot hits each ship, Poisson hits leave e**-1 of them alive
+        self.assertEqual(battle_instance.round_results[0][1].hits_taken, 1)
+        self.assertEqual(battle_instance.defender_result,
+            {"ship1": round(3 * math.exp(-1), battle_expected.COUNT_PRECISION)})
+
+    def test_priority_targets(self):
+        battle_instance = Battle({"priority_test_ship": 1},
+            {"priority_test_not_target": 1, "priority_test_target": 1}, 1,
+            self.library, engine="expected")
+        self.assertEqual(battle_instance.defender_result,
+            {"priority_test_not_target": 1})
+
+    def test_dropped_types_count_their_damage(self):
+        # three expected one shot hits on a ship1 leave e**-3 of it, dropped
+        # and counted as killed with all of its hit points
+        fleet = battle_expected.expand_expected_fleet({"ship1": 1}, self.library)
+        attacker = battle_expected.expand_expected_fleet({"area_of_effect_test": 3},
+            self.library)
+        attack = battle_expected.expected_fleet_attack(attacker, fleet, 0)
+        result, damage_taken, stats = battle_expected.expected_apply_attack(fleet, attack)
+        self.assertEqual(result.count, {})
+        schema = self.library.get_ship_schemata("ship1")
+        hp = schema.shield + schema.armor + schema.hull
+        self.assertAlmostEqual(damage_taken, hp)
+        self.assertAlmostEqual(stats["area_of_effect_test"].damage, hp)
+        self.assertAlmostEqual(stats["area_of_effect_test"].kills, 1.0)
+
+    def test_calculate_battle_stalemate(self):
+        stalemates = {"ship4": 3}
+        battle_instance = Battle(stalemates, stalemates, 6, self.library,
+            engine="expected")
+        self.assertEqual(len(battle_instance.round_results), 6)
+        for a, d in battle_instance.round_results:
+            self.assertEqual(a, d)
+            self.assertAlmostEqual(a.ship_count["ship4"], 3, delta=0.05)
+
+    def test_ewar_ecm_battle(self):
+        # sensor strength 0, every hit from the ECM jams the target
+        fleet = battle_expected.expand_expected_fleet(
+            {"ewar_test_target": 1}, self.library)
+        ecm = battle_expected.expand_expected_fleet({"ewar_ecm_test": 1}, self.library)
+        attack = battle_expected.expected_fleet_attack(ecm, fleet, 0)
+        self.assertEqual(attack.jam_rate, {"ewar_test_target": 1})
+        battle_instance = Battle({"ewar_ecm_test": 1}, {"ewar_test_target": 1}, 6,
+            self.library, engine="expected")
+        self.assertEqual(battle_instance.defender_result, {})
+
+    def test_overwhelming_side_wins(self):
+        battle_instance = Battle({"ship2": 25}, {"ship1": 25}, 6, self.library,
+            engine="expected")
+        summary = battle_instance.generate_summary_data()
+        self.assertEqual(summary.keys(),
+            Battle({"ship2": 25}, {"ship1": 25}, 6, self.library).generate_summary_data().keys())
+        self.assertEqual(summary["defender_result"], {})
+        self.assertLess(summary["attacker_losses"]["ship2"], 1)
+
+
+class LanchesterEngineTestCase(TestCase):
+
+    def setUp(self):
+        self.library = ShipLibrary(join(dirname(__file__), "data", "Ships_Config.json"))
+
+    def test_applicable(self):
+        frigates = {"Standard Frigate": 10}
+        self.assertTrue(battle.lanchester_applicable(
+            frigates, {"Standard Cruiser": 2, "Standard Fighter": 0}, self.library))
+        self.assertFalse(battle.lanchester_applicable(
+            frigates, {"Standard Cruiser": 2, "Standard Fighter": 1}, self.library))
+        self.assertFalse(battle.lanchester_applicable(frigates, {}, self.library))
+        mock = ShipLibraryMock()
+        # local repairs and ECM need a simulation
+        self.assertFalse(battle.lanchester_applicable({"ship1": 1}, {"ship2": 1}, mock))
+        self.assertFalse(battle.lanchester_applicable(
+            {"ewar_ecm_test": 1}, {"ewar_test_target": 1}, mock))
+
+    def test_falls_back_to_simulation(self):
+        mock = ShipLibraryMock()
+        fallback = Battle({"ship2": 5}, {"ship1": 5}, 6, mock, engine="lanchester", seed=1)
+        self.assertEqual(fallback.engine, "python")
+        self.assertEqual(fallback.round_results,
+            Battle({"ship2": 5}, {"ship1": 5}, 6, mock, seed=1).round_results)
+        expected = Battle({"ship2": 5}, {"ship1": 5}, 6, mock, engine="lanchester",
+            fallback_engine="expected")
+        self.assertEqual(expected.engine, "expected")
+        with self.assertRaises(ValueError):
+            Battle({"ship2": 5}, {"ship1": 5}, 6, mock, engine="lanchester",
+                fallback_engine="lanchester")
+
+    def test_lanchester_attack(self):
+        # 120 damage against 130 hp frigates, two hits per kill.  Each ship
+        # takes Binomial(10, 0.1) hits from the 10 shooters
+        attacker = battle.expand_lanchester_fleet({"Standard Frigate": 10}, self.library)
+        defender = battle.expand_lanchester_fleet({"Standard Frigate": 10}, self.library)
+        none, one = 0.9 ** 10, 10 * 0.1 * 0.9 ** 9
+        shots, taken, kills = battle.lanchester_attack(attacker, defender, 0)
+        self.assertEqual(shots, 10)
+        self.assertAlmostEqual(kills, 10 * (1 - none - one))
+        self.assertAlmostEqual(taken, 10 * (one * 120 + (1 - none - one) * 130))
+        self.assertAlmostEqual(defender.count, 10 * (none + one))
+        self.assertEqual(defender.health.keys(), {130, 10})
+        self.assertAlmostEqual(defender.health[10], one / (none + one))
+        self.assertEqual(defender.ship_count, {"Standard Frigate": 7.36})
+
+    def test_lanchester_area_of_effect(self):
+        # a shot covering the whole fleet hits every ship exactly once
+        schema = self.library.get_ship_schemata("Standard Frigate")
+        wide = schema._replace(name="Wide Frigate",
+            weapons=[dict(weapon, area_of_effect=10) for weapon in schema.weapons])
+        attacker = battle.LanchesterFleet(wide, 2)
+        defender = battle.expand_lanchester_fleet({"Standard Frigate": 10}, self.library)
+        self.assertEqual(battle.lanchester_attack(attacker, defender, 0), (2, 1300, 10))
+        self.assertEqual(defender.ship_count, {})
+
+    def test_lanchester_merges_health(self):
+        attacker = battle.expand_lanchester_fleet({"Standard Fighter": 5000}, self.library)
+        defender = battle.expand_lanchester_fleet(
+            {"Projected Warp Core Destabilization Matrix": 3}, self.library)
+        for r in range(3):
+            battle.lanchester_attack(attacker, defender, r)
+            self.assertLessEqual(len(defender.health), battle.LANCHESTER_STATES)
+        self.assertAlmostEqual(sum(defender.health.values()), 1)
+
+    def test_battle(self):
+        battle_instance = Battle({"Standard Frigate": 10}, {"Standard Frigate": 10}, 8,
+            self.library, engine="lanchester")
+        self.assertEqual(battle_instance.engine, "lanchester")
+        # fire is simultaneous, both sides lose the same
+        self.assertEqual([d for a, d in battle_instance.round_results],
+            [a for a, d in battle_instance.round_results])
+        self.assertEqual(battle_instance.round_results[0][0].ship_count,
+            {"Standard Frigate": 7.36})
+        self.assertEqual(battle_instance.attacker_result, {})
+        summary = battle_instance.generate_summary_data()
+        stats = summary["attacker_ship_stats"]["Standard Frigate"]
+        self.assertAlmostEqual(stats["kills"], 10)
+        self.assertAlmostEqual(stats["damage_dealt"], 1300)
+
+    def test_matches_python_engine(self):
+        # random fire is modelled, survivors stay within 5% of the starting
+        # fleet of the python engine's average over seeds
+        for attacker, defender in (
+                ({"Standard Frigate": 500}, {"Standard Destroyer": 200}),
+                ({"Standard Cruiser": 40}, {"Standard Frigate": 150}),
+                ({"Standard Destroyer": 60}, {"Standard Destroyer": 50}),
+                ({"Standard Corvette": 200}, {"Standard Battlecruiser": 12})):
+            estimate = Battle(attacker, defender, 10, self.library, engine="lanchester")
+            simulated = [Battle(attacker, defender, 10, self.library, seed=seed,
+                keep_rounds=False) for seed in range(10)]
+            for fleet, estimated, results in (
+                    (attacker, estimate.attacker_result, [x.attacker_result for x in simulated]),
+                    (defender, estimate.defender_result, [x.defender_result for x in simulated])):
+                name, = fleet
+                average = sum(result.get(name, 0) for result in results) / len(results)
+                self.assertLessEqual(abs(estimated.get(name, 0) - average), 0.05 * fleet[name])
+
+
+class BattleStreamTestCase(TestCase):
+
+    def setUp(self):
+        self.library = ShipLibraryMock()
+        self.attacker = {"ship1": 15, "remote_rep_test": 5, "ewar_ecm_test": 3}
+        self.defender = {"ship1": 20, "ewar_test": 4}
+
+    def fight(self, **kw):
+        return Battle(self.attacker, self.defender, 8, self.library, seed=4, **kw)
+
+    def test_iter_rounds_matches_calculate_battle(self):
+        full = self.fight()
+        streamed = self.fight(calculate=False)
+        self.assertEqual(list(streamed.iter_rounds()), full.round_results)
+        self.assertEqual(streamed.generate_summary_data(), full.generate_summary_data())
+
+    def test_early_cancel(self):
+        battle_instance = self.fight(calculate=False)
+        rounds = battle_instance.iter_rounds()
+        first = next(rounds)
+        rounds.close()
+        self.assertEqual(battle_instance.rounds_fought, 1)
+        self.assertEqual(battle_instance.attacker_result, first[0].ship_count)
+        self.assertEqual(battle_instance.generate_summary_data()["attacker_shots_fired"],
+            first[1].hits_taken)
+
+    def test_resume(self):
+        full = self.fight()
+        battle_instance = self.fight(calculate=False)
+        for round_result in battle_instance.iter_rounds():
+            break
+        battle_instance.calculate_battle()
+        self.assertEqual(battle_instance.round_results, full.round_results)
+
+    def test_keep_rounds_false(self):
+        for engine in battle.ENGINES:
+            full = self.fight(engine=engine)
+            aggregate = self.fight(engine=engine, keep_rounds=False)
+            self.assertEqual(aggregate.round_results, [])
+            self.assertEqual(aggregate.rounds_fought, len(full.round_results))
+            self.assertEqual(aggregate.generate_summary_data(),
+                full.generate_summary_data())
+
+    def test_no_rounds(self):
+        battle_instance = Battle({"ship1": 2}, {}, 8, self.library)
+        self.assertEqual(battle_instance.rounds_fought, 0)
+        self.assertEqual(battle_instance.attacker_result, {"ship1": 2})
+
+
+class BattleRNGTestCase(TestCase):
+
+    def setUp(self):
+        self.library = ShipLibraryMock()
+        self.attacker = {"ship1": 15, "remote_rep_test": 5, "ewar_ecm_test": 3}
+        self.defender = {"ship1": 20, "ewar_test": 4}
+
+    def fight(self, **kw):
+        return Battle(self.attacker, self.defender, 6, self.library, **kw)
+
+    def test_same_seed_same_battle(self):
+        first = self.fight(rng=random.Random(5))
+        second = self.fight(rng=random.Random(5))
+        self.assertEqual(first.round_results, second.round_results)
+        self.assertEqual(first.round_results, self.fight(seed=5).round_results)
+
+    def test_rng_does_not_touch_global_random(self):
+        random.seed(3)
+        expected = random.random()
+        random.seed(3)
+        self.fight(rng=random.Random(1))
+        self.assertEqual(random.random(), expected)
+
+    def test_numpy_generator(self):
+        np = battle_numpy.np
+        first = self.fight(rng=np.random.default_rng(7))
+        second = self.fight(rng=np.random.default_rng(7))
+        self.assertEqual(first.round_results, second.round_results)
+
+    def test_numpy_engine_seed(self):
+        first = self.fight(seed=11, engine="numpy")
+        second = self.fight(rng=random.Random(11), engine="numpy")
+        self.assertEqual(first.round_results, second.round_results)
+
+    def test_helpers_use_rng(self):
+        schema = self.library.get_ship_schemata("remote_rep_test")
+        fleet = [Ship(schema, ShipAttributes(x, x, 100)) for x in range(0, 100, 10)]
+        first = battle.repair_fleet(list(fleet), random.Random(2))
+        second = battle.repair_fleet(list(fleet), random.Random(2))
+        self.assertEqual(first, second)
+
+
 class SimBase(object):
 
     def set_library(self, target_file):
@@ -0,0 +1,90 @@
+from unittest import TestCase
+from os.path import join, dirname
+import json
+
+from idleiss.battle import Battle
+from idleiss.battle_cache import BattleCache
+from idleiss.ship import ShipLibrary
+
+path_to_file = lambda fn: join(dirname(__file__), "data", fn)
+
+class BattleCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.library = ShipLibrary(path_to_file("Ships_Config.json"))
+        self.site = {"Standard Fighter": 3}
+        self.player = {"Standard Corvette": 2, "Standard Fighter": 4}
+
+    def test_hit_returns_stored_summary(self):
+        cache = BattleCache()
+        first = cache.fight(self.player, self.site, 6, self.library, seed=1)
+        second = cache.fight(self.player, self.site, 6, self.library, seed=1)
+        self.assertEqual(first, second)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(len(cache), 1)
+
+    def test_matches_uncached_battle(self):
+        cache = BattleCache()
+        summary = cache.fight(self.player, self.site, 6, self.library, seed=3)
+        self.assertEqual(summary, Battle(self.player, self.site, 6, self.library,
+            seed=3).generate_summary_data())
+
+    def test_fleet_order_is_kept(self):
+        cache = BattleCache()
+        cache.fight(self.player, self.site, 6, self.library, seed=1)
+        reordered = dict(reversed(list(self.player.items())))
+        summary = cache.fight(reordered, self.site, 6, self.library, seed=1)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assertEqual(summary, Battle(reordered, self.site, 6, self.library,
+            seed=1).generate_summary_data())
+
+    def test_key_includes_seed_rounds_and_engine(self):
+        cache = BattleCache()
+        cache.fight(self.player, self.site, 6, self.library, seed=1)
+        cache.fight(self.player, self.site, 6, self.library, seed=2)
+        cache.fight(self.player, self.site, 7, self.library, seed=1)
+        cache.fight(self.player, self.site, 6, self.library, seed=1, engine="numpy")
+        self.assertEqual((cache.hits, cache.misses), (0, 4))
+
+    def test_no_seed_is_never_cached(self):
+        cache = BattleCache()
+        cache.fight(self.player, self.site, 6, self.library, seed=None)
+        cache.fight(self.player, self.site, 6, self.library, seed=None)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 0))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = BattleCache(maxsize=2)
+        cache.fight(self.player, self.site, 6, self.library, seed=1)
+        cache.fight(self.player, self.site, 6, self.library, seed=2)
+        cache.fight(self.player, self.site, 6, self.library, seed=1)
+        cache.fight(self.player, self.site, 6, self.library, seed=3)
+        self.assertEqual(len(cache), 2)
+        cache.fight(self.player, self.site, 6, self.library, seed=1)
+        self.assertEqual(cache.hits, 2)
+        cache.fight(self.player, self.site, 6, self.library, seed=2)
+        self.assertEqual(cache.hits, 2)
+
+    def test_returned_summary_is_a_copy(self):
+        cache = BattleCache()
+        summary = cache.fight(self.player, self.site, 6, self.library, seed=1)
+        summary["attacker_result"].clear()
+        self.assertNotEqual(
+            cache.fight(self.player, self.site, 6, self.library, seed=1)["attacker_result"], {})
+
+    def test_library_reload_invalidates(self):
+        cache = BattleCache()
+        cache.fight(self.player, self.site, 6, self.library, seed=1)
+        with open(path_to_file("Ships_Config.json")) as fd:
+            raw_data = json.load(fd)
+        raw_data["ships"]["Standard Fighter"]["hull"] += 1
+        self.library._load(raw_data)
+        cache.fight(self.player, self.site, 6, self.library, seed=1)
+        self.assertEqual(cache.info().invalidations, 1)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 2, 1))
+
+    def test_same_library_reload_keeps_entries(self):
+        cache = BattleCache()
+        cache.fight(self.player, self.site, 6, self.library, seed=1)
+        self.library.load(path_to_file("Ships_Config.json"))
+        cache.fight(self.player, self.site, 6, self.library, seed=1)
+        self.assertEqual(cache.hits, 1)
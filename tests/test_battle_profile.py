@@ -0,0 +1,111 @@
+from unittest import TestCase
+from os.path import join, dirname
+import tracemalloc
+
+from idleiss import battle
+from idleiss.battle import Battle
+from idleiss.battle_profile import BattleProfiler
+from idleiss.ship import ShipLibrary
+
+path_to_file = lambda fn: join(dirname(__file__), "data", fn)
+
+PYTHON_PHASES = {"fleet_attack", "ship_attack", "grab_debuffs", "repair_fleet", "prune_fleet"}
+
+class BattleProfilerTestCase(TestCase):
+
+    def setUp(self):
+        self.library = ShipLibrary(path_to_file("Ships_Config.json"))
+        self.attacker = {"Standard Corvette": 20, "Standard Fighter": 40}
+        self.defender = {"Standard Frigate": 15, "Standard Fighter": 30}
+
+    def fight(self, **kw):
+        return Battle(self.attacker, self.defender, 6, self.library, seed=2, **kw)
+
+    def test_same_result_as_unprofiled_battle(self):
+        profiled = self.fight(instrument=BattleProfiler())
+        self.assertEqual(profiled.round_results, self.fight().round_results)
+        profiled = self.fight(instrument=BattleProfiler(memory=True))
+        self.assertEqual(profiled.round_results, self.fight().round_results)
+
+    def test_python_phases(self):
+        profiler = BattleProfiler()
+        battle_instance = self.fight(instrument=profiler)
+        self.assertEqual(set(profiler.calls), PYTHON_PHASES)
+        rounds = battle_instance.rounds_fought
+        self.assertEqual(profiler.calls["fleet_attack"], 2 * rounds)
+        self.assertEqual(profiler.calls["prune_fleet"], 2 * rounds)
+        self.assertGreater(profiler.calls["ship_attack"], 0)
+        self.assertGreater(profiler.calls["grab_debuffs"], 0)
+        self.assertEqual([profile.round_number for profile in profiler.rounds],
+            list(range(rounds)))
+        for phase, seconds in profiler.times.items():
+            self.assertGreaterEqual(seconds, 0.0)
+
+    def test_memory(self):
+        profiler = BattleProfiler()
+        self.fight(instrument=profiler)
+        self.assertEqual({(x.allocated_blocks, x.peak_bytes) for x in profiler.rounds},
+            {(None, None)})
+        profiler = BattleProfiler(memory=True)
+        self.fight(instrument=profiler)
+        self.assertFalse(tracemalloc.is_tracing())
+        for profile in profiler.rounds:
+            self.assertGreater(profile.allocated_blocks, 0)
+            self.assertGreater(profile.peak_bytes, 0)
+
+    def test_allocated_blocks(self):
+        # blocks a round allocates and keeps are counted, however few bytes
+        profiler = BattleProfiler(memory=True)
+        kept = []
+        with profiler.round(0):
+            kept.extend(object() for x in range(1000))
+        self.assertGreaterEqual(profiler.rounds[0].allocated_blocks, 1000)
+        self.assertLess(profiler.rounds[0].allocated_blocks, 1100)
+
+    def test_selected_phases(self):
+        profiler = BattleProfiler(phases=("fleet_attack", "prune_fleet"))
+        battle_instance = self.fight(instrument=profiler)
+        self.assertEqual(set(profiler.calls), {"fleet_attack", "prune_fleet"})
+        self.assertEqual(battle_instance.round_results, self.fight().round_results)
+        self.assertIs(profiler.timed("ship_attack", battle.combat_ship_attack),
+            battle.combat_ship_attack)
+
+    def test_modules_untouched(self):
+        names = ["combat_fleet_attack", "combat_ship_attack", "grab_debuffs",
+            "combat_repair_fleet", "combat_prune_fleet", "lanchester_attack"]
+        originals = {name: getattr(battle, name) for name in names}
+        profiler = BattleProfiler()
+        battle_instance = self.fight(instrument=profiler, calculate=False)
+        with profiler.round(0):
+            for name, function in originals.items():
+                self.assertIs(getattr(battle, name), function)
+            # a battle fought meanwhile without the instrument is not counted
+            self.fight()
+        self.assertEqual(profiler.calls, {})
+        battle_instance.calculate_battle()
+        self.assertEqual(set(profiler.calls), PYTHON_PHASES)
+
+    def test_other_engines(self):
+        expected = {
+            "numpy": {"fleet_attack", "repair_fleet", "prune_fleet"},
+            "expected": {"fleet_attack", "apply_attack"},
+        }
+        for engine, phases in expected.items():
+            profiler = BattleProfiler()
+            self.fight(engine=engine, instrument=profiler)
+            self.assertEqual(set(profiler.calls), phases)
+        profiler = BattleProfiler()
+        Battle({"Standard Fighter": 40}, {"Standard Frigate": 15}, 6, self.library,
+            seed=2, engine="lanchester", instrument=profiler)
+        self.assertEqual(set(profiler.calls), {"fleet_attack"})
+
+    def test_report(self):
+        profiler = BattleProfiler()
+        battle_instance = self.fight(instrument=profiler)
+        report = profiler.report()
+        for phase in PYTHON_PHASES:
+            self.assertIn(phase, report)
+        self.assertIn("allocated blocks", report)
+        self.assertIn("peak bytes", report)
+        self.assertEqual(len(report.splitlines()),
+            len(PYTHON_PHASES) + battle_instance.rounds_fought + 4)
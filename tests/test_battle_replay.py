@@ -0,0 +1,98 @@
+from unittest import TestCase
+from os.path import join, dirname
+import copy
+import json
+
+from idleiss.battle import Battle
+from idleiss.battle_replay import BattleRecorder
+from idleiss.battle_replay import BattleReplay
+from idleiss.ship import ShipLibrary
+
+path_to_file = lambda fn: join(dirname(__file__), "data", fn)
+
+def _library():
+    # the test config with a logistics and an ECM frigate added
+    with open(path_to_file("Ships_Config.json")) as fd:
+        raw_data = json.load(fd)
+    ships = raw_data["ships"]
+    logistics = ships["Logistics Frigate"] = copy.deepcopy(ships["Standard Frigate"])
+    logistics["buffs"] = {"remote_shield_repair": 20, "remote_armor_repair": 20}
+    ecm = ships["ECM Frigate"] = copy.deepcopy(ships["Standard Frigate"])
+    ecm["weapons"].append(dict(ecm["weapons"][0], weapon_name="ECM Burst",
+        firepower=0, debuffs={"ECM": 20}))
+    library = ShipLibrary()
+    library._load(raw_data)
+    return library
+
+def _fleet_state(ships):
+    return [(ship.schema.name, ship.attributes.shield, ship.attributes.armor,
+        ship.attributes.hull, tuple(float(value) for value in ship.debuffs))
+        for ship in ships]
+
+def _replay_state(fleet):
+    return [(ship_type.name, shield, armor, hull, tuple(debuffs))
+        for ship_type, shield, armor, hull, debuffs in zip(fleet.types,
+            fleet.shield, fleet.armor, fleet.hull, fleet.debuffs)]
+
+class BattleReplayTestCase(TestCase):
+
+    def setUp(self):
+        self.library = _library()
+        self.attacker = {"Logistics Frigate": 30, "ECM Frigate": 30, "Standard Fighter": 60}
+        self.defender = {"Standard Frigate": 50, "Standard Corvette": 60}
+
+    def record(self):
+        recorder = BattleRecorder()
+        battle_instance = Battle(self.attacker, self.defender, 8, self.library,
+            seed=4, recorder=recorder, calculate=False)
+        states = [(_fleet_state(battle_instance.attacker_fleet.ships),
+            _fleet_state(battle_instance.defender_fleet.ships))]
+        for round_result in battle_instance.iter_rounds():
+            states.append((_fleet_state(battle_instance.attacker_fleet.ships),
+                _fleet_state(battle_instance.defender_fleet.ships)))
+        return battle_instance, BattleReplay(recorder.getvalue()), states
+
+    def test_recording_does_not_change_the_battle(self):
+        battle_instance, replay, states = self.record()
+        self.assertEqual(battle_instance.round_results, Battle(self.attacker,
+            self.defender, 8, self.library, seed=4).round_results)
+
+    def test_replay_matches_battle(self):
+        battle_instance, replay, states = self.record()
+        self.assertEqual(len(replay), battle_instance.rounds_fought)
+        for k, (replay_round, attacker, defender) in enumerate(replay.replay()):
+            attacker_round, defender_round = battle_instance.round_results[k]
+            self.assertEqual(replay_round.round_number, k)
+            self.assertEqual(attacker.ship_count, attacker_round.ship_count)
+            self.assertEqual(defender.ship_count, defender_round.ship_count)
+            attacker_attack, defender_attack = replay_round.attacks
+            self.assertEqual(attacker_attack.shots, defender_round.hits_taken)
+            self.assertEqual(defender_attack.shots, attacker_round.hits_taken)
+            self.assertEqual(sum(hit.damage for hit in attacker_attack.hits),
+                defender_round.damage_taken)
+            self.assertEqual(sum(hit.damage for hit in defender_attack.hits),
+                attacker_round.damage_taken)
+
+    def test_events(self):
+        battle_instance, replay, states = self.record()
+        rounds = list(replay)
+        hits = [hit for replay_round in rounds for hit in replay_round.attacks[0].hits]
+        self.assertTrue(any(hit.debuffs is not None and hit.debuffs.ECM for hit in hits))
+        self.assertTrue(any(replay_round.repairs[0] for replay_round in rounds))
+        kills = sum(hit.killed for hit in hits)
+        self.assertEqual(kills, sum(self.defender.values())
+            - sum(battle_instance.defender_result.values()))
+
+    def test_seek(self):
+        battle_instance, replay, states = self.record()
+        # forward, backward and repeated seeks all rebuild the same fleets
+        for k in [len(replay), 0, 2, 2, 1, len(replay) - 1]:
+            attacker, defender = replay.fleets(k)
+            self.assertEqual((_replay_state(attacker), _replay_state(defender)), states[k])
+        self.assertRaises(ValueError, replay.fleets, len(replay) + 1)
+
+    def test_stream_and_engines(self):
+        with open(path_to_file("Ships_Config.json")) as fd:
+            self.assertRaises(ValueError, BattleReplay, fd.read().encode("utf-8"))
+        self.assertRaises(ValueError, Battle, self.attacker, self.defender, 8,
+            self.library, engine="numpy", recorder=BattleRecorder())
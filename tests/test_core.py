@@ -1,6 +1,9 @@
 from unittest import TestCase
 from os.path import join, dirname
 import json
+import os
+import shutil
+import tempfile
 
 from idleiss import core
 from idleiss.event import HighEnergyScan
@@ -19,6 +22,16 @@ class CoreTestCase(TestCase):
         engine = core.GameEngine(path_to_file("Small_Universe_Config.json"), path_to_file("Ships_Config.json"), path_to_file("Scan_Config.json"))
         self.assertTrue(engine)
 
+    def test_universe_snapshot(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        snapshot = join(directory, "universe.snapshot")
+        engine = core.GameEngine(path_to_file("Small_Universe_Config.json"), path_to_file("Ships_Config.json"), path_to_file("Scan_Config.json"), universe_snapshot=snapshot)
+        self.assertTrue(os.path.exists(snapshot))
+        loaded = core.GameEngine(path_to_file("Small_Universe_Config.json"), path_to_file("Ships_Config.json"), path_to_file("Scan_Config.json"), universe_snapshot=snapshot)
+        self.assertEqual([x.name for x in loaded.universe.systems],
+            [x.name for x in engine.universe.systems])
+
     def test_update_world_basic(self):
         engine = core.GameEngine(path_to_file("Small_Universe_Config.json"), path_to_file("Ships_Config.json"), path_to_file("Scan_Config.json"))
         user_list = set(["an_user"])
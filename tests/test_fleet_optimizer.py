@@ -0,0 +1,63 @@
+from unittest import TestCase
+from os.path import join, dirname
+
+from idleiss import fleet_optimizer
+from idleiss.montecarlo import estimate_battle
+from idleiss.ship import ShipLibrary
+
+path_to_file = lambda fn: join(dirname(__file__), "data", fn)
+
+class FleetOptimizerTestCase(TestCase):
+
+    def setUp(self):
+        self.library = ShipLibrary(path_to_file("Ships_Config.json"))
+        self.site = {"Standard Fighter": 3}
+        self.ship_types = ["Standard Fighter", "Standard Corvette", "Standard Frigate"]
+
+    def search(self, **kw):
+        options = dict(ship_types=self.ship_types, samples=40, batch_size=10,
+            seed=1, workers=1)
+        options.update(kw)
+        return fleet_optimizer.find_cheapest_fleet(self.site, self.library, **options)
+
+    def test_scaled_fleet(self):
+        self.assertEqual(fleet_optimizer.scaled_fleet({"a": 1}, 5), {"a": 5})
+        self.assertEqual(fleet_optimizer.scaled_fleet({"a": 1, "b": 3}, 10),
+            {"a": 3, "b": 7})
+        self.assertEqual(fleet_optimizer.scaled_fleet({"a": 3, "b": 1}, 1), {"a": 1})
+
+    def test_finds_cheap_winning_fleet(self):
+        result = self.search()
+        self.assertTrue(result.complete)
+        self.assertEqual(result.cost, fleet_optimizer.fleet_cost(result.fleet, self.library))
+        self.assertGreaterEqual(result.success_rate, 0.95)
+        estimate = estimate_battle(result.fleet, self.site, 10, self.library,
+            samples=40, seed=1, workers=1)
+        self.assertEqual(estimate.attacker_win_probability, result.success_rate)
+        # nothing cheaper with the same ships wins as often
+        for ship_type in self.ship_types:
+            schema = self.library.get_ship_schemata(ship_type)
+            count = (result.cost - 1) // fleet_optimizer.ship_cost(schema)
+            if count:
+                estimate = estimate_battle({ship_type: count}, self.site, 10,
+                    self.library, samples=40, seed=1, workers=1)
+                self.assertLess(estimate.attacker_win_probability, 0.95)
+
+    def test_screen_saves_simulations(self):
+        screened = self.search()
+        simulated = self.search(screen=False)
+        self.assertEqual(screened.fleet, simulated.fleet)
+        self.assertGreater(screened.screened, 0)
+        self.assertLess(screened.battles, simulated.battles)
+
+    def test_process_pool_matches_single_process(self):
+        self.assertEqual(self.search(workers=2), self.search())
+
+    def test_time_budget(self):
+        result = self.search(time_budget=0)
+        self.assertFalse(result.complete)
+        self.assertIsNone(result.fleet)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, self.search, success=0)
+        self.assertRaises(ValueError, self.search, samples=0)
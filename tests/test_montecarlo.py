@@ -0,0 +1,59 @@
+from unittest import TestCase
+from os.path import join, dirname
+
+from idleiss import montecarlo
+from idleiss.ship import ShipLibrary
+
+path_to_file = lambda fn: join(dirname(__file__), "data", fn)
+
+class MonteCarloTestCase(TestCase):
+
+    def setUp(self):
+        self.library = ShipLibrary(path_to_file("Ships_Config.json"))
+
+    def test_overwhelming_attacker_always_wins(self):
+        estimate = montecarlo.estimate_battle({"Standard Destroyer": 20},
+            {"Standard Fighter": 3}, 10, self.library, samples=20, seed=0, workers=1)
+        self.assertEqual(estimate.samples, 20)
+        self.assertEqual(estimate.attacker_win_probability, 1.0)
+        self.assertEqual(estimate.defender_win_probability, 0.0)
+        self.assertEqual(estimate.draw_probability, 0.0)
+        self.assertEqual(estimate.defender_mean_losses, {"Standard Fighter": 3.0})
+        self.assertEqual(estimate.defender_loss_percentiles["Standard Fighter"],
+            {5: 3.0, 50: 3.0, 95: 3.0})
+        self.assertEqual(estimate.mean_rounds, 1.0)
+
+    def test_seed_is_reproducible(self):
+        fleet = {"Standard Fighter": 10, "Standard Corvette": 5}
+        first = montecarlo.estimate_battle(fleet, fleet, 6, self.library,
+            samples=10, seed=1, workers=1)
+        second = montecarlo.estimate_battle(fleet, fleet, 6, self.library,
+            samples=10, seed=1, workers=1)
+        self.assertEqual(first, second)
+
+    def test_process_pool_matches_single_process(self):
+        fleet = {"Standard Fighter": 10, "Standard Corvette": 5}
+        single = montecarlo.estimate_battle(fleet, fleet, 6, self.library,
+            samples=12, seed=2, workers=1)
+        pooled = montecarlo.estimate_battle(fleet, fleet, 6, self.library,
+            samples=12, seed=2, workers=2, chunk_size=5)
+        self.assertEqual(single, pooled)
+
+    def test_sample_pool(self):
+        fleet = {"Standard Fighter": 10, "Standard Corvette": 5}
+        seeds = [3, 4, 5]
+        with montecarlo.SamplePool(self.library, 2) as pool:
+            pooled = pool.submit(fleet, fleet, 6, seeds).result()
+        self.assertEqual(pooled,
+            montecarlo.run_samples(fleet, fleet, 6, self.library, seeds))
+
+    def test_numpy_engine(self):
+        estimate = montecarlo.estimate_battle({"Standard Destroyer": 20},
+            {"Standard Fighter": 3}, 10, self.library, samples=10, seed=0,
+            workers=1, engine="numpy")
+        self.assertEqual(estimate.attacker_win_probability, 1.0)
+
+    def test_no_samples(self):
+        with self.assertRaises(ValueError):
+            montecarlo.estimate_battle({"Standard Fighter": 1},
+                {"Standard Fighter": 1}, 1, self.library, samples=0)
@@ -34,6 +34,52 @@ class FleetLibraryTestCase(TestCase):
             ship.ShipBuffs(0, 0, 0, 0),
             ship.ShipDebuffs(0, 0, 0, 0), 0, False, False))
 
+    def test_weapon_table(self):
+        target_path = join(dirname(__file__), "data", "Ships_Config.json")
+        library = ship.ShipLibrary(target_path)
+        schema = library.get_ship_schemata("Standard Fighter")
+        self.assertEqual(schema.hullclass_id,
+            library.hullclasses_data.index("brawler fighter"))
+        self.assertEqual(len(schema.weapon_table), 1)
+        weapon = schema.weapon_table[0]
+        self.assertEqual((weapon.weapon_name, weapon.weapon_size, weapon.firepower,
+            weapon.area_of_effect, weapon.cycle_time, weapon.priority_targets),
+            ("Dual 20mm Autocannon", 15, 10, 1, 1, ()))
+        self.assertEqual(weapon.debuffs, ship.ShipDebuffs(0, 0, 0, 0))
+        with self.assertRaises(AttributeError):
+            weapon.extra = 1
+
+    def test_replace_recompiles(self):
+        target_path = join(dirname(__file__), "data", "Ships_Config.json")
+        library = ship.ShipLibrary(target_path)
+        schema = library.get_ship_schemata("Standard Fighter")
+        renamed = schema._replace(name="Renamed Fighter")
+        self.assertEqual(renamed.hullclass_id, schema.hullclass_id)
+        self.assertEqual(len(renamed.weapon_table), 1)
+        self.assertEqual(renamed.weapon_table[0].firepower, 10)
+        rearmed = schema._replace(hullclass="brawler corvette",
+            weapons=[dict(weapon, firepower=25) for weapon in schema.weapons])
+        self.assertEqual(rearmed.hullclass_id,
+            library.hullclasses_data.index("brawler corvette"))
+        self.assertEqual(rearmed.weapon_table[0].firepower, 25)
+        self.assertEqual(schema.weapon_table[0].firepower, 10)
+        made = ship.ShipSchema._make(schema, library.hullclass_ids)
+        self.assertEqual(made.weapon_table[0].firepower, 10)
+        self.assertEqual(ship.ShipSchema._make(schema).weapon_table, ())
+
+    def test_weapon_table_resolves_priority_and_debuffs(self):
+        weapon = ship.compile_weapon({
+            "weapon_name": "jammer",
+            "weapon_size": 5,
+            "firepower": 0,
+            "area_of_effect": 2,
+            "cycle_time": 3,
+            "priority_targets": [["b", "c"], ["a"]],
+            "debuffs": {"ECM": 4},
+        }, {"a": 0, "b": 1, "c": 2})
+        self.assertEqual(weapon.priority_targets, (frozenset([1, 2]), frozenset([0])))
+        self.assertEqual(weapon.debuffs, ship.ShipDebuffs(0, 0, 4, 0))
+
     def test_load_fail_incorrect_priority_target(self):
         test_file_name = "invalidpriority_target.json"
         target_path = join(dirname(__file__), "data", test_file_name)
@@ -0,0 +1,107 @@
+from unittest import TestCase
+from os.path import join, dirname
+import os
+import random
+import tempfile
+
+from idleiss import site_outcomes
+from idleiss.montecarlo import run_samples
+from idleiss.scan import Scanning
+from idleiss.ship import ShipLibrary
+from idleiss.site_outcomes import SiteOutcomeTable
+
+path_to_file = lambda fn: join(dirname(__file__), "data", fn)
+
+SITE = "High Albedo Anomaly"
+
+class SiteOutcomeTableTestCase(TestCase):
+
+    def setUp(self):
+        self.library = ShipLibrary(path_to_file("Ships_Config.json"))
+        self.scanning = Scanning(path_to_file("Scan_Config.json"), self.library)
+        self.attackers = site_outcomes.standard_attackers(self.library, sizes=(2, 5),
+            ship_types=["Standard Fighter", "Standard Corvette"])
+        self.filename = join(tempfile.mkdtemp(), "site_outcomes.json")
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rmdir(dirname(self.filename))
+
+    def build(self, **kw):
+        return SiteOutcomeTable.build(self.scanning, self.library, self.attackers,
+            samples=20, max_rounds=6, seed=1, **dict({"workers": 1}, **kw))
+
+    def test_build(self):
+        table = self.build()
+        # only sites with ships are fought
+        self.assertEqual(list(table.outcomes), [SITE])
+        self.assertEqual(len(table.outcomes[SITE]), len(self.attackers))
+        for attacker in self.attackers:
+            entries = table.lookup(SITE, attacker)
+            self.assertEqual(sum(weight for weight, outcome in entries), 20)
+        self.assertIsNone(table.lookup(SITE, {"Standard Frigate": 2}))
+        self.assertIsNone(table.lookup("Faint Infrared Source", self.attackers[0]))
+
+    def test_matches_simulation(self):
+        table = self.build()
+        # the first fight of the table gets the first seeds
+        seeds = random.Random(1)
+        seeds = [seeds.getrandbits(64) for x in range(20)]
+        results = run_samples(self.attackers[0], {"Standard Fighter": 3}, 6,
+            self.library, seeds)
+        self.assertEqual(table.lookup(SITE, self.attackers[0]),
+            site_outcomes._histogram(results))
+
+    def test_process_pool_matches_single_process(self):
+        self.assertEqual(self.build(workers=2).outcomes, self.build().outcomes)
+
+    def test_save_and_load(self):
+        table = self.build()
+        table.save(self.filename)
+        loaded = SiteOutcomeTable.load(self.filename, table.key)
+        self.assertEqual(loaded.outcomes, table.outcomes)
+        self.assertEqual(loaded.max_rounds, 6)
+        self.assertIsNone(SiteOutcomeTable.load(self.filename, "stale"))
+        self.assertIsNone(SiteOutcomeTable.load(self.filename + ".missing"))
+
+    def test_key_follows_configs_and_settings(self):
+        key = site_outcomes.table_key(self.library, self.scanning, self.attackers,
+            20, 6, 1, "python")
+        self.assertEqual(key, self.build().key)
+        self.assertNotEqual(key, site_outcomes.table_key(self.library, self.scanning,
+            self.attackers, 20, 7, 1, "python"))
+        self.library.fingerprint = "changed"
+        self.assertNotEqual(key, site_outcomes.table_key(self.library, self.scanning,
+            self.attackers, 20, 6, 1, "python"))
+
+    def test_draw(self):
+        table = self.build()
+        attacker = {"Standard Fighter": 2}
+        outcomes = [outcome for weight, outcome in table.lookup(SITE, attacker)]
+        rng = random.Random(0)
+        for _ in range(20):
+            self.assertIn(table.draw(SITE, attacker, rng), outcomes)
+        self.assertIsNone(table.draw(SITE, {"Standard Frigate": 2}, rng))
+
+    def test_results_are_copies(self):
+        table = self.build()
+        attacker = {"Standard Fighter": 2}
+        expected = table.lookup(SITE, attacker)
+        drawn = table.draw(SITE, attacker, random.Random(0))
+        drawn.attacker_result.clear()
+        drawn.defender_result["Standard Fighter"] = 99
+        for weight, outcome in table.lookup(SITE, attacker):
+            outcome.attacker_result.clear()
+        self.assertEqual(table.lookup(SITE, attacker), expected)
+
+    def test_scanning_precomputes_table(self):
+        self.scanning.precompute_outcomes(self.filename, attackers=self.attackers,
+            samples=20, max_rounds=6, seed=1, workers=1)
+        self.assertTrue(os.path.exists(self.filename))
+        self.assertIsNotNone(self.scanning.outcomes.lookup(SITE, {"Standard Corvette": 2}))
+        # a second load reuses the saved file
+        key = self.scanning.outcomes.key
+        reloaded = self.scanning.precompute_outcomes(self.filename, attackers=self.attackers,
+            samples=20, max_rounds=6, seed=1, workers=1)
+        self.assertEqual(reloaded.key, key)
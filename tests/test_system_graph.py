@@ -0,0 +1,121 @@
+from unittest import TestCase
+from os.path import dirname
+from os.path import join
+import os
+import shutil
+import tempfile
+
+import networkx as nx
+import numpy as np
+
+from idleiss.system_graph import SystemGraph
+from idleiss.universe import Universe
+
+path_to_file = lambda fn: join(dirname(__file__), "data", fn)
+
+class SystemGraphTestCase(TestCase):
+
+    def setUp(self):
+        self.universe = Universe(path_to_file("Universe_Config.json"), snapshot=None)
+        self.graph = self.universe.system_graph
+
+    def test_matches_connections(self):
+        self.assertEqual(len(self.graph), len(self.universe.systems))
+        for system in self.universe.systems:
+            self.assertEqual(list(self.graph.adjacent(system.id)),
+                [x.id for x in system.connections])
+            self.assertEqual(list(self.graph.adjacent(system.id, capital=True)),
+                [x.id for x in system.cap_connections])
+
+    def test_flood(self):
+        self.assertTrue(self.graph.flood(0).all())
+        self.assertTrue(self.graph.floodfill(range(len(self.graph))))
+        highsec = [x.id for x in self.universe.systems if x.security == "High"]
+        capital = self.graph.flood(highsec[0], capital=True)
+        self.assertEqual(capital.sum(), 1)
+        nullsec = [x.id for x in self.universe.systems if x.security != "High"]
+        self.assertTrue(self.graph.floodfill(nullsec, capital=True))
+        self.assertFalse(self.graph.floodfill(highsec, capital=True))
+
+    def test_route(self):
+        systems = self.universe.systems
+        graph = self.universe.networkx_graph
+        for source, destination in ((0, 1), (0, len(systems) - 1), (17, 4000), (3, 3)):
+            route = self.graph.route(source, destination)
+            self.assertEqual(route[0], source)
+            self.assertEqual(route[-1], destination)
+            for a, b in zip(route, route[1:]):
+                self.assertIn(systems[b], systems[a].connections)
+            self.assertEqual(len(route) - 1, nx.shortest_path_length(graph,
+                systems[source].name, systems[destination].name))
+        highsec = [x.id for x in systems if x.security == "High"]
+        self.assertIsNone(self.graph.route(highsec[0], highsec[1], capital=True))
+
+    def temp_file(self, name):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return join(directory, name)
+
+    def test_jump_distances(self):
+        distances = self.graph.jump_distances(42)
+        expected = nx.single_source_shortest_path_length(self.universe.networkx_graph,
+            self.universe.systems[42].name)
+        for system in self.universe.systems:
+            self.assertEqual(distances[system.id], expected[system.name])
+
+    def test_save_load(self):
+        filename = self.temp_file("systems.npy")
+        self.graph.save(filename)
+        loaded = SystemGraph.load(filename)
+        self.assertIsInstance(loaded.neighbors.base, np.memmap)
+        self.assertFalse(loaded.neighbors.flags.writeable)
+        for name in ("offsets", "neighbors", "cap_offsets", "cap_neighbors"):
+            self.assertTrue(np.array_equal(getattr(loaded, name), getattr(self.graph, name)))
+        self.assertEqual(loaded.route(0, 4000), self.graph.route(0, 4000))
+
+    def test_load_rejects_other_arrays(self):
+        filename = self.temp_file("other.npy")
+        np.save(filename, np.arange(10, dtype=np.int32))
+        self.assertRaises(ValueError, SystemGraph.load, filename)
+
+    def test_universe_floods_on_graph(self):
+        universe = self.universe
+        highsec = [x for x in universe.systems if x.security == "High"]
+        nullsec = [x for x in universe.systems if x.security != "High"]
+        for use_graph in (True, False):
+            universe.system_graph = self.graph if use_graph else None
+            self.assertTrue(universe.floodfill(universe.systems))
+            self.assertTrue(universe.cap_floodfill(nullsec))
+            self.assertFalse(universe.cap_floodfill(highsec))
+            universe.drain()
+            universe.cap_flood(highsec[0])
+            flooded = [universe.cap_flooded(x) for x in universe.systems]
+            if use_graph:
+                expected = flooded
+            else:
+                self.assertEqual(flooded, expected)
+        self.assertEqual(sum(expected), 1)
+
+    def test_universe_route(self):
+        systems = self.universe.systems
+        route = self.universe.route(systems[17], systems[4000])
+        self.assertEqual([x.id for x in route], self.graph.route(17, 4000))
+        self.assertIs(route[0], systems[17])
+        highsec = [x for x in systems if x.security == "High"]
+        self.assertIsNone(self.universe.route(highsec[0], highsec[1], capital=True))
+
+    def test_snapshot_maps_graph(self):
+        snapshot = self.temp_file("universe.snapshot")
+        config = path_to_file("Universe_Config.json")
+        generated = Universe(config, snapshot)
+        self.assertTrue(os.path.exists(snapshot + ".npy"))
+        loaded = Universe(config, snapshot)
+        self.assertIsInstance(loaded.system_graph.neighbors.base, np.memmap)
+        self.assertEqual(loaded.route(loaded.systems[0], loaded.systems[4000]),
+            [loaded.systems[x] for x in generated.system_graph.route(0, 4000)])
+        # a graph that does not fit the snapshot is rebuilt
+        np.save(snapshot + ".npy", np.arange(10, dtype=np.int32))
+        rebuilt = Universe(config, snapshot)
+        self.assertFalse(isinstance(rebuilt.system_graph.neighbors.base, np.memmap))
+        self.assertTrue(np.array_equal(rebuilt.system_graph.neighbors,
+            generated.system_graph.neighbors))
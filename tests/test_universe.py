@@ -1,9 +1,23 @@
 from unittest import TestCase
 import networkx as nx
 import matplotlib.pyplot as plt
+from os.path import dirname
+from os.path import join
+from random import Random
+import json
+import os
 import pytest
+import shutil
+import tempfile
 
+from idleiss import universe
+from idleiss.universe import DisjointSet
+from idleiss.universe import SolarSystem
 from idleiss.universe import Universe
+from idleiss.universe import _OrderedSubset
+from idleiss.universe import snapshot_key
+
+path_to_file = lambda fn: join(dirname(__file__), "data", fn)
 
 def draw_graph(graph):
     nx.draw_networkx(graph, pos=nx.spring_layout(graph), with_labels=True)
@@ -26,6 +40,179 @@ def save_graph(graph, universe, name_of_file):
     plt.savefig(name_of_file, bbox_inches="tight")
     plt.close()
 
+def floodfill_stitch(rand, node_list):
+    # the stitch_nodes algorithm before union-find, as a reference
+    def reachable():
+        seen = [node_list[0]]
+        for node in seen:
+            seen.extend(x for x in node.connections if x not in seen)
+        return seen
+    if len(node_list[0].connections) == 0:
+        node_list[0].add_connection(rand.choice(node_list[1:]))
+    while True:
+        seen = reachable()
+        if all(x in seen for x in node_list):
+            return
+        orphan_nodes = [x for x in node_list if len(x.connections) == 0]
+        valid_nodes = [x for x in node_list if x in seen]
+        disjoint_nodes = [x for x in node_list
+            if x not in seen and len(x.connections) != 0]
+        if disjoint_nodes:
+            disjoint_nodes[0].add_connection(rand.choice(valid_nodes))
+            continue
+        for x in range(len(orphan_nodes)):
+            orphan_nodes[x].add_connection(rand.choice(valid_nodes + orphan_nodes[:x]))
+
+class StitchTestCase(TestCase):
+
+    def setUp(self):
+        self.universe = Universe(path_to_file("Small_Universe_Config.json"), snapshot=None)
+
+    def make_systems(self, count, seed, edges):
+        rand = Random(seed)
+        systems = [SolarSystem(rand, self.universe, "Null",
+                self.universe.generate_unused_nullsec_name(), None, None)
+            for x in range(count)]
+        for x in range(edges):
+            a, b = rand.sample(systems, 2)
+            a.add_connection(b)
+        return systems
+
+    def edges(self, systems):
+        position = {system: x for x, system in enumerate(systems)}
+        return [[position[x] for x in system.connections] for system in systems]
+
+    def test_disjoint_set(self):
+        components = DisjointSet(range(6))
+        components.union(0, 1)
+        components.union(2, 3)
+        components.union(1, 3)
+        self.assertIs(components.find(0), components.find(2))
+        self.assertIsNot(components.find(0), components.find(4))
+        self.assertNotIn(6, components)
+        components.add(6)
+        components.union(6, 5)
+        self.assertIs(components.find(5), components.find(6))
+
+    def test_ordered_subset(self):
+        items = list("abcdefghij")
+        subset = _OrderedSubset(items)
+        for position in (7, 2, 9, 0):
+            subset.add(position)
+        subset.extra.append("z")
+        self.assertEqual(len(subset), 5)
+        self.assertEqual([subset[k] for k in range(5)], ["a", "c", "h", "j", "z"])
+
+    def test_floodfill_deeper_than_recursion_limit(self):
+        systems = self.make_systems(3000, 0, 0)
+        for a, b in zip(systems, systems[1:]):
+            a.add_connection(b)
+        self.assertTrue(self.universe.floodfill(systems))
+        self.assertTrue(self.universe.flooded(systems[-1]))
+        self.universe.drain(systems)
+        self.assertFalse(self.universe.flooded(systems[-1]))
+        systems[1500].connections.remove(systems[1501])
+        self.assertFalse(self.universe.floodfill(systems))
+        self.assertTrue(self.universe.flooded(systems[1500]))
+        self.assertFalse(self.universe.flooded(systems[1501]))
+
+    def test_nullsec_names_match_one_at_a_time(self):
+        self.universe.rand = Random(3)
+        names = self.universe.generate_unused_nullsec_names(500)
+        self.assertEqual(len(set(names)), 500)
+        self.assertFalse(any(self.universe.name_exists(name) for name in names))
+        self.universe.rand = Random(3)
+        expected = []
+        for x in range(500):
+            expected.append(self.universe.generate_unused_nullsec_name())
+            self.universe.register_name(expected[-1])
+        self.assertEqual(names, expected)
+
+    def test_stitch_connects_orphans(self):
+        systems = self.make_systems(40, 0, 0)
+        self.universe.stitch_nodes(systems)
+        graph = self.universe.generate_networkx(systems)
+        self.assertTrue(nx.is_connected(graph))
+        self.assertEqual(graph.number_of_edges(), len(systems) - 1)
+
+    def test_stitch_matches_floodfill(self):
+        for seed in range(20):
+            expected = self.make_systems(30, seed, seed)
+            floodfill_stitch(Random(seed), expected)
+            systems = self.make_systems(30, seed, seed)
+            self.universe.rand = Random(seed)
+            self.universe.stitch_nodes(systems)
+            self.assertEqual(self.edges(systems), self.edges(expected))
+            self.assertTrue(nx.is_connected(self.universe.generate_networkx(systems)))
+
+def topology(universe):
+    names = lambda nodes: [x.name for x in nodes]
+    return {
+        "rand": universe.rand.getstate(),
+        "regions": [(x.name, x.id, x.security, names(x.constellations),
+            names(x.connections), names(x.cap_connections)) for x in universe.regions],
+        "constellations": [(x.name, x.id, x.security, x.region, names(x.systems),
+            names(x.connections), names(x.cap_connections)) for x in universe.constellations],
+        "systems": [(x.name, x.id, x.security, x.constellation, x.region, x.bordertype,
+            names(x.connections), names(x.cap_connections)) for x in universe.systems],
+        "highsec": names(universe.highsec_regions),
+        "lowsec": names(universe.lowsec_regions),
+        "nullsec": names(universe.nullsec_regions),
+        "used_names": universe.used_names,
+        "master_dict": sorted(universe.master_dict),
+        "debug_output": universe.debug_output,
+        "ids": (universe.current_unused_system_id,
+            universe.current_unused_constellation_id,
+            universe.current_unused_region_id),
+    }
+
+class SnapshotTestCase(TestCase):
+
+    def setUp(self):
+        self.config = path_to_file("Universe_Config.json")
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.snapshot = join(directory, "universe.snapshot")
+
+    def test_snapshot_matches_generated(self):
+        generated = Universe(self.config, self.snapshot)
+        self.assertTrue(os.path.exists(self.snapshot))
+        loaded = Universe(self.config, self.snapshot)
+        self.assertEqual(topology(loaded), topology(generated))
+        self.assertEqual(topology(Universe(self.config, None)), topology(generated))
+        self.assertTrue(nx.is_connected(loaded.networkx_graph))
+        self.assertEqual(loaded.rand.random(), generated.rand.random())
+
+    def test_snapshot_is_opt_in(self):
+        config = join(dirname(self.snapshot), "universe.json")
+        shutil.copy(self.config, config)
+        Universe(config)
+        self.assertEqual(os.listdir(dirname(config)), ["universe.json"])
+        Universe(config, snapshot=True)
+        self.assertTrue(os.path.exists(config + ".snapshot"))
+
+    def test_snapshot_key_covers_modules(self):
+        with open(self.config) as fd:
+            raw_data = json.load(fd)
+        self.assertIn("system_graph.py", universe.SNAPSHOT_MODULES)
+        self.assertIn("scan.py", universe.SNAPSHOT_MODULES)
+        key = snapshot_key(raw_data)
+        modules = universe.SNAPSHOT_MODULES
+        universe.SNAPSHOT_MODULES = ("universe.py",)
+        self.addCleanup(setattr, universe, "SNAPSHOT_MODULES", modules)
+        self.assertNotEqual(snapshot_key(raw_data), key)
+
+    def test_snapshot_key_mismatch_regenerates(self):
+        universe = Universe(self.config, self.snapshot)
+        with open(self.config) as fd:
+            raw_data = json.load(fd)
+        self.assertTrue(Universe().load_snapshot(self.snapshot, snapshot_key(raw_data), raw_data))
+        raw_data["Universe Seed"] += 1
+        self.assertFalse(Universe().load_snapshot(self.snapshot, snapshot_key(raw_data), raw_data))
+        with open(self.snapshot, "w") as fd:
+            fd.write("{")
+        self.assertEqual(topology(Universe(self.config, self.snapshot)), topology(universe))
+
 class UserTestCase(TestCase):
 
     def setUp(self):
@@ -33,7 +220,7 @@ class UserTestCase(TestCase):
 
     @pytest.mark.slow
     def test_load_universe_config(self):
-        uni = Universe("config/Universe_Config.json")
+        uni = Universe("config/Universe_Config.json", snapshot=None)
         graph = uni.generate_networkx(uni.systems)
         self.assertEqual(graph.number_of_nodes(), 5100)
         self.assertTrue(nx.is_connected(graph))
@@ -51,8 +238,8 @@ class UserTestCase(TestCase):
 
     @pytest.mark.slow
     def test_consistent_generation(self):
-        uni1 = Universe("config/Universe_Config.json")
-        uni2 = Universe("config/Universe_Config.json")
+        uni1 = Universe("config/Universe_Config.json", snapshot=None)
+        uni2 = Universe("config/Universe_Config.json", snapshot=None)
         g1 = uni1.generate_networkx(uni1.systems)
         g2 = uni2.generate_networkx(uni2.systems)
         d1 = nx.symmetric_difference(g1, g2)
@@ -64,7 +251,7 @@ class UserTestCase(TestCase):
 
     @pytest.mark.slow
     def test_highsec_is_connected(self):
-        uni = Universe("config/Universe_Config.json")
+        uni = Universe("config/Universe_Config.json", snapshot=None)
         highsec_regions_only = [r for r in uni.regions if r.security == "High"]
         self.assertGreater(len(highsec_regions_only), 0)
         highsec_systems_only = []